@@ -1,13 +1,21 @@
 from langchain_core.tools import BaseTool, ToolException
-from typing import Type, Any, Dict, Union # Added Dict, Union, ToolException
+from typing import Type, Any, Dict, Optional, Tuple, Union # Added Dict, Union, ToolException
 from pydantic import BaseModel, Field, ConfigDict, ValidationError # Added ValidationError
 from sqlalchemy import text
+import asyncio
 import json 
+import time
 
-from .utils.text_to_sql_utils import generate_sql_from_text_sync
-from .utils.db_utils import get_limited_db_schema_string
+from .utils.text_to_sql_utils import generate_sql_from_text_sync, generate_sql_from_text_async
+from .utils.db_utils import get_limited_db_schema_string, SchemaRegistry
+from .utils.semantic_cache import SemanticAnswerCache, CachedAnswer
+from .utils.sql_cache import TextToSQLCache
+from .utils.sql_guard import SQLGuard, counted_sql
+from .utils.cost_guard import QueryCostGuard, CostDecision
+from .utils.result_summary import ResultSummarizer
+from .utils.analytics_mirror import AnalyticsMirror
 from .logger_config import logger
-from .config import ROLES_PERMISSIONS 
+from .config import ROLES_PERMISSIONS, SQL_RESULT_DISPLAY_ROWS, SQL_RESULT_SUMMARY_ROWS
 
 # --- Document QA Tool Input Schema ---
 class DocumentSearchInput(BaseModel):
@@ -28,8 +36,9 @@ class DocumentQATool(BaseTool):
     args_schema: Type[BaseModel] = DocumentSearchInput
     
     qa_chain: Any
+    answer_cache: Optional[SemanticAnswerCache] = None
 
-    def _parse_input(self, tool_input: Union[str, Dict]) -> Dict[str, Any]:
+    def _parse_input(self, tool_input: Union[str, Dict], tool_call_id: Optional[str] = None) -> Dict[str, Any]:
         """Override to ensure JSON string is parsed correctly for multi-argument schema."""
         if isinstance(tool_input, str):
             try:
@@ -52,45 +61,91 @@ class DocumentQATool(BaseTool):
             f"but expects a JSON string or a dict."
         )
 
-    def _run(self, query: str, user_role: str, user_region: str) -> str:
-        logger.debug(f"DocumentQATool executing with query: {query}, role: {user_role}, region: {user_region}")
+    def _prepare_query(self, query: str, user_role: str, user_region: str):
+        """Returns (effective query, answer-cache partition), or (error message, None) if the call is not allowed."""
         if not self.qa_chain:
             logger.error("DocumentQATool: QA chain not available on self.")
-            return "Error: Document QA chain not properly initialized on tool."
+            return "Error: Document QA chain not properly initialized on tool.", None
 
         if user_role not in ROLES_PERMISSIONS:
-            return f"Error: Unauthorized access due to invalid role '{user_role}' for DocumentPolicySearch."
+            return f"Error: Unauthorized access due to invalid role '{user_role}' for DocumentPolicySearch.", None
 
         role_permissions_config = ROLES_PERMISSIONS[user_role]
+        effective_query = query
+        augmented_region = None
+        if user_region != "Global" and not role_permissions_config.get("global_access", False):
+            effective_query = f"{query} (related to {user_region})"
+            augmented_region = user_region
+            logger.info(f"DocumentQATool: Query augmented for region: {user_region}")
+
+        # Answers are only shared between callers whose query is augmented the same way.
+        return effective_query, (user_role, augmented_region or "*")
+
+    @staticmethod
+    def _unpack_result(result: Dict[str, Any]):
+        answer = result.get("result", "No answer found in documents.")
+        sources = result.get("source_documents", [])
+
+        # Simplified source filtering for brevity
+        source_names = sorted(list(set([doc.metadata.get("source", "Unknown") for doc in sources])))
+        return answer, source_names
+
+    def _run(self, query: str, user_role: str, user_region: str) -> str:
+        logger.debug(f"DocumentQATool executing with query: {query}, role: {user_role}, region: {user_region}")
+        effective_query, cache_partition = self._prepare_query(query, user_role, user_region)
+        if cache_partition is None:
+            return effective_query
         try:
-            effective_query = query
-            if user_region != "Global" and not role_permissions_config.get("global_access", False):
-                effective_query = f"{query} (related to {user_region})"
-                logger.info(f"DocumentQATool: Query augmented for region: {user_region}")
+            query_vector = None
+            if self.answer_cache is not None:
+                cached, query_vector = self.answer_cache.lookup(cache_partition, query)
+                if cached is not None:
+                    return self._format_answer(cached.answer, cached.source_names)
 
             logger.info(f"DocumentQATool effective query: {effective_query}")
             result = self.qa_chain.invoke({"query": effective_query}) # QA chain expects a dict
-            answer = result.get("result", "No answer found in documents.")
-            sources = result.get("source_documents", [])
-            
-            # Simplified source filtering for brevity
-            source_names = sorted(list(set([doc.metadata.get("source", "Unknown") for doc in sources])))
+            answer, source_names = self._unpack_result(result)
 
-            if not answer or answer == "No answer found in documents.":
-                 if source_names:
-                     return f"I found relevant information in the following documents: {', '.join(source_names)}, but could not extract a direct answer. Please review them."
-                 return "I searched the available documents but could not find an answer."
-
-            if source_names:
-                return f"Answer from documents: {answer}\nSources: {', '.join(source_names)}"
-            return f"Answer from documents: {answer}"
+            if self.answer_cache is not None and answer and answer != "No answer found in documents.":
+                self.answer_cache.store(cache_partition, query, CachedAnswer(answer, source_names), query_vector)
+            return self._format_answer(answer, source_names)
         except Exception as e:
             logger.error(f"Error during document search: {e}", exc_info=True)
             return f"Error: An issue occurred during document search: {str(e)}"
 
+    @staticmethod
+    def _format_answer(answer: str, source_names: list) -> str:
+        if not answer or answer == "No answer found in documents.":
+             if source_names:
+                 return f"I found relevant information in the following documents: {', '.join(source_names)}, but could not extract a direct answer. Please review them."
+             return "I searched the available documents but could not find an answer."
+
+        if source_names:
+            return f"Answer from documents: {answer}\nSources: {', '.join(source_names)}"
+        return f"Answer from documents: {answer}"
+
     async def _arun(self, query: str, user_role: str, user_region: str) -> str:
         logger.debug(f"DocumentQATool (async) executing with query: {query}, role: {user_role}, region: {user_region}")
-        return self._run(query, user_role, user_region)
+        effective_query, cache_partition = self._prepare_query(query, user_role, user_region)
+        if cache_partition is None:
+            return effective_query
+        try:
+            query_vector = None
+            if self.answer_cache is not None:
+                cached, query_vector = await self.answer_cache.alookup(cache_partition, query)
+                if cached is not None:
+                    return self._format_answer(cached.answer, cached.source_names)
+
+            logger.info(f"DocumentQATool (async) effective query: {effective_query}")
+            result = await self.qa_chain.ainvoke({"query": effective_query})
+            answer, source_names = self._unpack_result(result)
+
+            if self.answer_cache is not None and answer and answer != "No answer found in documents.":
+                await self.answer_cache.astore(cache_partition, query, CachedAnswer(answer, source_names), query_vector)
+            return self._format_answer(answer, source_names)
+        except Exception as e:
+            logger.error(f"Error during async document search: {e}", exc_info=True)
+            return f"Error: An issue occurred during document search: {str(e)}"
 
 
 # --- SQL Database Query Tool Input Schema ---
@@ -100,6 +155,12 @@ class DatabaseQueryInput(BaseModel):
     user_region: str = Field(description="The region the user is authorized to access. This helps in context but RLS enforces permissions.")
     jwt_claims_for_db: str = Field(description="The JSON string of JWT claims for setting DB session context for RLS.")
 
+# RLS context in one round trip: SET LOCAL ROLE authenticated, the JWT claims and (with the cost guard) the
+# statement_timeout, all transaction-local. The claims are a bind parameter, so the statement text never changes.
+RLS_SETUP_SQL = text("SELECT set_config('role', 'authenticated', true), set_config('request.jwt.claims', :jwt_claims, true)")
+RLS_SETUP_WITH_TIMEOUT_SQL = text("SELECT set_config('role', 'authenticated', true), set_config('request.jwt.claims', :jwt_claims, true), "
+                                  "set_config('statement_timeout', :statement_timeout, true)")
+
 # --- SQL Database Query Tool ---
 class CustomSQLTool(BaseTool):
     model_config = ConfigDict(arbitrary_types_allowed=True)
@@ -115,8 +176,16 @@ class CustomSQLTool(BaseTool):
     
     db_engine: Any
     llm: Any 
+    async_db_engine: Any = None
+    sql_cache: Optional[TextToSQLCache] = None
+    schema_registry: Optional[SchemaRegistry] = None
+    sql_guard: SQLGuard = Field(default_factory=SQLGuard)  # read-only check, column allowlist and region filter
+    cost_guard: Optional[QueryCostGuard] = None  # EXPLAIN budget, automatic LIMIT and statement_timeout per role
+    display_rows: int = SQL_RESULT_DISPLAY_ROWS  # rows shown in the observation
+    summary_rows: int = SQL_RESULT_SUMMARY_ROWS  # rows read for the column summaries
+    analytics_mirror: Optional[AnalyticsMirror] = None  # local DuckDB copy that serves aggregate queries
 
-    def _parse_input(self, tool_input: Union[str, Dict]) -> Dict[str, Any]:
+    def _parse_input(self, tool_input: Union[str, Dict], tool_call_id: Optional[str] = None) -> Dict[str, Any]:
         """Override to ensure JSON string is parsed correctly for multi-argument schema."""
         if isinstance(tool_input, str):
             try:
@@ -138,133 +207,252 @@ class CustomSQLTool(BaseTool):
             f"but expects a JSON string or a dict."
         )
 
-    def _run(self, natural_language_query: str, user_role: str, user_region: str, jwt_claims_for_db: str) -> str:
-        logger.debug(f"CustomSQLTool executing with NLQ: '{natural_language_query}', role: {user_role}, region: {user_region}")
-        
-        if not self.db_engine or not self.llm:
+    def _check_ready(self, user_role: str, db_engine: Any) -> Optional[str]:
+        if not db_engine or not self.llm:
             logger.error("CustomSQLTool: Database engine or LLM not available on self.")
             return "Error: Database engine or LLM for SQL tool not properly initialized."
 
         if user_role not in ROLES_PERMISSIONS:
             logger.warning(f"CustomSQLTool: Role '{user_role}' not found in ROLES_PERMISSIONS.")
             return f"Error: Unauthorized. Role '{user_role}' not configured for database access."
+        return None
+
+    def _cached_sql(self, natural_language_query: str, user_role: str, schema_str: str):
+        """Returns (cache key or None, cached LLM SQL or None)."""
+        if self.sql_cache is None:
+            return None, None
+        relevant_tables = ROLES_PERMISSIONS[user_role].get("allowed_tables", ["supply_chain"])
+        sql_cache_key = TextToSQLCache.make_key(
+            natural_language_query, relevant_tables, ROLES_PERMISSIONS[user_role].get("allowed_columns", []), schema_str
+        )
+        cached_sql = self.sql_cache.get(sql_cache_key)
+        if cached_sql is not None:
+            logger.info(f"CustomSQLTool: reusing cached SQL for '{natural_language_query}': {cached_sql}")
+        return sql_cache_key, cached_sql
+
+    def _guarded_sql(self, sql_query_generated_by_llm: str, user_role: str, user_region: str):
+        """SQLGuard's rewrite, with the role's automatic LIMIT when the cost guard is on."""
+        row_limit = self.cost_guard.budget(user_role).row_limit if self.cost_guard is not None else None
+        return self.sql_guard.rewrite(sql_query_generated_by_llm, user_role, user_region, row_limit=row_limit)
+
+    def _session_setup(self, jwt_claims_for_db: str, user_role: str) -> Tuple[Any, Dict[str, str]]:
+        """The RLS setup statement and its bind parameters; runs first in the query's transaction."""
+        timeout_ms = self.cost_guard.statement_timeout_ms(user_role) if self.cost_guard is not None else 0
+        if timeout_ms > 0:
+            return RLS_SETUP_WITH_TIMEOUT_SQL, {"jwt_claims": jwt_claims_for_db, "statement_timeout": str(timeout_ms)}
+        return RLS_SETUP_SQL, {"jwt_claims": jwt_claims_for_db}
+
+    def _summarizer(self, result: Any) -> ResultSummarizer:
+        return ResultSummarizer(list(result.keys()), display_limit=self.display_rows, scan_limit=self.summary_rows)
+
+    @staticmethod
+    def _render(summarizer: ResultSummarizer, decision: Optional[CostDecision]) -> str:
+        return summarizer.render(row_limit=decision.row_limit if decision is not None and decision.limited else None)
+
+    def _read_result(self, result: Any, decision: Optional[CostDecision]) -> str:
+        """Fetches from the server-side cursor only the rows the observation and its summaries need."""
+        summarizer = self._summarizer(result)
+        try:
+            while True:
+                batch_size = summarizer.next_batch_size()
+                if not batch_size:
+                    break
+                summarizer.add(result.fetchmany(batch_size))
+        finally:
+            result.close()
+        return self._render(summarizer, decision)
+
+    async def _aread_result(self, result: Any, decision: Optional[CostDecision]) -> str:
+        summarizer = self._summarizer(result)
+        try:
+            while True:
+                batch_size = summarizer.next_batch_size()
+                if not batch_size:
+                    break
+                summarizer.add(await result.fetchmany(batch_size))
+        finally:
+            await result.close()
+        return self._render(summarizer, decision)
+
+    def _query_mirror(self, sql: str, params: Dict[str, Any], user_role: str) -> Optional[str]:
+        """
+        Runs guarded aggregate SQL on the analytics mirror; None if it is off or not enabled for the role, the SQL
+        is not an aggregate, or DuckDB fails.
+        """
+        if self.analytics_mirror is None:
+            return None
+        if not self.analytics_mirror.serves(user_role):
+            self.analytics_mirror.record("role_not_enabled")
+            return None
+        mirror_sql = self.analytics_mirror.route(sql)
+        if mirror_sql is None:
+            self.analytics_mirror.record("not_aggregate")
+            return None
+        timeout_ms = self.cost_guard.statement_timeout_ms(user_role) if self.cost_guard is not None else 0
+        start = time.perf_counter()
+        try:
+            observation = self._read_result(self.analytics_mirror.execute(mirror_sql, params, timeout_ms), None)
+        except Exception as e:
+            self.analytics_mirror.record("errors")
+            logger.warning(f"AnalyticsMirror failed, running the query on Postgres instead: {e}. SQL: {mirror_sql}")
+            return None
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.analytics_mirror.record("served", elapsed_ms)
+        logger.info(f"Aggregate served by the analytics mirror in {elapsed_ms:.1f} ms: {mirror_sql}")
+        return observation
+
+    def _handle_error(self, e: Exception, natural_language_query: str, sql_query_generated: str,
+                      sql_cache_key: Optional[str], sql_from_cache: bool) -> str:
+        if isinstance(e, ValueError):
+            logger.error(f"ValueError in CustomSQLTool: {e}. NLQ: '{natural_language_query}', SQL: '{sql_query_generated}'")
+            return f"Error processing database query: {e}."
+        if sql_from_cache:
+            logger.warning("CustomSQLTool: cached SQL failed to execute; removing it from the cache.")
+            self.sql_cache.discard(sql_cache_key)
+        msg = str(e).lower()
+        logger.error(f"Error in CustomSQLTool: {e}. NLQ: '{natural_language_query}', SQL: '{sql_query_generated}'", exc_info=True)
+        if "permission denied" in msg or "policy" in msg:
+            return f"Error: Access denied for this database operation or data. ({e})"
+        if "syntax error" in msg or "does not exist" in msg:
+             return f"Error: Generated SQL had an issue. Rephrase or contact support. (SQL Error: {e})"
+        if "statement timeout" in msg:
+            return "Error: The database query took too long and was cancelled. Aggregate or filter more narrowly."
+        return f"Error executing database query: {e}"
+
+    def _run(self, natural_language_query: str, user_role: str, user_region: str, jwt_claims_for_db: str) -> str:
+        logger.debug(f"CustomSQLTool executing with NLQ: '{natural_language_query}', role: {user_role}, region: {user_region}")
+        not_ready = self._check_ready(user_role, self.db_engine)
+        if not_ready:
+            return not_ready
 
         sql_query_generated = "N/A"
+        sql_cache_key = None
+        sql_from_cache = False
         try:
             relevant_tables = ROLES_PERMISSIONS[user_role].get("allowed_tables", ["supply_chain"])
-            schema_str = get_limited_db_schema_string(self.db_engine, relevant_tables=relevant_tables)
+            if self.schema_registry is not None:
+                schema_str = self.schema_registry.get_schema_string(user_role)
+            else:
+                schema_str = get_limited_db_schema_string(self.db_engine, relevant_tables=relevant_tables)
             
             if not schema_str or "not found" in schema_str.lower():
                 logger.error(f"CustomSQLTool: Failed to get schema for {relevant_tables}. Schema: {schema_str}")
                 return "Error: Could not get database schema to construct SQL query."
 
-            # Generate initial SQL from LLM
-            sql_query_generated_by_llm = generate_sql_from_text_sync(natural_language_query, schema_str, self.llm)
-            logger.info(f"CustomSQLTool initial LLM SQL: {sql_query_generated_by_llm}")
-            
-            final_sql_to_execute = sql_query_generated_by_llm
-            params = {}  # For parameterized queries
-            
-            # Check if user is Global Operations Manager
-            is_gom = (user_role.lower() == "global operations manager")
-            
-            if not sql_query_generated_by_llm.strip().upper().startswith("SELECT"):
-                logger.warning(f"Generated query is not SELECT: '{sql_query_generated_by_llm}'. Blocking.")
-                return "Error: Generated query was not SELECT. Only data retrieval is supported."
-
-            # Apply regional filtering for non-GOM users
-            if not is_gom and user_region:
-                logger.info(f"Applying regional filter for role '{user_role}' and region '{user_region}'")
-                
-                # Define the regional filter clause using parameterized query
-                region_filter_clause = "LOWER(order_country) = LOWER(:user_region_param)"
-                params['user_region_param'] = user_region
-                
-                # Process the SQL to inject WHERE clause
-                processed_query = final_sql_to_execute.rstrip().removesuffix(';')
-                
-                if " where " in processed_query.lower():
-                    # WHERE clause already exists, add AND condition
-                    final_sql_to_execute = f"{processed_query} AND ({region_filter_clause})"
-                else:
-                    # No WHERE clause exists, need to add one
-                    # Find the position to insert WHERE (before GROUP BY, ORDER BY, LIMIT, etc.)
-                    end_of_select_from = len(processed_query)
-                    clause_keywords = [" group by", " order by", " limit", " having", " union", " intersect", " except"]
-                    
-                    for clause_keyword in clause_keywords:
-                        idx = processed_query.lower().find(clause_keyword)
-                        if idx != -1:
-                            end_of_select_from = min(end_of_select_from, idx)
-                    
-                    if end_of_select_from < len(processed_query):
-                        # Found a subsequent clause, insert WHERE before it
-                        final_sql_to_execute = f"{processed_query[:end_of_select_from]} WHERE ({region_filter_clause}) {processed_query[end_of_select_from:]}"
-                    else:
-                        # No other major clauses found after FROM, append WHERE at the end
-                        final_sql_to_execute = f"{processed_query} WHERE ({region_filter_clause})"
-                
-                # Add semicolon back if needed
-                final_sql_to_execute += ";"
-                logger.info(f"SQL after app-level regional filter: {final_sql_to_execute} with params: {params}")
-            else:
-                logger.info(f"GOM or no region specified, executing LLM SQL directly: {final_sql_to_execute}")
+            sql_cache_key, sql_query_generated_by_llm = self._cached_sql(natural_language_query, user_role, schema_str)
+            sql_from_cache = sql_query_generated_by_llm is not None
+            if sql_query_generated_by_llm is None:
+                # Generate initial SQL from LLM
+                sql_query_generated_by_llm = generate_sql_from_text_sync(natural_language_query, schema_str, self.llm)
+                logger.info(f"CustomSQLTool initial LLM SQL: {sql_query_generated_by_llm}")
 
+            sql_query_generated = sql_query_generated_by_llm
+            # Raises SQLGuardError (a ValueError) for anything but a read-only query over the role's columns
+            final_sql_to_execute, params = self._guarded_sql(sql_query_generated_by_llm, user_role, user_region)
+            logger.info(f"SQL after SQLGuard: {final_sql_to_execute} with params: {params}")
             # Store the final SQL for error reporting
             sql_query_generated = final_sql_to_execute
 
-            with self.db_engine.connect() as connection:
+            observation = self._query_mirror(final_sql_to_execute, params, user_role)
+            if observation is not None:
+                if sql_cache_key is not None and not sql_from_cache:
+                    self.sql_cache.put(sql_cache_key, natural_language_query, sql_query_generated_by_llm)
+                return observation
+
+            # One explicit transaction: the transaction-local RLS settings, EXPLAIN and the query
+            with self.db_engine.connect() as connection, connection.begin():
                 try:
-                    # Set up database context (keeping original RLS setup for compatibility)
-                    connection.execute(text("SET LOCAL ROLE authenticated;"))
-                    escaped_jwt_claims = jwt_claims_for_db.replace("'", "''")
-                    
-                    connection.execute(text(f"SELECT set_config('request.jwt.claims', '{escaped_jwt_claims}', true);"))
-                    connection.execute(text("SET LOCAL ROLE authenticated;"))
-                    
-                    logger.info(f"Set JWT claims, then RLS context set for user_role: {user_role}, region: {user_region}. Claims content: {escaped_jwt_claims[:100]}...")
+                    connection.execute(*self._session_setup(jwt_claims_for_db, user_role))
+                    logger.info(f"RLS context set for user_role: {user_role}, region: {user_region}. Claims content: {jwt_claims_for_db[:100]}...")
                 except Exception as e_rls:
                     logger.error(f"CRITICAL: Failed to set RLS context: {e_rls}", exc_info=True)
                     return f"Error: Security context for DB query failed: {e_rls}"
 
-                # Execute query with parameters if any were added
-                if params:
-                    result_proxy = connection.execute(text(final_sql_to_execute), params)
-                else:
-                    result_proxy = connection.execute(text(final_sql_to_execute))
-                
-                if result_proxy.returns_rows:
-                    results = result_proxy.fetchall()
-                    if not results:
-                        return "Query executed, but no data found matching your question and permissions."
-
-                    column_names = list(result_proxy.keys())
-                    answer_data = [dict(zip(column_names, map(str, row))) for row in results]
-                    
-                    num_rows = len(answer_data)
-                    display_limit = 5 
-                    displayed_data = answer_data[:display_limit]
-                    
-                    summary = f"Query found {num_rows} record(s). "
-                    summary += f"Showing first {display_limit if num_rows > display_limit else num_rows}: "
-                    
-                    return f"Database query result: {summary}{json.dumps(displayed_data, indent=2)}"
-                else:
-                    # DML statements
-                    return f"Database modification query executed. Rows affected: {result_proxy.rowcount}"
-
-        except ValueError as ve: 
-            logger.error(f"ValueError in CustomSQLTool: {ve}. NLQ: '{natural_language_query}', SQL: '{sql_query_generated}'")
-            return f"Error processing database query: {ve}."
+                decision = None
+                if self.cost_guard is not None:
+                    # EXPLAIN under the RLS context; raises QueryBudgetError (a ValueError) when over the role's budget
+                    decision = self.cost_guard.admit(connection, final_sql_to_execute, params, user_role)
+                    final_sql_to_execute = sql_query_generated = decision.sql
+                # Server-side cursor: rows stay on the server until fetched; COUNT(*) OVER () gives the total
+                result = connection.execute(text(counted_sql(final_sql_to_execute)).execution_options(stream_results=True), params)
+                observation = self._read_result(result, decision)
+
+                if sql_cache_key is not None and not sql_from_cache:
+                    # Only SQL that executed without error is cached.
+                    self.sql_cache.put(sql_cache_key, natural_language_query, sql_query_generated_by_llm)
+                return observation
+
         except Exception as e: 
-            msg = str(e).lower()
-            logger.error(f"Error in CustomSQLTool: {e}. NLQ: '{natural_language_query}', SQL: '{sql_query_generated}'", exc_info=True)
-            if "permission denied" in msg or "policy" in msg:
-                return f"Error: Access denied for this database operation or data. ({e})"
-            if "syntax error" in msg or "does not exist" in msg:
-                 return f"Error: Generated SQL had an issue. Rephrase or contact support. (SQL Error: {e})"
-            return f"Error executing database query: {e}"
+            return self._handle_error(e, natural_language_query, sql_query_generated, sql_cache_key, sql_from_cache)
 
     async def _arun(self, natural_language_query: str, user_role: str, user_region: str, jwt_claims_for_db: str) -> str:
-        logger.warning("CustomSQLTool._arun called, using synchronous _run fallback.")
-        return self._run(natural_language_query, user_role, user_region, jwt_claims_for_db)
\ No newline at end of file
+        """
+        Async version of _run: SQL generation awaits the LLM and the query runs on the asyncpg engine.
+        Without an async engine, _run is executed in a worker thread so the event loop is never blocked.
+        The SQLite-backed SQL cache is read and written in a worker thread for the same reason.
+        """
+        if self.async_db_engine is None:
+            return await asyncio.to_thread(self._run, natural_language_query, user_role, user_region, jwt_claims_for_db)
+
+        logger.debug(f"CustomSQLTool (async) executing with NLQ: '{natural_language_query}', role: {user_role}, region: {user_region}")
+        not_ready = self._check_ready(user_role, self.async_db_engine)
+        if not_ready:
+            return not_ready
+
+        sql_query_generated = "N/A"
+        sql_cache_key = None
+        sql_from_cache = False
+        try:
+            relevant_tables = ROLES_PERMISSIONS[user_role].get("allowed_tables", ["supply_chain"])
+            if self.schema_registry is not None:
+                schema_str = self.schema_registry.get_schema_string(user_role)
+            else:
+                schema_str = await asyncio.to_thread(get_limited_db_schema_string, self.db_engine, relevant_tables=relevant_tables)
+
+            if not schema_str or "not found" in schema_str.lower():
+                logger.error(f"CustomSQLTool: Failed to get schema for {relevant_tables}. Schema: {schema_str}")
+                return "Error: Could not get database schema to construct SQL query."
+
+            sql_cache_key, sql_query_generated_by_llm = await asyncio.to_thread(
+                self._cached_sql, natural_language_query, user_role, schema_str
+            )
+            sql_from_cache = sql_query_generated_by_llm is not None
+            if sql_query_generated_by_llm is None:
+                sql_query_generated_by_llm = await generate_sql_from_text_async(natural_language_query, schema_str, self.llm)
+                logger.info(f"CustomSQLTool initial LLM SQL: {sql_query_generated_by_llm}")
+
+            sql_query_generated = sql_query_generated_by_llm
+            final_sql_to_execute, params = self._guarded_sql(sql_query_generated_by_llm, user_role, user_region)
+            logger.info(f"SQL after SQLGuard: {final_sql_to_execute} with params: {params}")
+            sql_query_generated = final_sql_to_execute
+
+            if self.analytics_mirror is not None:
+                observation = await asyncio.to_thread(self._query_mirror, final_sql_to_execute, params, user_role)
+                if observation is not None:
+                    if sql_cache_key is not None and not sql_from_cache:
+                        await asyncio.to_thread(self.sql_cache.put, sql_cache_key, natural_language_query, sql_query_generated_by_llm)
+                    return observation
+
+            async with self.async_db_engine.connect() as connection, connection.begin():
+                try:
+                    await connection.execute(*self._session_setup(jwt_claims_for_db, user_role))
+                    logger.info(f"RLS context set for user_role: {user_role}, region: {user_region}. Claims content: {jwt_claims_for_db[:100]}...")
+                except Exception as e_rls:
+                    logger.error(f"CRITICAL: Failed to set RLS context: {e_rls}", exc_info=True)
+                    return f"Error: Security context for DB query failed: {e_rls}"
+
+                decision = None
+                if self.cost_guard is not None:
+                    decision = await self.cost_guard.aadmit(connection, final_sql_to_execute, params, user_role)
+                    final_sql_to_execute = sql_query_generated = decision.sql
+                result = await connection.stream(text(counted_sql(final_sql_to_execute)), params)
+                observation = await self._aread_result(result, decision)
+
+                if sql_cache_key is not None and not sql_from_cache:
+                    await asyncio.to_thread(self.sql_cache.put, sql_cache_key, natural_language_query, sql_query_generated_by_llm)
+                return observation
+
+        except Exception as e:
+            return await asyncio.to_thread(
+                self._handle_error, e, natural_language_query, sql_query_generated, sql_cache_key, sql_from_cache
+            )
@@ -1,33 +1,58 @@
-from flask import Flask, request, jsonify,json
+from flask import Flask, request, jsonify,json, Response, stream_with_context
 from sqlalchemy import create_engine, text
 from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity, create_access_token,get_jwt
+import asyncio
 import os
+import queue
+import threading
 import bcrypt
+from datetime import timedelta
 
 from flask_cors import CORS 
-from .config import DATABASE_URL, ROLES_PERMISSIONS, JWT_SECRET_KEY
+from .config import (
+    DATABASE_URL, ROLES_PERMISSIONS, JWT_SECRET_KEY, JWT_ACCESS_TOKEN_EXPIRES_MINUTES, CORS_ORIGINS,
+    QUERY_ROUTER_ENABLED, QUERY_ROUTER_MIN_SIMILARITY, QUERY_ROUTER_MARGIN, PLAN_EXECUTE_ENABLED, PLAN_EXECUTE_MAX_WORKERS,
+    ASYNC_DB_ENABLED, ASYNC_DB_POOL_SIZE, ASYNC_DB_MAX_OVERFLOW, STREAM_KEEPALIVE_SECONDS,
+    MEMORY_MAX_TURNS, MEMORY_MAX_SESSIONS, MEMORY_IDLE_SECONDS, MEMORY_STORE_URL,
+    PROMPT_TOKEN_BUDGET, PROMPT_HISTORY_TOKENS, PROMPT_OBSERVATION_TOKENS, PROMPT_CHARS_PER_TOKEN, RLS_CLAIM_KEYS
+)
 from .utils.langchain_setup import setup_qa_chain
 from .logger_config import logger
-from .utils.agent_handler import create_supply_chain_agent_executor
+from .utils.agent_handler import create_supply_chain_agent_executor, QueryRouter
+from .utils.plan_execute import PlanAndExecute
+from .utils.db_utils import create_async_db_engine
+from .utils.streaming import AgentEventStream, format_sse
+from .utils.conversation_memory import ConversationMemoryStore, session_id_from
+from .utils.prompt_budget import PromptBudget, compact_claims
 
 app = Flask(__name__)
 # Enable CORS for all routes
-CORS(app, resources={r"/*": {"origins": "http://localhost:8080"}})
+CORS(app, resources={r"/*": {"origins": CORS_ORIGINS}})
 
 # Setup JWT
 
 app.config["JWT_SECRET_KEY"] = JWT_SECRET_KEY
+app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(minutes=JWT_ACCESS_TOKEN_EXPIRES_MINUTES)
 jwt = JWTManager(app)
 
 qa_chain = None
 db_engine = None
+async_db_engine = None
 bedrock_llm_instance = None
 agent_executor = None
+query_router = None
+conversation_memory = None
+prompt_budget = PromptBudget(PROMPT_TOKEN_BUDGET, PROMPT_HISTORY_TOKENS, PROMPT_OBSERVATION_TOKENS, PROMPT_CHARS_PER_TOKEN)
 
 # --- Initialization ---
 def initialize_app():
-    global qa_chain, db_engine, bedrock_llm_instance, agent_executor
+    global qa_chain, db_engine, async_db_engine, bedrock_llm_instance, agent_executor, query_router, conversation_memory
     logger.info("Initializing Flask application...")
+    try:
+        conversation_memory = ConversationMemoryStore(MEMORY_MAX_TURNS, MEMORY_MAX_SESSIONS, MEMORY_IDLE_SECONDS, MEMORY_STORE_URL)
+    except Exception as e:
+        logger.error(f"Could not open the conversation store at MEMORY_STORE_URL; chat history stays in memory only: {e}")
+        conversation_memory = ConversationMemoryStore(MEMORY_MAX_TURNS, MEMORY_MAX_SESSIONS, MEMORY_IDLE_SECONDS)
     try:
         logger.info("Setting up QA chain (for DocumentQATool)...")
         qa_chain = setup_qa_chain()
@@ -44,14 +69,34 @@ def initialize_app():
     except Exception as e:
         logger.error(f"Critical Error setting up database engine: {e}", exc_info=True)
 
+    if ASYNC_DB_ENABLED:
+        try:
+            async_db_engine = create_async_db_engine(DATABASE_URL, pool_size=ASYNC_DB_POOL_SIZE, max_overflow=ASYNC_DB_MAX_OVERFLOW)
+            logger.info("Async (asyncpg) database engine configured for async tool calls.")
+        except Exception as e:
+            logger.error(f"Could not configure the async database engine; async SQL calls will run in threads: {e}")
+
     if bedrock_llm_instance and qa_chain and db_engine:
         try:
             agent_executor = create_supply_chain_agent_executor(
                 llm_instance=bedrock_llm_instance,
                 qa_chain_instance=qa_chain,
-                db_engine_instance=db_engine
+                db_engine_instance=db_engine,
+                async_db_engine_instance=async_db_engine,
+                prompt_budget=prompt_budget
             )
             logger.info("Agent Executor initialized successfully.")
+            if QUERY_ROUTER_ENABLED:
+                planner = PlanAndExecute(bedrock_llm_instance, agent_executor.tools, max_workers=PLAN_EXECUTE_MAX_WORKERS) if PLAN_EXECUTE_ENABLED else None
+                query_router = QueryRouter(
+                    agent_executor,
+                    embeddings=qa_chain.retriever.vectorstore.embeddings,
+                    min_similarity=QUERY_ROUTER_MIN_SIMILARITY,
+                    margin=QUERY_ROUTER_MARGIN,
+                    planner=planner,
+                    llm=bedrock_llm_instance,
+                )
+                logger.info(f"Fast-path query router enabled (plan-then-execute {'on' if planner else 'off'}).")
         except Exception as e:
             logger.error(f"Critical Error creating Agent Executor: {e}", exc_info=True)
     else:
@@ -83,25 +128,139 @@ def log_audit(user_id, role, region, query, success, error_message=None):
 
 
 
-# --- Routes ---
-@app.route('/')
-def home():
-    return "AI Supply Chain Agent Backend (Multi-Tool Agent) is running."
+def _tool_attribute(name):
+    """Returns the first non-None attribute `name` among the agent's tools (caches, registries) for /health."""
+    if agent_executor is None:
+        return None
+    return next((getattr(tool, name) for tool in agent_executor.tools if getattr(tool, name, None) is not None), None)
 
-@app.route('/health')
-def health_check():
+
+def health_status():
+    """Returns (status dict, HTTP status code) for /health; shared with the ASGI app."""
     status = {
         "agent_executor_initialized": agent_executor is not None,
         "qa_chain_for_tool_initialized": qa_chain is not None,
         "db_engine_for_tool_initialized": db_engine is not None,
         "llm_for_agent_initialized": bedrock_llm_instance is not None,
     }
+    answer_cache = _tool_attribute("answer_cache")
+    if answer_cache is not None:
+        status["answer_cache"] = answer_cache.stats()
+    sql_cache = _tool_attribute("sql_cache")
+    if sql_cache is not None:
+        status["text_to_sql_cache"] = sql_cache.stats()
+    sql_guard = _tool_attribute("sql_guard")
+    if sql_guard is not None:
+        status["sql_guard"] = sql_guard.stats()
+    cost_guard = _tool_attribute("cost_guard")
+    if cost_guard is not None:
+        status["query_cost_guard"] = cost_guard.stats()
+    analytics_mirror = _tool_attribute("analytics_mirror")
+    if analytics_mirror is not None:
+        status["analytics_mirror"] = analytics_mirror.stats()
+    schema_registry = _tool_attribute("schema_registry")
+    if schema_registry is not None:
+        status["schema_last_refresh"] = schema_registry.last_refresh
+    if bedrock_llm_instance is not None and bedrock_llm_instance.response_cache is not None:
+        status["llm_cache"] = bedrock_llm_instance.response_cache.stats()
+    if query_router is not None:
+        status["route_latency"] = query_router.latency.summary()
+    if conversation_memory is not None:
+        status["conversation_memory"] = conversation_memory.stats()
     if agent_executor is None:
         status["status"] = "AGENT_NOT_INITIALIZED"
         logger.warning(f"Health check: Agent not initialized. Status: {status}")
-        return jsonify(status), 503
+        return status, 503
     status["status"] = "OK"
-    return jsonify(status), 200
+    return status, 200
+
+
+def authenticate_user(username, password):
+    """Checks the credentials against the users table. Returns (user_id, additional JWT claims) or None."""
+    with db_engine.connect() as connection: # db_engine is your main Supabase connection
+        result = connection.execute(
+            text("SELECT user_id, username, password_hash, role, region FROM users WHERE username = :username"),
+            {"username": username}
+        ).fetchone()
+
+    if not result:
+        return None
+
+    user_id_from_db, _, password_hash, role_from_db, region_from_db = result
+
+    if not bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8')):
+        return None
+
+    additional_claims = {
+        "role": "authenticated", # Standard Supabase role for authenticated users
+        "app_metadata": {
+            "role": role_from_db,       # application-specific role
+            "region": region_from_db    # application-specific region
+        }
+    }
+    return str(user_id_from_db), additional_claims
+
+
+def agent_inputs(question, app_role, app_region, jwt_payload, chat_history=""):
+    return {
+        "input": question,
+        "user_role": app_role, # Pass the application role
+        "user_region": app_region, # Pass the application region
+        "jwt_claims_for_db": compact_claims(jwt_payload, RLS_CLAIM_KEYS), # Claims for the DB session (RLS)
+        "chat_history": chat_history # Only this user's turns in this session
+    }
+
+
+def run_query(question, app_role, app_region, jwt_payload, session_id, callbacks=None):
+    """Answers one turn of the conversation keyed by (JWT sub, session_id) and records it in conversation_memory."""
+    user_sub = jwt_payload["sub"]
+    chat_history = prompt_budget.format_history(conversation_memory.messages(user_sub, session_id))
+    inputs = agent_inputs(question, app_role, app_region, jwt_payload, chat_history)
+    # The router answers single-tool questions directly, else defers to the agent
+    if query_router is not None:
+        response = query_router.invoke(inputs, callbacks=callbacks)
+    else:
+        response = agent_executor.invoke(inputs, {"callbacks": callbacks})
+    if "output" in response:
+        conversation_memory.append(user_sub, session_id, question, response["output"])
+    return response
+
+
+async def arun_query(question, app_role, app_region, jwt_payload, session_id, callbacks=None):
+    user_sub = jwt_payload["sub"]
+    # The store may read from / write to its database tier, so it runs off the event loop
+    chat_history = prompt_budget.format_history(await asyncio.to_thread(conversation_memory.messages, user_sub, session_id))
+    inputs = agent_inputs(question, app_role, app_region, jwt_payload, chat_history)
+    if query_router is not None:
+        response = await query_router.ainvoke(inputs, callbacks=callbacks)
+    else:
+        response = await agent_executor.ainvoke(inputs, {"callbacks": callbacks})
+    if "output" in response:
+        await asyncio.to_thread(conversation_memory.append, user_sub, session_id, question, response["output"])
+    return response
+
+
+def response_type(route):
+    return {"agent": "agent_multi_tool", "plan": "plan_parallel_tools"}.get(route, f"fast_path_{route}")
+
+
+def query_error(e):
+    """Maps an agent failure to (error message, HTTP status code)."""
+    error_msg = f"Error processing query: {str(e)}"
+    if "Unauthorized access" in str(e) or "permission denied" in str(e).lower(): # Catch DB permission errors
+        return f"You are not authorized to perform this action or access this data. {str(e)}", 403
+    return error_msg, 500
+
+
+# --- Routes ---
+@app.route('/')
+def home():
+    return "AI Supply Chain Agent Backend (Multi-Tool Agent) is running."
+
+@app.route('/health')
+def health_check():
+    status, status_code = health_status()
+    return jsonify(status), status_code
 @app.route('/login', methods=['POST'])
 def login():
     data = request.json
@@ -112,47 +271,27 @@ def login():
         return jsonify({"error": "Username and password are required"}), 400
 
     try:
-        with db_engine.connect() as connection: # db_engine is your main Supabase connection
-            result = connection.execute(
-                text("SELECT user_id, username, password_hash, role, region FROM users WHERE username = :username"),
-                {"username": username}
-            ).fetchone()
-
-            if not result:
-                return jsonify({"error": "Invalid username or password"}), 401
-
-            user_id_from_db, _, password_hash, role_from_db, region_from_db = result
-
-            if not bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8')):
-                return jsonify({"error": "Invalid username or password"}), 401
-
-
-            additional_claims = {
-                "role": "authenticated", # Standard Supabase role for authenticated users
-                "app_metadata": {
-                    "role": role_from_db,       # application-specific role
-                    "region": region_from_db    # application-specific region
-                }
-            }
-
-
-            access_token = create_access_token(
-                identity=str(user_id_from_db), # This becomes the 'sub' claim
-                additional_claims=additional_claims
-            )
-            logger.info(f"User {username} (user_id: {user_id_from_db}) logged in. JWT created with app_metadata.")
-            return jsonify({"access_token": access_token}), 200
+        authenticated = authenticate_user(username, password)
+        if authenticated is None:
+            return jsonify({"error": "Invalid username or password"}), 401
+
+        user_id, additional_claims = authenticated
+        access_token = create_access_token(
+            identity=user_id, # This becomes the 'sub' claim
+            additional_claims=additional_claims
+        )
+        logger.info(f"User {username} (user_id: {user_id}) logged in. JWT created with app_metadata.")
+        return jsonify({"access_token": access_token}), 200
 
     except Exception as e:
         logger.error(f"Error during login for username {username}: {e}", exc_info=True)
         return jsonify({"error": "Login failed due to a server error"}), 500
 
-@app.route('/query', methods=['POST'])
-@jwt_required()
-def handle_agent_query():
+def _query_request():
+    """Validates a /query or /query/stream request. Returns ((sub, role, region, question, session_id, jwt_payload), None) or (None, error response)."""
     if not agent_executor:
         logger.error("Agent executor not initialized. Cannot process query.")
-        return jsonify({"error": "Agent services not fully initialized. Please check logs."}), 503
+        return None, (jsonify({"error": "Agent services not fully initialized. Please check logs."}), 503)
 
     user_identity_sub = get_jwt_identity() # This is the 'sub' claim (user_id_from_db)
     
@@ -166,7 +305,7 @@ def handle_agent_query():
         error_msg = f"Invalid application role: {app_role} or role not configured in backend."
         # Use user_identity_sub for audit logging user ID
         log_audit(user_identity_sub, app_role, app_region, "N/A", False, error_msg)
-        return jsonify({"error": error_msg}), 403
+        return None, (jsonify({"error": error_msg}), 403)
 
     data = request.json
     question = data.get("question", "").strip()
@@ -174,33 +313,81 @@ def handle_agent_query():
     if not question:
         error_msg = "No question provided"
         log_audit(user_identity_sub, app_role, app_region, question, False, error_msg)
-        return jsonify({"error": error_msg}), 400
+        return None, (jsonify({"error": error_msg}), 400)
+
+    # Conversation within the user's history: "session_id" in the body or an X-Session-ID header
+    session_id = session_id_from(data.get("session_id") or request.headers.get("X-Session-ID"))
 
-    logger.info(f"Received agent query from user {user_identity_sub} (app_role: {app_role}, app_region: {app_region}): {question}")
+    logger.info(f"Received agent query from user {user_identity_sub} (app_role: {app_role}, app_region: {app_region}, session: {session_id}): {question}")
+    return (user_identity_sub, app_role, app_region, question, session_id, jwt_payload), None
+
+
+@app.route('/query', methods=['POST'])
+@jwt_required()
+def handle_agent_query():
+    query, error_response = _query_request()
+    if error_response is not None:
+        return error_response
+    user_identity_sub, app_role, app_region, question, session_id, jwt_payload = query
 
     try:
-        response = agent_executor.invoke({
-            "input": question,
-            "user_role": app_role, # Pass the application role
-            "user_region": app_region, # Pass the application region
-            "jwt_claims_for_db": json.dumps(jwt_payload) # Pass all claims for DB session
-        })
+        response = run_query(question, app_role, app_region, jwt_payload, session_id)
         final_answer = response.get("output", "Agent could not determine a final answer.")
+        route = response.get("route", "agent")
         log_audit(user_identity_sub, app_role, app_region, question, True)
-        return jsonify({"answer": final_answer, "type": "agent_multi_tool"})
+        return jsonify({"answer": final_answer, "type": response_type(route)})
     
     except Exception as e:
-        error_msg = f"Error processing query: {str(e)}"
-        if "Unauthorized access" in str(e) or "permission denied" in str(e).lower(): # Catch DB permission errors
-            error_msg = f"You are not authorized to perform this action or access this data. {str(e)}"
-            status_code = 403
-        else:
-            status_code = 500
+        error_msg, status_code = query_error(e)
         log_audit(user_identity_sub, app_role, app_region, question, False, error_msg)
         logger.error(f"Error processing agent query '{question}' for user {user_identity_sub}: {str(e)}", exc_info=True)
         return jsonify({"error": error_msg}), status_code
 
 
+@app.route('/query/stream', methods=['POST'])
+@jwt_required()
+def handle_agent_query_stream():
+    """Like /query, but answers with server-sent events: tool_start, tool_end and token while the agent runs, then answer or error."""
+    query, error_response = _query_request()
+    if error_response is not None:
+        return error_response
+    user_identity_sub, app_role, app_region, question, session_id, jwt_payload = query
+
+    events = queue.Queue()
+    stream = AgentEventStream(events.put)
+
+    def run():
+        try:
+            response = run_query(question, app_role, app_region, jwt_payload, session_id, callbacks=[stream])
+            final_answer = response.get("output", "Agent could not determine a final answer.")
+            log_audit(user_identity_sub, app_role, app_region, question, True)
+            stream.emit("answer", answer=final_answer, type=response_type(response.get("route", "agent")))
+        except Exception as e:
+            error_msg, status_code = query_error(e)
+            log_audit(user_identity_sub, app_role, app_region, question, False, error_msg)
+            logger.error(f"Error processing streamed agent query '{question}' for user {user_identity_sub}: {str(e)}", exc_info=True)
+            stream.emit("error", error=error_msg, status=status_code)
+        finally:
+            events.put(None)
+
+    # The agent runs on its own thread so this worker can flush events as they are produced.
+    threading.Thread(target=run, name="query-stream", daemon=True).start()
+
+    def generate():
+        while True:
+            try:
+                event = events.get(timeout=STREAM_KEEPALIVE_SECONDS)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            if event is None:
+                return
+            yield format_sse(*event)
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 if __name__ == "__main__":
     logger.info("Starting Flask development server for Multi-Tool Agent...")
     if os.environ.get("WERKZEUG_RUN_MAIN") != "true":
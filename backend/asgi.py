@@ -0,0 +1,247 @@
+"""
+ASGI serving mode: /login, /query and /health on Starlette, served by uvicorn.
+
+The agent, tools and engines are the ones app.py initializes, and the JWTs are interchangeable with
+the Flask app's (Flask-JWT-Extended's HS256 access-token layout and error responses). /query awaits
+the async agent path, so a worker keeps serving other requests while one waits on Bedrock or the
+database. Blocking work (bcrypt, the users lookup, audit inserts) runs in Starlette's thread pool.
+
+/query/stream answers with server-sent events (tool progress, answer tokens, then the answer) from
+the same async agent run; see utils/streaming.py.
+
+Run from the repository root:
+    uvicorn backend.asgi:app --host 0.0.0.0 --port 5000 --workers 2
+"""
+import asyncio
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+import jwt as pyjwt
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from . import app as core  # Importing app.py initializes the agent, tools and engines for this process
+from .config import ROLES_PERMISSIONS, JWT_SECRET_KEY, JWT_ACCESS_TOKEN_EXPIRES_MINUTES, CORS_ORIGINS, STREAM_KEEPALIVE_SECONDS
+from .logger_config import logger
+from .utils.lambda_transport import close_async_lambda_session
+from .utils.streaming import AgentEventStream, format_sse
+from .utils.conversation_memory import session_id_from
+
+JWT_ALGORITHM = "HS256"
+
+
+class JWTError(Exception):
+    def __init__(self, msg, status_code):
+        super().__init__(msg)
+        self.msg = msg
+        self.status_code = status_code
+
+
+def create_access_token(identity, additional_claims):
+    """Creates an access token with the same claims Flask-JWT-Extended's create_access_token writes."""
+    now = datetime.now(timezone.utc)
+    payload = {
+        "fresh": False,
+        "iat": now,
+        "jti": str(uuid.uuid4()),
+        "type": "access",
+        "sub": identity,
+        "nbf": now,
+        "exp": now + timedelta(minutes=JWT_ACCESS_TOKEN_EXPIRES_MINUTES),
+        **additional_claims,
+    }
+    return pyjwt.encode(payload, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
+
+
+def verify_access_token(request: Request):
+    """Returns the claims of the request's bearer access token; raises JWTError like @jwt_required() would respond."""
+    header = request.headers.get("Authorization")
+    if not header:
+        raise JWTError("Missing Authorization Header", 401)
+    scheme, _, token = header.partition(" ")
+    if scheme != "Bearer" or not token or " " in token:
+        raise JWTError("Bad Authorization header. Expected 'Authorization: Bearer <JWT>'", 422)
+    try:
+        claims = pyjwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM], options={"require": ["sub"]})
+    except pyjwt.ExpiredSignatureError:
+        raise JWTError("Token has expired", 401)
+    except pyjwt.InvalidTokenError as e:
+        raise JWTError(str(e), 422)
+    if claims.get("type") != "access":
+        raise JWTError("Only non-refresh tokens are allowed", 422)
+    return claims
+
+
+async def _json_body(request: Request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+# --- Routes ---
+async def home(request: Request):
+    return PlainTextResponse("AI Supply Chain Agent Backend (Multi-Tool Agent) is running.")
+
+
+async def health_check(request: Request):
+    status, status_code = core.health_status()
+    return JSONResponse(status, status_code=status_code)
+
+
+async def login(request: Request):
+    data = await _json_body(request)
+    if data is None:
+        return JSONResponse({"error": "Request body must be a JSON object"}, status_code=400)
+    username = data.get("username")
+    password = data.get("password")
+
+    if not username or not password:
+        return JSONResponse({"error": "Username and password are required"}, status_code=400)
+
+    try:
+        authenticated = await run_in_threadpool(core.authenticate_user, username, password)
+        if authenticated is None:
+            return JSONResponse({"error": "Invalid username or password"}, status_code=401)
+
+        user_id, additional_claims = authenticated
+        access_token = create_access_token(user_id, additional_claims)
+        logger.info(f"User {username} (user_id: {user_id}) logged in. JWT created with app_metadata.")
+        return JSONResponse({"access_token": access_token}, status_code=200)
+
+    except Exception as e:
+        logger.error(f"Error during login for username {username}: {e}", exc_info=True)
+        return JSONResponse({"error": "Login failed due to a server error"}, status_code=500)
+
+
+async def _query_request(request: Request):
+    """Validates a /query or /query/stream request. Returns ((sub, role, region, question, session_id, jwt_payload), None) or (None, error response)."""
+    try:
+        jwt_payload = verify_access_token(request)
+    except JWTError as e:
+        return None, JSONResponse({"msg": e.msg}, status_code=e.status_code)
+
+    if not core.agent_executor:
+        logger.error("Agent executor not initialized. Cannot process query.")
+        return None, JSONResponse({"error": "Agent services not fully initialized. Please check logs."}, status_code=503)
+
+    user_identity_sub = jwt_payload["sub"]
+    app_role = jwt_payload.get("app_metadata", {}).get("role")
+    app_region = jwt_payload.get("app_metadata", {}).get("region")
+
+    if not app_role or app_role not in ROLES_PERMISSIONS:
+        error_msg = f"Invalid application role: {app_role} or role not configured in backend."
+        await run_in_threadpool(core.log_audit, user_identity_sub, app_role, app_region, "N/A", False, error_msg)
+        return None, JSONResponse({"error": error_msg}, status_code=403)
+
+    data = await _json_body(request) or {}
+    question = str(data.get("question", "")).strip()
+
+    if not question:
+        error_msg = "No question provided"
+        await run_in_threadpool(core.log_audit, user_identity_sub, app_role, app_region, question, False, error_msg)
+        return None, JSONResponse({"error": error_msg}, status_code=400)
+
+    session_id = session_id_from(data.get("session_id") or request.headers.get("X-Session-ID"))
+
+    logger.info(f"Received agent query from user {user_identity_sub} (app_role: {app_role}, app_region: {app_region}, session: {session_id}): {question}")
+    return (user_identity_sub, app_role, app_region, question, session_id, jwt_payload), None
+
+
+async def handle_agent_query(request: Request):
+    query, error_response = await _query_request(request)
+    if error_response is not None:
+        return error_response
+    user_identity_sub, app_role, app_region, question, session_id, jwt_payload = query
+
+    try:
+        response = await core.arun_query(question, app_role, app_region, jwt_payload, session_id)
+        final_answer = response.get("output", "Agent could not determine a final answer.")
+        route = response.get("route", "agent")
+        await run_in_threadpool(core.log_audit, user_identity_sub, app_role, app_region, question, True)
+        return JSONResponse({"answer": final_answer, "type": core.response_type(route)})
+
+    except Exception as e:
+        error_msg, status_code = core.query_error(e)
+        await run_in_threadpool(core.log_audit, user_identity_sub, app_role, app_region, question, False, error_msg)
+        logger.error(f"Error processing agent query '{question}' for user {user_identity_sub}: {str(e)}", exc_info=True)
+        return JSONResponse({"error": error_msg}, status_code=status_code)
+
+
+async def handle_agent_query_stream(request: Request):
+    """Like /query, but answers with server-sent events: tool_start, tool_end and token while the agent runs, then answer or error."""
+    query, error_response = await _query_request(request)
+    if error_response is not None:
+        return error_response
+    user_identity_sub, app_role, app_region, question, session_id, jwt_payload = query
+
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    # call_soon_threadsafe, because tool callbacks may fire on worker threads (e.g. the sync SQL fallback)
+    stream = AgentEventStream(lambda event: loop.call_soon_threadsafe(events.put_nowait, event))
+
+    async def run():
+        try:
+            response = await core.arun_query(question, app_role, app_region, jwt_payload, session_id, callbacks=[stream])
+            final_answer = response.get("output", "Agent could not determine a final answer.")
+            await run_in_threadpool(core.log_audit, user_identity_sub, app_role, app_region, question, True)
+            stream.emit("answer", answer=final_answer, type=core.response_type(response.get("route", "agent")))
+        except asyncio.CancelledError:
+            await run_in_threadpool(core.log_audit, user_identity_sub, app_role, app_region, question, False, "Client disconnected from /query/stream")
+            raise
+        except Exception as e:
+            error_msg, status_code = core.query_error(e)
+            await run_in_threadpool(core.log_audit, user_identity_sub, app_role, app_region, question, False, error_msg)
+            logger.error(f"Error processing streamed agent query '{question}' for user {user_identity_sub}: {str(e)}", exc_info=True)
+            stream.emit("error", error=error_msg, status=status_code)
+        finally:
+            loop.call_soon_threadsafe(events.put_nowait, None)
+
+    task = asyncio.create_task(run())
+
+    async def generate():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(events.get(), timeout=STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    return
+                yield format_sse(*event)
+        finally:
+            if not task.done():  # The client went away; stop spending Bedrock and database time on the answer
+                task.cancel()
+
+    return StreamingResponse(generate(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@asynccontextmanager
+async def lifespan(app):
+    logger.info("ASGI app started; /query runs on the async agent path.")
+    yield
+    await close_async_lambda_session()
+    if core.async_db_engine is not None:
+        await core.async_db_engine.dispose()
+
+
+app = Starlette(
+    routes=[
+        Route("/", home),
+        Route("/health", health_check),
+        Route("/login", login, methods=["POST"]),
+        Route("/query", handle_agent_query, methods=["POST"]),
+        Route("/query/stream", handle_agent_query_stream, methods=["POST"]),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=CORS_ORIGINS, allow_methods=["*"], allow_headers=["*"])],
+    lifespan=lifespan,
+)
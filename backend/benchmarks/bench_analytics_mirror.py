@@ -0,0 +1,65 @@
+"""
+Analytics mirror versus Postgres on a fixture: the repeatable form of `analytics_mirror verify`.
+
+fixture_frame() is loaded into a scratch schema in Postgres, with the column types of the live supply_chain
+table, and written to a DuckDB mirror. verify_against() then runs VERIFY_QUERIES through SQLGuard for each
+role on both backends and compares column names and values, so numeric precision, DATE_TRUNC / EXTRACT
+result types, NULL ordering and Postgres column naming differences show up as DIFF lines. Timings per query
+are printed next to each result. The exit status is non-zero on any difference; the scratch schema is
+dropped afterwards.
+
+Usage (from the repository root; DATABASE_URL/SUPABASE_URL must point at a database where the user may
+create a schema):
+    python -m backend.benchmarks.bench_analytics_mirror --rows 5000
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("BEDROCK_API_KEY", "benchmark-key")
+os.environ.setdefault("LAMBDA_API_URL", "http://127.0.0.1/")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from sqlalchemy import DateTime, Float, Integer, String, create_engine, text  # noqa: E402
+
+from backend.config import DATABASE_URL  # noqa: E402
+from backend.utils.analytics_mirror import MIRROR_TABLE, AnalyticsMirror, build_mirror, fixture_frame, print_reports  # noqa: E402
+
+# The live table's types (see load_db.py), so Postgres computes with the same types it does in production.
+FIXTURE_TYPES = {
+    "order_id": Integer(), "order_country": String(100), "market": String(50), "shipping_mode": String(50),
+    "order_status": String(50), "category_name": String(100), "late_delivery_risk": Integer(),
+    "order_item_quantity": Integer(), "sales": Float(precision=53), "order_date": DateTime(),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000, help="fixture rows loaded into both backends")
+    parser.add_argument("--schema", default="mirror_fixture", help="scratch Postgres schema (dropped and recreated)")
+    args = parser.parse_args()
+
+    admin_engine = create_engine(DATABASE_URL)
+    with admin_engine.begin() as connection:
+        connection.execute(text(f'DROP SCHEMA IF EXISTS "{args.schema}" CASCADE'))
+        connection.execute(text(f'CREATE SCHEMA "{args.schema}"'))
+    try:
+        df = fixture_frame(args.rows)
+        df.to_sql(MIRROR_TABLE, admin_engine, schema=args.schema, index=False, dtype=FIXTURE_TYPES)
+        fixture_engine = create_engine(DATABASE_URL, connect_args={"options": f"-csearch_path={args.schema}"})
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "fixture.duckdb")
+            build_mirror(df, path)
+            print(f"Fixture of {args.rows} rows in schema '{args.schema}' and {path}")
+            mismatches = print_reports(AnalyticsMirror(path).verify_against(fixture_engine))
+        fixture_engine.dispose()
+    finally:
+        with admin_engine.begin() as connection:
+            connection.execute(text(f'DROP SCHEMA IF EXISTS "{args.schema}" CASCADE'))
+        admin_engine.dispose()
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
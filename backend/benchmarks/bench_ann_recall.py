@@ -0,0 +1,87 @@
+"""
+Recall-versus-latency benchmark of the approximate index types against exact (flat) search.
+
+Uses the vectors of backend/embeddings/index.faiss by default, or a synthetic clustered corpus
+with --synthetic N (useful before the corpus is large enough for ANN to matter).
+
+Usage (from the repository root):
+    python -m backend.benchmarks.bench_ann_recall --synthetic 100000 --dimension 1024 --queries 500
+"""
+import argparse
+import os
+import time
+
+import faiss
+import numpy as np
+
+os.environ.setdefault("BEDROCK_API_KEY", "benchmark-key")
+os.environ.setdefault("LAMBDA_API_URL", "http://127.0.0.1/")
+
+from backend.utils.vector_index import build_ann_index, apply_search_params, INDEX_NAME  # noqa: E402
+
+EMBEDDINGS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "embeddings"))
+
+
+def load_corpus(args):
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(max(16, args.synthetic // 500), args.dimension)).astype(np.float32)
+        assignments = rng.integers(0, len(centers), size=args.synthetic)
+        vectors = centers[assignments] + 0.3 * rng.normal(size=(args.synthetic, args.dimension)).astype(np.float32)
+        return vectors.astype(np.float32)
+    index = faiss.read_index(os.path.join(EMBEDDINGS_DIR, f"{INDEX_NAME}.faiss"))
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    return base.reconstruct_n(0, base.ntotal)
+
+
+def timed_search(index, queries, k):
+    start = time.perf_counter()
+    _, labels = index.search(queries, k)
+    return labels, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def recall_at_k(truth, labels):
+    hits = sum(len(set(t) & set(l)) for t, l in zip(truth, labels))
+    return hits / truth.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, default=0, help="Use N synthetic vectors instead of the saved index.")
+    parser.add_argument("--dimension", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3, help="Matches the retriever's k in setup_qa_chain.")
+    args = parser.parse_args()
+
+    vectors = load_corpus(args)
+    ids = np.arange(len(vectors), dtype=np.int64)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, len(vectors), size=args.queries)]
+    queries = queries + 0.05 * rng.normal(size=queries.shape).astype(np.float32)
+    print(f"corpus: {len(vectors)} x {vectors.shape[1]}, queries: {len(queries)}, k={args.k}")
+
+    flat = faiss.IndexFlatL2(vectors.shape[1])
+    flat.add(vectors)
+    truth, flat_ms = timed_search(flat, queries, args.k)
+    print(f"{'flat':<28} recall@{args.k}=1.000  {flat_ms:.3f} ms/query")
+
+    sweeps = [
+        ("ivf", "nprobe", [1, 4, 16, 64]),
+        ("ivfpq", "nprobe", [4, 16, 64]),
+        ("hnsw", "ef_search", [16, 64, 256]),
+    ]
+    for index_type, knob, values in sweeps:
+        start = time.perf_counter()
+        index, params = build_ann_index(vectors, ids, index_type)
+        build_s = time.perf_counter() - start
+        for value in values:
+            if knob == "nprobe" and value > params["nlist"]:
+                continue
+            apply_search_params(index, {knob: value})
+            labels, ms = timed_search(index, queries, args.k)
+            label = f"{index_type} {knob}={value}"
+            print(f"{label:<28} recall@{args.k}={recall_at_k(truth, labels):.3f}  {ms:.3f} ms/query  (build {build_s:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
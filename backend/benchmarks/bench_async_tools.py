@@ -0,0 +1,142 @@
+"""
+Load test for the async tool paths: many concurrent sessions in ONE worker, sync versus async.
+
+Each session runs DocumentPolicySearch (query embedding + FAISS retrieval + answer LLM call) and,
+with a database available, SupplyChainDatabaseQuery (SQL generation LLM call + RLS + query).
+The Lambda is the local stub with a simulated model latency, so the numbers show how much of a
+worker's time is spent waiting on I/O:
+
+    sync   sessions run one after another through _run, as a single sync worker serves them
+    async  sessions run concurrently on one event loop through _arun (aiohttp + asyncpg)
+
+Usage (from the repository root; DATABASE_URL/SUPABASE_URL must point at a loaded database
+unless --skip-db is given):
+    python -m backend.benchmarks.bench_async_tools --sessions 50 --response-ms 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+from backend.benchmarks.stub_lambda import start_stub_lambda, default_responder
+
+os.environ.setdefault("BEDROCK_API_KEY", "benchmark-key")
+os.environ.setdefault("LAMBDA_API_URL", "http://127.0.0.1/")
+os.environ.setdefault("LOG_LEVEL", "WARNING")  # per-call INFO logs would dominate the measurement
+
+from langchain.chains import RetrievalQA  # noqa: E402
+from langchain_community.vectorstores import FAISS  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+
+from backend.config import DATABASE_URL  # noqa: E402
+from backend.agent_tools import DocumentQATool, CustomSQLTool  # noqa: E402
+from backend.utils.bedrock_utils import BedrockLLM, BedrockLLMConfig, AmazonEmbeddings  # noqa: E402
+from backend.utils.db_utils import SchemaRegistry, create_async_db_engine  # noqa: E402
+from backend.utils.lambda_transport import close_async_lambda_session  # noqa: E402
+
+ROLE = "Planning"
+REGION = "Germany"
+CLAIMS = json.dumps({"role": ROLE, "region": REGION, "sub": "benchmark"})
+BENCH_SQL = "SELECT order_status, COUNT(*) AS orders FROM supply_chain GROUP BY order_status ORDER BY orders DESC"
+
+
+def responder(payload: dict):
+    if "PostgreSQL Query:" in payload.get("prompt", ""):
+        return 200, {"response": BENCH_SQL}
+    return default_responder(payload)
+
+
+def build_tools(url: str, database_url: str, skip_db: bool):
+    llm = BedrockLLM(config=BedrockLLMConfig(model_id="claude-3.5-sonnet", api_key="benchmark-key", llm_lambda_url=url,
+                                             model_kwargs={"max_tokens": 256, "temperature": 0.5}))
+    embeddings = AmazonEmbeddings(api_key="benchmark-key", model_id="amazon-embedding-v2", embedding_lambda_url=url,
+                                  requests_per_second=0)
+    texts = [f"Policy {i}: shipments to region {i % 7} follow procedure {i}." for i in range(50)]
+    store = FAISS.from_texts(texts, embeddings, metadatas=[{"source": f"policy{i % 5}.pdf"} for i in range(50)])
+    qa_chain = RetrievalQA.from_chain_type(llm=llm, chain_type="stuff", retriever=store.as_retriever(search_kwargs={"k": 3}),
+                                           return_source_documents=True)
+    doc_tool = DocumentQATool(qa_chain=qa_chain)
+    if skip_db:
+        return doc_tool, None
+    engine = create_engine(database_url, pool_size=5, max_overflow=10)
+    registry = SchemaRegistry(engine, refresh_seconds=0)
+    registry.refresh()
+    sql_tool = CustomSQLTool(db_engine=engine, llm=llm, schema_registry=registry,
+                             async_db_engine=create_async_db_engine(database_url, pool_size=20, max_overflow=40))
+    return doc_tool, sql_tool
+
+
+def run_sync(doc_tool, sql_tool, sessions: int) -> list:
+    latencies = []
+    for i in range(sessions):
+        start = time.perf_counter()
+        outputs = [doc_tool._run(f"What is the shipping procedure {i}?", ROLE, REGION)]
+        if sql_tool is not None:
+            outputs.append(sql_tool._run(f"How many orders per status? ({i})", ROLE, REGION, CLAIMS))
+        check(outputs)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def run_async(doc_tool, sql_tool, sessions: int) -> list:
+    async def session(i: int) -> float:
+        start = time.perf_counter()
+        outputs = [await doc_tool._arun(f"What is the shipping procedure {i}?", ROLE, REGION)]
+        if sql_tool is not None:
+            outputs.append(await sql_tool._arun(f"How many orders per status? ({i})", ROLE, REGION, CLAIMS))
+        check(outputs)
+        return time.perf_counter() - start
+
+    try:
+        return await asyncio.gather(*(session(i) for i in range(sessions)))
+    finally:
+        if sql_tool is not None:
+            await sql_tool.async_db_engine.dispose()
+        await close_async_lambda_session()
+
+
+def check(outputs: list) -> None:
+    for output in outputs:
+        if output.startswith("Error"):
+            raise RuntimeError(f"Tool call failed during the benchmark: {output}")
+
+
+def report(label: str, latencies: list, wall: float) -> None:
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"{label:<6} wall {wall:7.2f}s  throughput {len(latencies) / wall:6.1f} sessions/s  "
+          f"latency p50 {statistics.median(ordered) * 1000:7.0f} ms  p95 {p95 * 1000:7.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--response-ms", type=float, default=200.0, help="Simulated Lambda (model) latency per request")
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    parser.add_argument("--skip-db", action="store_true", help="Only benchmark DocumentPolicySearch")
+    args = parser.parse_args()
+
+    server, url = start_stub_lambda(response_delay=args.response_ms / 1000, responder=responder)
+    try:
+        doc_tool, sql_tool = build_tools(url, args.database_url, args.skip_db)
+        start = time.perf_counter()
+        sync_latencies = run_sync(doc_tool, sql_tool, args.sessions)
+        sync_wall = time.perf_counter() - start
+
+        start = time.perf_counter()
+        async_latencies = asyncio.run(run_async(doc_tool, sql_tool, args.sessions))
+        async_wall = time.perf_counter() - start
+    finally:
+        server.shutdown()
+
+    print(f"sessions: {args.sessions}, tools per session: {1 if args.skip_db else 2}, Lambda latency: {args.response_ms}ms, "
+          f"Lambda requests: {server.stats['requests']}")
+    report("sync", sync_latencies, sync_wall)
+    report("async", async_latencies, async_wall)
+    print(f"speed-up: {sync_wall / async_wall:.1f}x in a single worker")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmarks the pooled Lambda session against one-off requests.post calls.
+
+Simulates an agent turn (ReAct steps plus nested SQL generation / QA calls) against a local
+stub Lambda that charges a fixed handshake cost on every new connection.
+
+Usage (from the repository root):
+    python -m backend.benchmarks.bench_lambda_transport --turns 20 --calls-per-turn 24 --handshake-ms 40
+"""
+import argparse
+import os
+import statistics
+import time
+
+import requests
+
+from backend.benchmarks.stub_lambda import start_stub_lambda
+
+os.environ.setdefault("BEDROCK_API_KEY", "benchmark-key")
+os.environ.setdefault("LAMBDA_API_URL", "http://127.0.0.1/")
+
+from backend.utils.lambda_transport import create_lambda_session  # noqa: E402
+
+
+def run_turns(post, url: str, turns: int, calls_per_turn: int) -> list:
+    payload = {"api_key": "benchmark-key", "prompt": "Question: ping", "model_id": "claude-3.5-sonnet", "model_params": {}}
+    turn_times = []
+    for _ in range(turns):
+        start = time.perf_counter()
+        for _ in range(calls_per_turn):
+            resp = post(url, json=payload, timeout=(5, 30))
+            resp.raise_for_status()
+            resp.json()
+        turn_times.append(time.perf_counter() - start)
+    return turn_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--calls-per-turn", type=int, default=24, help="Lambda calls made by one agent turn")
+    parser.add_argument("--handshake-ms", type=float, default=40.0, help="Simulated TCP+TLS setup cost per new connection")
+    parser.add_argument("--response-ms", type=float, default=5.0, help="Simulated model latency per request")
+    args = parser.parse_args()
+
+    server, url = start_stub_lambda(handshake_delay=args.handshake_ms / 1000, response_delay=args.response_ms / 1000)
+    try:
+        baseline = run_turns(requests.post, url, args.turns, args.calls_per_turn)
+        baseline_connections = server.stats["connections"]
+
+        session = create_lambda_session()
+        pooled = run_turns(session.post, url, args.turns, args.calls_per_turn)
+        pooled_connections = server.stats["connections"] - baseline_connections
+        session.close()
+    finally:
+        server.shutdown()
+
+    base_ms = statistics.mean(baseline) * 1000
+    pooled_ms = statistics.mean(pooled) * 1000
+    print(f"calls per turn: {args.calls_per_turn}, turns: {args.turns}, handshake: {args.handshake_ms}ms, response: {args.response_ms}ms")
+    print(f"requests.post   : {base_ms:8.1f} ms/turn  ({baseline_connections} connections)")
+    print(f"pooled session  : {pooled_ms:8.1f} ms/turn  ({pooled_connections} connections)")
+    print(f"saved per turn  : {base_ms - pooled_ms:8.1f} ms ({(1 - pooled_ms / base_ms) * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
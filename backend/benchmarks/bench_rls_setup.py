@@ -0,0 +1,176 @@
+"""
+RLS session setup in SupplyChainDatabaseQuery: separate statements versus one parameterized statement.
+
+    legacy  SET LOCAL ROLE authenticated; set_config('request.jwt.claims', '<escaped claims>', true);
+            SET LOCAL ROLE authenticated; SET LOCAL statement_timeout = ... (four statements, the
+            claims inlined into the SQL text)
+    single  CustomSQLTool._session_setup(): one SELECT of set_config() calls with bound parameters
+
+Each tool call runs the setup and a small query in one transaction on a pooled connection, through a
+local TCP proxy that holds every client->server packet for --rtt-ms, like the network path to the
+Supabase pooler. The proxy counts the packets, which is the number of round trips. Both drivers are
+measured: psycopg2 (the sync engine) and asyncpg (the async engine).
+
+Usage (from the repository root; DATABASE_URL/SUPABASE_URL must point at a loaded database):
+    python -m backend.benchmarks.bench_rls_setup --calls 50 --rtt-ms 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+
+os.environ.setdefault("BEDROCK_API_KEY", "benchmark-key")
+os.environ.setdefault("LAMBDA_API_URL", "http://127.0.0.1/")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from sqlalchemy import create_engine, event, text  # noqa: E402
+from sqlalchemy.engine import make_url  # noqa: E402
+
+from backend.config import DATABASE_URL  # noqa: E402
+from backend.agent_tools import CustomSQLTool  # noqa: E402
+from backend.utils.cost_guard import QueryBudget, QueryCostGuard  # noqa: E402
+from backend.utils.db_utils import create_async_db_engine  # noqa: E402
+
+ROLE = "Planning"
+CLAIMS = json.dumps({"sub": "bench-user", "role": "authenticated", "app_metadata": {"role": ROLE, "region": "O'Higgins"}})
+QUERY = text("SELECT COUNT(*) FROM supply_chain WHERE order_id = :order_id")
+
+
+class LatencyProxy:
+    """TCP proxy on 127.0.0.1 to the database, delaying and counting client->server packets."""
+
+    def __init__(self, upstream, rtt_ms):
+        self.upstream = upstream  # ("unix", path) or ("tcp", host, port)
+        self.delay = rtt_ms / 1000
+        self.packets = 0
+        self.port = None
+        self._loop = asyncio.new_event_loop()
+        ready = threading.Event()
+        threading.Thread(target=self._serve, args=(ready,), daemon=True).start()
+        ready.wait()
+
+    def _serve(self, ready):
+        asyncio.set_event_loop(self._loop)
+        server = self._loop.run_until_complete(asyncio.start_server(self._handle, "127.0.0.1", 0))
+        self.port = server.sockets[0].getsockname()[1]
+        ready.set()
+        self._loop.run_forever()
+
+    async def _pipe(self, reader, writer, delayed):
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                if delayed:
+                    self.packets += 1
+                    await asyncio.sleep(self.delay)
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, client_reader, client_writer):
+        if self.upstream[0] == "unix":
+            server_reader, server_writer = await asyncio.open_unix_connection(self.upstream[1])
+        else:
+            server_reader, server_writer = await asyncio.open_connection(self.upstream[1], self.upstream[2])
+        await asyncio.gather(self._pipe(client_reader, server_writer, True), self._pipe(server_reader, client_writer, False))
+
+
+def proxied_url(database_url, rtt_ms):
+    url = make_url(database_url)
+    socket_dir = url.query.get("host")
+    if socket_dir and socket_dir.startswith("/"):
+        upstream = ("unix", os.path.join(socket_dir, f".s.PGSQL.{url.port or 5432}"))
+    else:
+        upstream = ("tcp", url.host or "localhost", url.port or 5432)
+    proxy = LatencyProxy(upstream, rtt_ms)
+    return proxy, url.difference_update_query(["host"]).set(host="127.0.0.1", port=proxy.port).render_as_string(hide_password=False)
+
+
+def legacy_setup(timeout_ms):
+    escaped_jwt_claims = CLAIMS.replace("'", "''")
+    return [
+        (text("SET LOCAL ROLE authenticated;"), {}),
+        (text(f"SELECT set_config('request.jwt.claims', '{escaped_jwt_claims}', true);"), {}),
+        (text("SET LOCAL ROLE authenticated;"), {}),
+        (text(f"SET LOCAL statement_timeout = {timeout_ms}"), {}),
+    ]
+
+
+def single_setup(tool):
+    return [tool._session_setup(CLAIMS, ROLE)]
+
+
+def count_statements(sync_engine):
+    counter = {"statements": 0}
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _count(*args):
+        counter["statements"] += 1
+    return counter
+
+
+def run_sync(url, setup, calls):
+    engine = create_engine(url, pool_size=5, max_overflow=10)  # as app.py creates it
+    counter = count_statements(engine)
+    with engine.connect() as connection:  # open the pooled connection outside the measurement
+        connection.execute(text("SELECT 1"))
+    counter["statements"] = 0
+    start = time.perf_counter()
+    for i in range(calls):
+        with engine.connect() as connection, connection.begin():
+            for statement, params in setup:
+                connection.execute(statement, params)
+            connection.execute(QUERY, {"order_id": i}).scalar()
+    elapsed = time.perf_counter() - start
+    engine.dispose()
+    return elapsed, counter["statements"]
+
+
+async def run_async(url, setup, calls):
+    engine = create_async_db_engine(url)
+    counter = count_statements(engine.sync_engine)
+    async with engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+    counter["statements"] = 0
+    start = time.perf_counter()
+    for i in range(calls):
+        async with engine.connect() as connection, connection.begin():
+            for statement, params in setup:
+                await connection.execute(statement, params)
+            (await connection.execute(QUERY, {"order_id": i})).scalar()
+    elapsed = time.perf_counter() - start
+    await engine.dispose()
+    return elapsed, counter["statements"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--rtt-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    budget = QueryBudget()
+    tool = CustomSQLTool(db_engine=None, llm=None, cost_guard=QueryCostGuard(budget))
+    proxy, url = proxied_url(DATABASE_URL, args.rtt_ms)
+    print(f"{args.calls} tool calls per run, {args.rtt_ms:.0f} ms simulated round trip")
+    for driver in ("psycopg2", "asyncpg"):
+        for name, setup in (("legacy", legacy_setup(budget.statement_timeout_ms)), ("single", single_setup(tool))):
+            before = proxy.packets
+            if driver == "psycopg2":
+                elapsed, statements = run_sync(url, setup, args.calls)
+            else:
+                elapsed, statements = asyncio.run(run_async(url, setup, args.calls))
+            round_trips = (proxy.packets - before) / args.calls
+            print(f"  {driver:<9} {name:<7} statements/call {statements / args.calls:4.1f}  round trips/call {round_trips:4.1f}  "
+                  f"{elapsed * 1000 / args.calls:7.1f} ms/call")
+
+
+if __name__ == "__main__":
+    main()
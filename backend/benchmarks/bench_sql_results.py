@@ -0,0 +1,87 @@
+"""
+Result reading in SupplyChainDatabaseQuery: fetchall() versus the streamed, counted path.
+
+    fetchall  the previous _format_result: every row fetched into the client and turned into a dict of
+              str() values, then all but the first 5 dropped
+    streamed  counted_sql() on a server-side cursor (stream_results), read by ResultSummarizer: the
+              first display rows, the total from COUNT(*) OVER (), summaries over --summary-rows rows
+
+Peak Python memory (tracemalloc) and wall time are reported per result size. The query runs as the
+database owner without RLS, the cost guard or a LIMIT, so the result size is the --rows argument.
+
+Usage (from the repository root; DATABASE_URL/SUPABASE_URL must point at a loaded database):
+    python -m backend.benchmarks.bench_sql_results --rows 1000 10000 50000
+"""
+import argparse
+import json
+import os
+import time
+import tracemalloc
+
+os.environ.setdefault("BEDROCK_API_KEY", "benchmark-key")
+os.environ.setdefault("LAMBDA_API_URL", "http://127.0.0.1/")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from sqlalchemy import create_engine, text  # noqa: E402
+
+from backend.config import DATABASE_URL  # noqa: E402
+from backend.utils.result_summary import ResultSummarizer  # noqa: E402
+from backend.utils.sql_guard import counted_sql  # noqa: E402
+
+QUERY = ("SELECT order_id, order_date, order_status, shipping_mode, product_name, sales, order_item_quantity, "
+         "order_profit_per_order FROM supply_chain ORDER BY order_id LIMIT {rows}")
+
+
+def read_fetchall(connection, sql):
+    result_proxy = connection.execute(text(sql))
+    results = result_proxy.fetchall()
+    column_names = list(result_proxy.keys())
+    answer_data = [dict(zip(column_names, map(str, row))) for row in results]
+    return f"Query found {len(answer_data)} record(s). Showing first 5: {json.dumps(answer_data[:5], indent=2)}"
+
+
+def read_streamed(connection, sql, summary_rows):
+    result = connection.execute(text(counted_sql(sql)).execution_options(stream_results=True))
+    summarizer = ResultSummarizer(list(result.keys()), display_limit=5, scan_limit=summary_rows)
+    try:
+        while True:
+            batch_size = summarizer.next_batch_size()
+            if not batch_size:
+                break
+            summarizer.add(result.fetchmany(batch_size))
+    finally:
+        result.close()
+    return summarizer.render()
+
+
+def measure(engine, reader, sql, *args):
+    with engine.connect() as connection:
+        reader(connection, sql, *args)  # warm-up: plan and buffers
+        start = time.perf_counter()
+        observation = reader(connection, sql, *args)
+        elapsed = time.perf_counter() - start
+        tracemalloc.start()  # separate run, tracing slows allocation-heavy code down
+        reader(connection, sql, *args)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return elapsed, peak, observation
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--summary-rows", type=int, default=1000, help="rows read for column summaries (SQL_RESULT_SUMMARY_ROWS)")
+    args = parser.parse_args()
+
+    engine = create_engine(DATABASE_URL)
+    for rows in args.rows:
+        sql = QUERY.format(rows=rows)
+        print(f"result of {rows} rows")
+        for name, reader, extra in (("fetchall", read_fetchall, ()), ("streamed", read_streamed, (args.summary_rows,))):
+            elapsed, peak, observation = measure(engine, reader, sql, *extra)
+            print(f"  {name:<9} {elapsed * 1000:8.1f} ms  peak {peak / 1024:9.1f} KiB  observation {len(observation)} chars")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
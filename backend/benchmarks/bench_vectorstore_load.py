@@ -0,0 +1,132 @@
+"""
+Startup cost of loading the vector store: legacy pickle (FAISS.load_local) versus the memory-mapped,
+JSON-lines format written by save_store_atomically.
+
+Builds a synthetic store in a temporary directory, then loads it in fresh subprocesses (one per
+format, as a gunicorn worker would) and reports load time, first and warm query latency, and the
+worker's private (RssAnon) and file-backed (RssFile, shared between workers) resident memory.
+
+Usage (from the repository root):
+    python -m backend.benchmarks.bench_vectorstore_load --vectors 200000 --dimension 1024 --index-type flat
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("BEDROCK_API_KEY", "benchmark-key")
+os.environ.setdefault("LAMBDA_API_URL", "http://127.0.0.1/")
+
+import numpy as np  # noqa: E402
+from langchain.docstore.document import Document  # noqa: E402
+from langchain_core.embeddings import Embeddings  # noqa: E402
+
+from backend.utils.vector_index import (  # noqa: E402
+    INDEX_NAME, INDEX_TYPES, create_id_mapped_store, add_documents_with_ids, save_store_atomically, load_index_meta,
+    current_index_dir
+)
+
+
+class RandomEmbeddings(Embeddings):
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return np.random.default_rng(abs(hash(text)) % (2 ** 32)).normal(size=self.dimension).astype(np.float32).tolist()
+
+
+def memory_kb():
+    fields = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "RssAnon", "RssFile"):
+                fields[key] = int(value.split()[0])
+    return fields
+
+
+def build(folder, vectors_count, dimension, index_type):
+    rng = np.random.default_rng(0)
+    embeddings = RandomEmbeddings(dimension)
+    store = create_id_mapped_store(embeddings, dimension)
+    text = "Supply chain policy text. " * 40  # ~1KB, close to CHUNK_SIZE
+    for start in range(0, vectors_count, 10000):
+        count = min(10000, vectors_count - start)
+        ids = list(range(start, start + count))
+        documents = [Document(page_content=f"{i} {text}", metadata={"source": f"doc{i % 50}.pdf", "chunk_id": i, "page": 1}) for i in ids]
+        add_documents_with_ids(store, documents, rng.normal(size=(count, dimension)).astype(np.float32), ids)
+    save_store_atomically(store, {"files": {}}, folder, index_type=index_type)
+    # The legacy format next to it, as FAISS.save_local used to write it.
+    store.save_local(folder_path=folder, index_name=INDEX_NAME)
+
+
+def measure(folder, mode, dimension, queries):
+    """Runs in a fresh interpreter: loads the store and reports timings and memory as JSON."""
+    from langchain_community.vectorstores import FAISS
+    from backend.utils.mmap_store import load_mmap_vectorstore
+    from backend.utils.vector_index import load_serving_index
+
+    embeddings = RandomEmbeddings(dimension)
+    before = memory_kb()
+    start = time.perf_counter()
+    index_dir = current_index_dir(folder)
+    meta = load_index_meta(index_dir)
+    if mode == "mmap":
+        store = load_mmap_vectorstore(index_dir, embeddings, meta)
+    else:
+        store = FAISS.load_local(folder, embeddings, index_name=INDEX_NAME, allow_dangerous_deserialization=True)
+        if meta["index_type"] != "flat":
+            store.index = load_serving_index(index_dir, meta)
+    load_s = time.perf_counter() - start
+    after_load = memory_kb()
+
+    start = time.perf_counter()
+    store.similarity_search_with_score("first query", k=3)
+    first_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    for i in range(queries):
+        store.similarity_search_with_score(f"query {i}", k=3)
+    query_ms = (time.perf_counter() - start) * 1000 / queries
+    after_queries = memory_kb()
+    print(json.dumps({"load_s": load_s, "first_ms": first_ms, "query_ms": query_ms, "before": before, "after_load": after_load, "after_queries": after_queries}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--dimension", type=int, default=1024)
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--measure", nargs=2, metavar=("FOLDER", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure[0], args.measure[1], args.dimension, args.queries)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="bench-vectorstore-") as folder:
+        start = time.perf_counter()
+        build(folder, args.vectors, args.dimension, args.index_type)
+        print(f"store: {args.vectors} x {args.dimension} ({args.index_type}), built in {time.perf_counter() - start:.1f}s")
+        for mode in ("pickle", "mmap"):
+            output = subprocess.run(
+                [sys.executable, "-m", "backend.benchmarks.bench_vectorstore_load", "--dimension", str(args.dimension),
+                 "--queries", str(args.queries), "--measure", folder, mode],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            grew = {key: (result["after_load"][key] - result["before"][key]) / 1024 for key in ("RssAnon", "RssFile")}
+            grew_q = {key: (result["after_queries"][key] - result["before"][key]) / 1024 for key in ("RssAnon", "RssFile")}
+            print(f"{mode:<7} load {result['load_s']:.3f}s  first query {result['first_ms']:.1f} ms  warm {result['query_ms']:.2f} ms  "
+                  f"after load: private +{grew['RssAnon']:.1f}MB shared +{grew['RssFile']:.1f}MB  "
+                  f"after queries: private +{grew_q['RssAnon']:.1f}MB shared +{grew_q['RssFile']:.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
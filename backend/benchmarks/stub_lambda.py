@@ -0,0 +1,84 @@
+"""
+Local stand-in for the Bedrock Lambda proxy, used by the benchmarks in this folder.
+
+It speaks the same JSON contract as the real proxy (LLM and embedding requests) and can
+simulate per-connection handshake cost and per-request model latency. An LLM request with
+"stream": true is answered as newline-delimited {"text": ...} chunks, one per word, with
+token_delay between them.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubLambdaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive capable, like the real API Gateway/Lambda URL
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.stats["connections"] += 1
+        if self.server.handshake_delay:
+            # Stands in for TCP + TLS handshake round trips on a fresh connection
+            time.sleep(self.server.handshake_delay)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        self.server.stats["requests"] += 1
+        if self.server.response_delay:
+            time.sleep(self.server.response_delay)
+
+        status, body = self.server.responder(payload)
+        if payload.get("stream") and status == 200 and isinstance(body.get("response"), str):
+            self._send_stream(body["response"])
+            return
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, text: str):
+        words = text.split(" ")
+        lines = [json.dumps({"text": word if i == 0 else " " + word}).encode("utf-8") + b"\n" for i, word in enumerate(words)]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Content-Length", str(sum(len(line) for line in lines)))
+        self.end_headers()
+        for line in lines:
+            self.wfile.write(line)
+            self.wfile.flush()
+            if self.server.token_delay:
+                time.sleep(self.server.token_delay)
+
+
+class StubLambdaServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # The default listen backlog of 5 drops connections under concurrent load tests
+
+
+def default_responder(payload: dict, dimension: int = 8):
+    if "prompts" in payload:
+        return 200, {"embeddings": [[float(len(p) % 7)] * dimension for p in payload["prompts"]]}
+    if payload.get("model_id", "").startswith("amazon"):
+        return 200, {"embedding": [float(len(payload.get("prompt", "")) % 7)] * dimension}
+    return 200, {"response": "Final Answer: stub"}
+
+
+def start_stub_lambda(handshake_delay: float = 0.0, response_delay: float = 0.0, responder=default_responder,
+                      token_delay: float = 0.0):
+    """Starts the stub on an ephemeral localhost port and returns (server, url)."""
+    server = StubLambdaServer(("127.0.0.1", 0), StubLambdaHandler)
+    server.handshake_delay = handshake_delay
+    server.response_delay = response_delay
+    server.responder = responder
+    server.token_delay = token_delay
+    server.stats = {"connections": 0, "requests": 0}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
@@ -20,6 +20,102 @@ if not LAMBDA_API_URL: # Check the unified URL
     raise ValueError("LAMBDA_API_URL not found. Please set it in .env file.")
 CSV_PATH_FOR_DB_LOAD = os.getenv("CSV_PATH", "/documents/DataCoSupplyChainDataset.csv")
 
+# HTTP transport for the Bedrock Lambda proxy (shared, keep-alive connection pool)
+LAMBDA_HTTP_POOL_CONNECTIONS = int(os.getenv("LAMBDA_HTTP_POOL_CONNECTIONS", "4"))
+LAMBDA_HTTP_POOL_MAXSIZE = int(os.getenv("LAMBDA_HTTP_POOL_MAXSIZE", "32"))
+LAMBDA_HTTP_POOL_BLOCK = os.getenv("LAMBDA_HTTP_POOL_BLOCK", "false").lower() == "true"
+LAMBDA_CONNECT_TIMEOUT = float(os.getenv("LAMBDA_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "300"))
+EMBEDDING_READ_TIMEOUT = float(os.getenv("EMBEDDING_READ_TIMEOUT", "60"))
+LAMBDA_ASYNC_MAX_CONNECTIONS = int(os.getenv("LAMBDA_ASYNC_MAX_CONNECTIONS", "100"))  # aiohttp connection limit for the async code paths
+
+# Async database engine for CustomSQLTool._arun (asyncpg; statement cache off for the pgbouncer pooler)
+ASYNC_DB_ENABLED = os.getenv("ASYNC_DB_ENABLED", "true").lower() == "true"
+ASYNC_DB_POOL_SIZE = int(os.getenv("ASYNC_DB_POOL_SIZE", "10"))
+ASYNC_DB_MAX_OVERFLOW = int(os.getenv("ASYNC_DB_MAX_OVERFLOW", "20"))
+
+# Embedding batching (texts packed into one Lambda request; EMBEDDING_BATCH_SIZE=1 disables batching)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_BATCH_MAX_CHARS = int(os.getenv("EMBEDDING_BATCH_MAX_CHARS", "100000"))
+
+# Concurrent embedding fan-out (requests in flight, token-bucket rate, retries on 429/5xx)
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+EMBEDDING_REQUESTS_PER_SECOND = float(os.getenv("EMBEDDING_REQUESTS_PER_SECOND", "10"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "4"))
+EMBEDDING_BACKOFF_BASE = float(os.getenv("EMBEDDING_BACKOFF_BASE", "0.5"))
+EMBEDDING_BACKOFF_MAX = float(os.getenv("EMBEDDING_BACKOFF_MAX", "20"))
+
+# Persistent embedding cache used by embed_documents.py (keyed by model ID + chunk text)
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_cache"))
+PDF_EXTRACTION_WORKERS = int(os.getenv("PDF_EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+INDEX_PIPELINE_QUEUE_SIZE = int(os.getenv("INDEX_PIPELINE_QUEUE_SIZE", "4"))  # files buffered between pipeline stages
+INDEX_CHECKPOINT_CHUNKS = int(os.getenv("INDEX_CHECKPOINT_CHUNKS", "500"))  # chunks indexed between checkpoint saves
+
+# Search-time overrides for approximate indexes built by embed_documents.py (unset = value recorded at build time)
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "0")) or None
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "0")) or None
+VECTORSTORE_MMAP = os.getenv("VECTORSTORE_MMAP", "true").lower() == "true"  # serve the index from memory-mapped files
+
+# Semantic cache of DocumentPolicySearch answers (see utils/semantic_cache.py)
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))  # minimum cosine similarity for a hit
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+
+# Exact-match cache of BedrockLLM completions; only used for temperature-0 calls (see utils/llm_cache.py)
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.5"))  # 0 makes agent and QA calls cacheable too
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512"))
+LLM_CACHE_SQLITE_PATH = os.getenv("LLM_CACHE_SQLITE_PATH", "")  # empty = in-memory tier only
+
+# Cache of generated SQL for SupplyChainDatabaseQuery (see utils/sql_cache.py); load_db.py clears it
+TEXT_TO_SQL_CACHE_ENABLED = os.getenv("TEXT_TO_SQL_CACHE_ENABLED", "true").lower() == "true"
+TEXT_TO_SQL_CACHE_PATH = os.getenv("TEXT_TO_SQL_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sql_cache", "text_to_sql.sqlite3"))
+SCHEMA_REFRESH_SECONDS = float(os.getenv("SCHEMA_REFRESH_SECONDS", "600"))  # background schema re-introspection; 0 = startup only
+SQL_GUARD_CACHE_SIZE = int(os.getenv("SQL_GUARD_CACHE_SIZE", "1024"))  # parsed and rewritten SQL kept by utils/sql_guard.py
+
+# EXPLAIN-based admission control for generated SQL (see utils/cost_guard.py); a role's "query_budget" in ROLES_PERMISSIONS overrides these
+QUERY_COST_GUARD_ENABLED = os.getenv("QUERY_COST_GUARD_ENABLED", "true").lower() == "true"
+QUERY_MAX_PLAN_COST = float(os.getenv("QUERY_MAX_PLAN_COST", "50000"))  # planner cost units; costlier plans are rejected
+QUERY_MAX_PLAN_ROWS = int(os.getenv("QUERY_MAX_PLAN_ROWS", "10000"))  # plans estimating more rows get a LIMIT
+QUERY_ROW_LIMIT = int(os.getenv("QUERY_ROW_LIMIT", "100"))  # LIMIT added to queries without aggregation
+QUERY_STATEMENT_TIMEOUT_MS = int(os.getenv("QUERY_STATEMENT_TIMEOUT_MS", "5000"))  # transaction-local statement_timeout; 0 = none
+
+# Streamed result reading in CustomSQLTool (see utils/result_summary.py): rows shown to the agent and rows read for column summaries
+SQL_RESULT_DISPLAY_ROWS = int(os.getenv("SQL_RESULT_DISPLAY_ROWS", "5"))
+SQL_RESULT_SUMMARY_ROWS = int(os.getenv("SQL_RESULT_SUMMARY_ROWS", "1000"))  # 0 = read only the displayed rows
+
+# Local DuckDB mirror of supply_chain for aggregate queries (see utils/analytics_mirror.py); written by load_db.py when enabled.
+# It bypasses RLS and the cost guard, so it only serves roles whose ROLES_PERMISSIONS entry has "analytics_mirror": True.
+ANALYTICS_MIRROR_ENABLED = os.getenv("ANALYTICS_MIRROR_ENABLED", "false").lower() == "true"
+ANALYTICS_MIRROR_PATH = os.getenv("ANALYTICS_MIRROR_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "analytics_mirror", "supply_chain.duckdb"))
+
+# Fast-path router in front of the ReAct agent (see QueryRouter in utils/agent_handler.py)
+QUERY_ROUTER_ENABLED = os.getenv("QUERY_ROUTER_ENABLED", "true").lower() == "true"
+QUERY_ROUTER_MIN_SIMILARITY = float(os.getenv("QUERY_ROUTER_MIN_SIMILARITY", "0.5"))  # best exemplar cosine similarity
+QUERY_ROUTER_MARGIN = float(os.getenv("QUERY_ROUTER_MARGIN", "0.05"))  # lead over the runner-up label
+PLAN_EXECUTE_ENABLED = os.getenv("PLAN_EXECUTE_ENABLED", "true").lower() == "true"  # parallel tool calls for non-fast-path questions
+PLAN_EXECUTE_MAX_WORKERS = int(os.getenv("PLAN_EXECUTE_MAX_WORKERS", "4"))
+
+# Server-sent events on /query/stream; LLM_STREAMING asks the Lambda proxy for token chunks ("stream": true)
+LLM_STREAMING = os.getenv("LLM_STREAMING", "false").lower() == "true"
+STREAM_KEEPALIVE_SECONDS = float(os.getenv("STREAM_KEEPALIVE_SECONDS", "15"))  # comment line sent while no event is due
+
+# Chat history per (JWT sub, session ID) (see utils/conversation_memory.py)
+MEMORY_MAX_TURNS = int(os.getenv("MEMORY_MAX_TURNS", "5"))  # turns kept per conversation and shown to the agent
+MEMORY_MAX_SESSIONS = int(os.getenv("MEMORY_MAX_SESSIONS", "10000"))  # in-process LRU bound
+MEMORY_IDLE_SECONDS = float(os.getenv("MEMORY_IDLE_SECONDS", "3600"))  # idle conversations are dropped; 0 = never
+MEMORY_STORE_URL = os.getenv("MEMORY_STORE_URL", "")  # SQLAlchemy URL (sqlite:///... or Postgres); empty = in-memory only
+
+# Token budgets for the ReAct prompt (see utils/prompt_budget.py); tokens are estimated as characters / PROMPT_CHARS_PER_TOKEN
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "4000"))  # whole prompt per agent iteration
+PROMPT_HISTORY_TOKENS = int(os.getenv("PROMPT_HISTORY_TOKENS", "600"))  # older turns are summarized beyond this
+PROMPT_OBSERVATION_TOKENS = int(os.getenv("PROMPT_OBSERVATION_TOKENS", "600"))  # per tool observation (e.g. SQL result rows)
+PROMPT_CHARS_PER_TOKEN = float(os.getenv("PROMPT_CHARS_PER_TOKEN", "3.5"))
+# JWT claims passed to the agent and set as request.jwt.claims for RLS; the other claims (iat, exp, jti, ...) are left out
+RLS_CLAIM_KEYS = [key.strip() for key in os.getenv("RLS_CLAIM_KEYS", "sub,role,app_metadata").split(",") if key.strip()]
+
 
 ROLES_PERMISSIONS = {
     "Planning": {
@@ -34,6 +130,7 @@ ROLES_PERMISSIONS = {
             "sales", "order_item_product_price", "product_price",
             "customer_city", "customer_country", "customer_state", "customer_segment", "order_customer_id"
         ],
+        "analytics_mirror": True,  # aggregates may run on the DuckDB mirror when ANALYTICS_MIRROR_ENABLED
     },
     "Finance": {
         "allowed_data": ["margin_reports", "cost_breakdowns", "p_and_l"],
@@ -44,6 +141,7 @@ ROLES_PERMISSIONS = {
             "order_date", "order_id", "market", "order_region", "category_name", "product_name", "department_name",
             "order_item_quantity", "customer_segment", "order_customer_id"
         ],
+        "analytics_mirror": True,  # aggregates may run on the DuckDB mirror when ANALYTICS_MIRROR_ENABLED
     },
     "Global Operations Manager": {
         "allowed_data": ["all"],
@@ -63,9 +161,12 @@ ROLES_PERMISSIONS = {
             "product_price", "product_status", "shipping_date_dateorders", "shipping_mode"
 
         ],
-        "global_access": True
+        "global_access": True,
+        "query_budget": {"max_plan_cost": 200000, "statement_timeout_ms": 15000}  # no region filter, so plans cover every row
     }
 }
 
 
-JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key")
\ No newline at end of file
+JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key")
+JWT_ACCESS_TOKEN_EXPIRES_MINUTES = int(os.getenv("JWT_ACCESS_TOKEN_EXPIRES_MINUTES", "15"))  # Flask-JWT-Extended's default
+CORS_ORIGINS = [origin.strip() for origin in os.getenv("CORS_ORIGINS", "http://localhost:8080").split(",") if origin.strip()]
\ No newline at end of file
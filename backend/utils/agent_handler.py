@@ -1,14 +1,37 @@
 
-from langchain.agents import AgentExecutor, create_react_agent
+from langchain.agents import AgentExecutor
+from langchain.agents.output_parsers import ReActSingleInputOutputParser
+from langchain_core.runnables import RunnableLambda
 from langchain_core.prompts import ChatPromptTemplate
 from langchain import hub
 from langchain.tools.render import render_text_description
 
+import asyncio
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
 
-from langchain.memory import ConversationBufferWindowMemory 
+import numpy as np
 
 from ..agent_tools import DocumentQATool, CustomSQLTool
 from ..logger_config import logger
+from ..config import (
+    ANSWER_CACHE_ENABLED, ANSWER_CACHE_SIMILARITY, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_MAX_ENTRIES,
+    TEXT_TO_SQL_CACHE_ENABLED, TEXT_TO_SQL_CACHE_PATH, SCHEMA_REFRESH_SECONDS, SQL_GUARD_CACHE_SIZE,
+    QUERY_COST_GUARD_ENABLED, QUERY_MAX_PLAN_COST, QUERY_MAX_PLAN_ROWS, QUERY_ROW_LIMIT, QUERY_STATEMENT_TIMEOUT_MS,
+    ANALYTICS_MIRROR_ENABLED, ANALYTICS_MIRROR_PATH
+)
+from .semantic_cache import SemanticAnswerCache
+from .sql_cache import TextToSQLCache
+from .db_utils import SchemaRegistry
+from .sql_guard import SQLGuard
+from .cost_guard import QueryBudget, QueryCostGuard
+from .analytics_mirror import AnalyticsMirror
+from .plan_execute import PlanAndExecute
+from .streaming import FINAL_ANSWER_TAG
+from .prompt_budget import PromptBudget
 from langchain_community.tools import DuckDuckGoSearchRun
 
 CUSTOM_REACT_PROMPT_STRING_WITH_TOOLS_AND_NAMES = """Answer the following questions as best you can. You have access to the following tools:
@@ -51,12 +74,46 @@ User Region: {user_region}
 JWT Claims (for SupplyChainDatabaseQuery only): {jwt_claims_for_db}
 ---
 """
-def create_supply_chain_agent_executor(llm_instance, qa_chain_instance, db_engine_instance):
+def create_supply_chain_agent_executor(llm_instance, qa_chain_instance, db_engine_instance, async_db_engine_instance=None,
+                                       prompt_budget=None):
     logger.info("Creating Supply Chain Agent Executor...")
     logger.info("Initializing agent tools...")
 
-    doc_tool = DocumentQATool(qa_chain=qa_chain_instance)
-    sql_tool = CustomSQLTool(db_engine=db_engine_instance, llm=llm_instance)
+    answer_cache = None
+    if ANSWER_CACHE_ENABLED:
+        answer_cache = SemanticAnswerCache(
+            embeddings=qa_chain_instance.retriever.vectorstore.embeddings,
+            build_id=getattr(qa_chain_instance.retriever.vectorstore, "index_meta", {}).get("build_id"),
+            similarity_threshold=ANSWER_CACHE_SIMILARITY,
+            ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+            max_entries=ANSWER_CACHE_MAX_ENTRIES,
+        )
+        logger.info(f"Semantic answer cache enabled (similarity >= {ANSWER_CACHE_SIMILARITY}, TTL {ANSWER_CACHE_TTL_SECONDS}s, max {ANSWER_CACHE_MAX_ENTRIES} entries).")
+    doc_tool = DocumentQATool(qa_chain=qa_chain_instance, answer_cache=answer_cache)
+    sql_cache = TextToSQLCache(TEXT_TO_SQL_CACHE_PATH) if TEXT_TO_SQL_CACHE_ENABLED else None
+    if sql_cache is not None:
+        logger.info(f"Text-to-SQL cache enabled at {TEXT_TO_SQL_CACHE_PATH}.")
+    schema_registry = SchemaRegistry(db_engine_instance, refresh_seconds=SCHEMA_REFRESH_SECONDS)
+    try:
+        schema_registry.refresh()
+    except Exception as e:
+        logger.error(f"Initial schema introspection failed; it will be retried on the first database query: {e}")
+    schema_registry.start()
+    cost_guard = None
+    if QUERY_COST_GUARD_ENABLED:
+        cost_guard = QueryCostGuard(QueryBudget(max_plan_cost=QUERY_MAX_PLAN_COST, max_plan_rows=QUERY_MAX_PLAN_ROWS,
+                                                row_limit=QUERY_ROW_LIMIT, statement_timeout_ms=QUERY_STATEMENT_TIMEOUT_MS))
+        logger.info(f"Query cost guard enabled (max cost {QUERY_MAX_PLAN_COST:.0f}, max rows {QUERY_MAX_PLAN_ROWS}, "
+                    f"LIMIT {QUERY_ROW_LIMIT}, statement_timeout {QUERY_STATEMENT_TIMEOUT_MS} ms).")
+    analytics_mirror = None
+    if ANALYTICS_MIRROR_ENABLED:
+        try:
+            analytics_mirror = AnalyticsMirror(ANALYTICS_MIRROR_PATH)
+        except Exception as e:
+            logger.error(f"Analytics mirror unavailable; aggregates will run on Postgres: {e}")
+    sql_tool = CustomSQLTool(db_engine=db_engine_instance, llm=llm_instance, sql_cache=sql_cache, schema_registry=schema_registry,
+                             async_db_engine=async_db_engine_instance, sql_guard=SQLGuard(max_entries=SQL_GUARD_CACHE_SIZE),
+                             cost_guard=cost_guard, analytics_mirror=analytics_mirror)
 
     web_search_tool = DuckDuckGoSearchRun(name="ExternalWebSearch")
     web_search_tool.description = (
@@ -84,38 +141,320 @@ def create_supply_chain_agent_executor(llm_instance, qa_chain_instance, db_engin
         raise ValueError(f"Custom prompt string is missing required variables. Found: {prompt.input_variables}")
     logger.info(f"Using custom prompt. Input variables: {prompt.input_variables}")
 
+    # create_react_agent's pipeline, with the prompt assembled by PromptBudget: observations are trimmed,
+    # the prompt is kept within its token budget, and its size is logged on every iteration.
+    prompt_budget = prompt_budget or PromptBudget()
+    prompt = prompt.partial(tools=render_text_description(tools), tool_names=", ".join(tool_names_list))
+
+    def assemble_prompt(inputs):
+        return prompt_budget.assemble(prompt, inputs)
+
+    async def aassemble_prompt(inputs):
+        return prompt_budget.assemble(prompt, inputs)
+
     try:
-        agent = create_react_agent(
-            llm=llm_instance,
-            tools=tools,
-            prompt=prompt
+        agent = (
+            RunnableLambda(assemble_prompt, afunc=aassemble_prompt)
+            | llm_instance.bind(stop=["\nObservation"])
+            | ReActSingleInputOutputParser()
         )
-        logger.info("ReAct agent created successfully.")
+        logger.info(f"ReAct agent created successfully (prompt budget {prompt_budget.total_tokens} tokens).")
     except Exception as e:
         logger.error(f"Failed to create ReAct agent: {e}", exc_info=True)
         raise
 
-    # input_key for memory ---
-    memory = ConversationBufferWindowMemory(
-        memory_key="chat_history",
-        input_key="input",  
-        return_messages=True,
-        k=5
-    )
-    logger.info(f"Initialized ConversationBufferWindowMemory with memory_key='chat_history', input_key='input', k={memory.k} turns.")
-
-
+    # No executor memory: the executor is shared by every request, so each call passes the caller's own
+    # chat_history (see utils/conversation_memory.py) and the caller saves the turn.
     try:
         executor = AgentExecutor(
             agent=agent,
             tools=tools,
             verbose=True,
             handle_parsing_errors="I apologize, I encountered an issue processing the previous step. I will try a different approach.",
-            max_iterations=10,
-            memory=memory
+            max_iterations=10
         )
-        logger.info("AgentExecutor created successfully with conversational memory.")
+        logger.info("AgentExecutor created successfully; chat history is passed per request.")
         return executor
     except Exception as e:
         logger.error(f"Failed to create AgentExecutor: {e}", exc_info=True)
         raise
+
+
+# Labeled exemplars for the fast-path router. "agent" covers questions that need several tools,
+# external information or conversational context, so near matches go to the full ReAct loop.
+ROUTER_EXEMPLARS: Dict[str, List[str]] = {
+    "document": [
+        "What is the obsolete inventory write-off policy?",
+        "What does the supplier code of conduct say about child labor?",
+        "What are the guidelines for handling counterfeit products?",
+        "Explain the procedure for crisis communication.",
+        "What is our data security policy for vendor access?",
+        "What are the ethical sourcing requirements for suppliers?",
+        "Summarize the circular economy policy.",
+        "What approvals are required under the cost reduction policy?",
+    ],
+    "database": [
+        "Show total sales in India last month.",
+        "How many orders were delivered late by shipping mode?",
+        "What is the average order profit per order by market?",
+        "List the top 10 products by sales.",
+        "How many orders shipped First Class to Brazil?",
+        "What is the total order item quantity by category?",
+        "Count the canceled orders by order region.",
+        "What was the late delivery risk rate per customer segment this quarter?",
+    ],
+    "agent": [
+        "What does our transportation policy say about air freight, and how many orders shipped First Class?",
+        "What is the latest news on port congestion affecting our shipments?",
+        "Compare our late deliveries with the policy targets.",
+        "What about the previous quarter?",
+        "Can you explain that in more detail?",
+    ],
+}
+
+# Keyword fallback (from the retired tempCodeRunnerFile.is_document_query), used when embeddings are unavailable.
+DOCUMENT_KEYWORDS = ["policy", "policies", "guideline", "procedure", "write-off", "ethical", "code of conduct", "compliance"]
+DATABASE_KEYWORDS = ["how many", "total", "count", "sum", "average", "top ", "list ", "sales", "orders", "quantity", "profit", "revenue", "by region", "by market"]
+# Follow-ups depend on chat history, and multi-part questions need more than one tool; both go to the agent.
+AGENT_MARKERS = re.compile(r"\b(and (how|what|which|show|list)|also|news|latest|internet|web|those|these|what about|how about)\b", re.IGNORECASE)
+# With chat history, a question that refers back ("Now break that down by month", "Same for Germany") or is too
+# short to stand alone needs the history, which only the agent reads.
+FOLLOW_UP_MARKERS = re.compile(r"\b(it|its|that|this|them|they|their|same|again|instead|now|previous|above|earlier|"
+                               r"more|other|else|too|one|ones)\b|^\s*(and|but|or|why|so)\b", re.IGNORECASE)
+MIN_STANDALONE_WORDS = 5
+
+# One LLM call that turns a database fast-path observation into the answer the agent's Final Answer would give.
+DATABASE_ANSWER_PROMPT = """Answer the user's question using only the database query result below.
+Give the figures that answer the question in plain sentences; use a short list only when several rows matter.
+If the result stopped at a row limit, say the list may be incomplete. If no data was found, say so.
+Do not mention SQL, JSON or column summaries.
+
+Question: {question}
+
+Database query result:
+{result}
+
+Final Answer:"""
+
+
+class LatencyTracker:
+    """Keeps the last `window` latencies per route and reports p50/p95."""
+
+    def __init__(self, window: int = 500):
+        self._lock = threading.Lock()
+        self._samples: Dict[str, deque] = {}
+        self._window = window
+
+    def record(self, route: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(route, deque(maxlen=self._window)).append(seconds)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            routes = {route: np.asarray(samples) for route, samples in self._samples.items() if samples}
+        report: Dict[str, Any] = {
+            route: {"count": len(values), "p50_ms": round(float(np.percentile(values, 50)) * 1000, 1),
+                    "p95_ms": round(float(np.percentile(values, 95)) * 1000, 1)}
+            for route, values in routes.items()
+        }
+        if "agent" in report:
+            for route in [r for r in report if r != "agent"]:
+                report[route]["p50_saved_ms"] = round(report["agent"]["p50_ms"] - report[route]["p50_ms"], 1)
+                report[route]["p95_saved_ms"] = round(report["agent"]["p95_ms"] - report[route]["p95_ms"], 1)
+        return report
+
+
+class QueryRouter:
+    """
+    Sends clearly single-tool questions straight to DocumentPolicySearch or SupplyChainDatabaseQuery,
+    skipping the ReAct tool-choice and final-answer LLM calls. Everything else goes to the AgentExecutor.
+
+    A question is classified by cosine similarity to ROUTER_EXEMPLARS: it takes the fast path only when
+    its best label is "document" or "database", scores at least min_similarity, and beats the runner-up
+    label by margin. If embedding fails, the keyword lists decide, and only when exactly one side matches.
+    Once the session has chat history, only clearly standalone questions (no FOLLOW_UP_MARKERS, at least
+    MIN_STANDALONE_WORDS words) are classified; follow-ups go to the agent, which reads the history.
+    A document answer is returned as the tool gives it; a database observation is turned into an answer
+    with one llm call (DATABASE_ANSWER_PROMPT), and without an llm database questions go to the agent.
+    inputs carry the caller's "chat_history" (the planner and agent read it; the caller saves the turn),
+    and a fast-path tool error falls back to the agent. With a planner, remaining questions are first tried in
+    plan-then-execute mode (tool calls in parallel), and reach the ReAct agent only if no usable plan results.
+    """
+
+    def __init__(self, agent_executor: Any, embeddings: Any, min_similarity: float = 0.5, margin: float = 0.05,
+                 exemplars: Optional[Dict[str, List[str]]] = None, planner: Optional[PlanAndExecute] = None,
+                 llm: Optional[Any] = None):
+        self.agent_executor = agent_executor
+        self.llm = llm
+        self.planner = planner
+        self.embeddings = embeddings
+        self.min_similarity = min_similarity
+        self.margin = margin
+        self.exemplars = exemplars or ROUTER_EXEMPLARS
+        self.latency = LatencyTracker()
+        tools = {tool.name: tool for tool in agent_executor.tools}
+        self.doc_tool = tools.get("DocumentPolicySearch")
+        self.sql_tool = tools.get("SupplyChainDatabaseQuery")
+        self._exemplar_vectors: Optional[Dict[str, np.ndarray]] = None
+        self._lock = threading.Lock()
+
+    def _load_exemplars(self) -> Dict[str, np.ndarray]:
+        with self._lock:
+            if self._exemplar_vectors is None:
+                vectors = {}
+                for label, questions in self.exemplars.items():
+                    matrix = np.asarray(self.embeddings.embed_documents(questions), dtype=np.float32)
+                    vectors[label] = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+                self._exemplar_vectors = vectors
+                logger.info(f"QueryRouter embedded {sum(len(q) for q in self.exemplars.values())} exemplar questions.")
+            return self._exemplar_vectors
+
+    @staticmethod
+    def _needs_agent(question: str, chat_history: str) -> bool:
+        if AGENT_MARKERS.search(question):
+            return True
+        return bool(chat_history.strip()) and (FOLLOW_UP_MARKERS.search(question) is not None
+                                               or len(question.split()) < MIN_STANDALONE_WORDS)
+
+    def classify(self, question: str, chat_history: str = "") -> Tuple[str, Dict[str, float]]:
+        """Returns ("document" | "database" | "agent", per-label similarity scores)."""
+        if self._needs_agent(question, chat_history):
+            return "agent", {}
+        try:
+            exemplar_vectors = self._load_exemplars()
+            query = self.embeddings.embed_query(question)
+        except Exception as e:
+            return self._keyword_route(question, e)
+        return self._route_from_vector(exemplar_vectors, query)
+
+    async def aclassify(self, question: str, chat_history: str = "") -> Tuple[str, Dict[str, float]]:
+        """Async classify(); exemplars are embedded once in a worker thread, the question with aembed_query."""
+        if self._needs_agent(question, chat_history):
+            return "agent", {}
+        try:
+            exemplar_vectors = self._exemplar_vectors or await asyncio.to_thread(self._load_exemplars)
+            query = await self.embeddings.aembed_query(question)
+        except Exception as e:
+            return self._keyword_route(question, e)
+        return self._route_from_vector(exemplar_vectors, query)
+
+    @staticmethod
+    def _keyword_route(question: str, error: Exception) -> Tuple[str, Dict[str, float]]:
+        logger.warning(f"QueryRouter could not embed the question ({error}); using keyword routing.")
+        lowered = question.lower()
+        is_document = any(keyword in lowered for keyword in DOCUMENT_KEYWORDS)
+        is_database = any(keyword in lowered for keyword in DATABASE_KEYWORDS)
+        if is_document != is_database:
+            return ("document" if is_document else "database"), {}
+        return "agent", {}
+
+    def _route_from_vector(self, exemplar_vectors: Dict[str, np.ndarray], query_vector: List[float]) -> Tuple[str, Dict[str, float]]:
+        query = np.asarray(query_vector, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        scores = {label: float(np.max(matrix @ query)) for label, matrix in exemplar_vectors.items()}
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        (best_label, best_score), (_, runner_up) = ranked[0], ranked[1]
+        if best_label != "agent" and best_score >= self.min_similarity and best_score - runner_up >= self.margin:
+            return best_label, scores
+        return "agent", scores
+
+    def _fast_path_call(self, route: str, inputs: Dict[str, Any]) -> Tuple[Any, Optional[Dict[str, str]]]:
+        """Returns (tool, tool input) for a fast-path route, or (None, None) when that tool is unavailable."""
+        if route == "document" and self.doc_tool is not None:
+            return self.doc_tool, {"query": inputs["input"], "user_role": inputs["user_role"], "user_region": inputs["user_region"]}
+        if route == "database" and self.sql_tool is not None and self.llm is not None:
+            return self.sql_tool, {"natural_language_query": inputs["input"], "user_role": inputs["user_role"],
+                                   "user_region": inputs["user_region"], "jwt_claims_for_db": inputs["jwt_claims_for_db"]}
+        return None, None
+
+    def _run_fast_path(self, route: str, inputs: Dict[str, Any], callbacks: Optional[List[Any]] = None) -> Optional[str]:
+        tool, tool_input = self._fast_path_call(route, inputs)
+        if tool is None:
+            return None
+        output = self._usable(route, tool.run(tool_input, callbacks=callbacks))
+        if output is None or route != "database":
+            return output
+        answer = self.llm.invoke(self._answer_prompt(inputs, output), self._answer_config(callbacks), cache_site="database_answer")
+        return self._final_answer(answer)
+
+    async def _arun_fast_path(self, route: str, inputs: Dict[str, Any], callbacks: Optional[List[Any]] = None) -> Optional[str]:
+        tool, tool_input = self._fast_path_call(route, inputs)
+        if tool is None:
+            return None
+        output = self._usable(route, await tool.arun(tool_input, callbacks=callbacks))
+        if output is None or route != "database":
+            return output
+        answer = await self.llm.ainvoke(self._answer_prompt(inputs, output), self._answer_config(callbacks), cache_site="database_answer")
+        return self._final_answer(answer)
+
+    @staticmethod
+    def _answer_prompt(inputs: Dict[str, Any], observation: str) -> str:
+        return DATABASE_ANSWER_PROMPT.format(question=inputs["input"], result=observation)
+
+    @staticmethod
+    def _answer_config(callbacks: Optional[List[Any]]) -> Dict[str, Any]:
+        # The completion is the answer itself, so streaming handlers forward all of its tokens.
+        return {"callbacks": callbacks, "tags": [FINAL_ANSWER_TAG]}
+
+    @staticmethod
+    def _final_answer(answer: str) -> str:
+        return answer.split("Final Answer:", 1)[-1].strip()
+
+    @staticmethod
+    def _usable(route: str, output: str) -> Optional[str]:
+        if output.startswith("Error") or "could not find an answer" in output:
+            logger.info(f"QueryRouter fast path '{route}' returned no usable answer; falling back to the agent.")
+            return None
+        return output
+
+    def _finish(self, route: str, result: Dict[str, Any], start: float) -> Dict[str, Any]:
+        """Records latency and tags the route."""
+        self.latency.record(route, time.perf_counter() - start)
+        return {**result, "route": route}
+
+    def invoke(self, inputs: Dict[str, Any], callbacks: Optional[List[Any]] = None) -> Dict[str, Any]:
+        """
+        Same inputs as AgentExecutor.invoke; the result also carries the "route" taken. callbacks are
+        LangChain handlers (e.g. streaming.AgentEventStream) passed to the tool, planner and agent runs.
+        """
+        start = time.perf_counter()
+        route, scores = self.classify(inputs["input"], inputs.get("chat_history", ""))
+        logger.info(f"QueryRouter: '{inputs['input']}' -> {route} {({k: round(v, 3) for k, v in scores.items()})}")
+
+        if route != "agent":
+            output = self._run_fast_path(route, inputs, callbacks)
+            if output is not None:
+                return self._finish(route, {"output": output}, start)
+
+        if self.planner is not None:
+            try:
+                planned = self.planner.invoke(inputs, chat_history=inputs.get("chat_history", ""), callbacks=callbacks)
+            except Exception as e:
+                logger.error(f"QueryRouter: plan-then-execute failed ({e}); falling back to the agent.", exc_info=True)
+                planned = None
+            if planned is not None:
+                return self._finish("plan", planned, start)
+
+        return self._finish("agent", self.agent_executor.invoke(inputs, {"callbacks": callbacks}), start)
+
+    async def ainvoke(self, inputs: Dict[str, Any], callbacks: Optional[List[Any]] = None) -> Dict[str, Any]:
+        """Async invoke() for the ASGI app: every route awaits the async tool, LLM and agent paths."""
+        start = time.perf_counter()
+        route, scores = await self.aclassify(inputs["input"], inputs.get("chat_history", ""))
+        logger.info(f"QueryRouter: '{inputs['input']}' -> {route} {({k: round(v, 3) for k, v in scores.items()})}")
+
+        if route != "agent":
+            output = await self._arun_fast_path(route, inputs, callbacks)
+            if output is not None:
+                return self._finish(route, {"output": output}, start)
+
+        if self.planner is not None:
+            try:
+                planned = await self.planner.ainvoke(inputs, chat_history=inputs.get("chat_history", ""), callbacks=callbacks)
+            except Exception as e:
+                logger.error(f"QueryRouter: plan-then-execute failed ({e}); falling back to the agent.", exc_info=True)
+                planned = None
+            if planned is not None:
+                return self._finish("plan", planned, start)
+
+        return self._finish("agent", await self.agent_executor.ainvoke(inputs, {"callbacks": callbacks}), start)
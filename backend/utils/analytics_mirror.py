@@ -0,0 +1,375 @@
+import datetime
+import decimal
+import math
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from sqlalchemy import text
+
+try:
+    import duckdb
+except ImportError:  # optional; without it the mirror is unavailable and every query runs on Postgres
+    duckdb = None
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.logger_config import logger
+from backend.config import ROLES_PERMISSIONS
+from backend.utils.sql_guard import REGION_PARAM, SQLGuard, counted_sql, is_aggregate
+
+MIRROR_TABLE = "supply_chain"
+_MIRROR_CATALOG = "mirror"
+
+# Aggregate questions the verification runs per role, as the SQL the LLM would generate for them.
+VERIFY_QUERIES = [
+    "SELECT market, SUM(sales) AS total_sales FROM supply_chain GROUP BY market ORDER BY total_sales DESC",
+    "SELECT shipping_mode, AVG(late_delivery_risk) AS late_rate, COUNT(*) AS orders FROM supply_chain GROUP BY shipping_mode",
+    "SELECT order_status, COUNT(DISTINCT order_id) FROM supply_chain GROUP BY order_status",
+    "SELECT DATE_TRUNC('month', order_date) AS month, SUM(sales) AS sales FROM supply_chain GROUP BY 1 ORDER BY 1",
+    "SELECT category_name, ROUND(AVG(order_item_quantity), 2) AS avg_qty, MAX(sales) FROM supply_chain GROUP BY category_name",
+    "SELECT COUNT(*), SUM(order_item_quantity), MIN(order_date), MAX(order_date), AVG(sales) FROM supply_chain",
+    "SELECT EXTRACT(YEAR FROM order_date) AS y, COUNT(*) FILTER (WHERE late_delivery_risk = 1) AS late FROM supply_chain GROUP BY 1",
+]
+VERIFY_ROLES = [("Planning", "India"), ("Finance", "Germany"), ("Global Operations Manager", None)]
+# Countries of the check() fixture; mixed case, so the region filter's LOWER() is exercised.
+_FIXTURE_COUNTRIES = ["India", "india", "Germany", "Brasil", "Estados Unidos"]
+
+
+def build_mirror(df: pd.DataFrame, path: str) -> int:
+    """Writes df as table supply_chain of a new DuckDB file at path, replacing any previous mirror atomically."""
+    if duckdb is None:
+        raise RuntimeError("duckdb is not installed; pip install duckdb to build the analytics mirror")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    for leftover in (tmp_path, f"{tmp_path}.wal"):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+    connection = duckdb.connect(tmp_path)
+    try:
+        connection.register("source_df", df)
+        connection.execute(f"CREATE TABLE {MIRROR_TABLE} AS SELECT * FROM source_df")
+        rows = connection.execute(f"SELECT COUNT(*) FROM {MIRROR_TABLE}").fetchone()[0]
+    finally:
+        connection.close()
+    os.replace(tmp_path, path)
+    logger.info(f"Analytics mirror written to {path} ({rows} rows).")
+    return rows
+
+
+def build_mirror_from_db(engine: Any, path: str, chunk_size: int = 50000) -> int:
+    """Builds the mirror from the supply_chain table in Postgres, for deployments where load_db.py is not re-run."""
+    chunks = pd.read_sql_query(text(f"SELECT * FROM {MIRROR_TABLE}"), engine, chunksize=chunk_size)
+    return build_mirror(pd.concat(list(chunks), ignore_index=True), path)
+
+
+class _MirrorResult:
+    """A DuckDB cursor with the keys() / fetchmany() / close() that CustomSQLTool reads results through."""
+
+    def __init__(self, cursor: Any, timer: Optional[threading.Timer]):
+        self._cursor = cursor
+        self._timer = timer
+
+    def keys(self) -> List[str]:
+        return [column[0] for column in self._cursor.description]
+
+    def fetchmany(self, size: int) -> List[Tuple[Any, ...]]:
+        return self._cursor.fetchmany(size)
+
+    def close(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self._cursor.close()
+
+
+class AnalyticsMirror:
+    """
+    Read-only DuckDB copy of supply_chain that serves aggregate queries without a round trip to Postgres.
+
+        build    build_mirror() from the cleaned DataFrame in load_db.py (or build_mirror_from_db()); the file
+                 is replaced atomically and reopened here when its modification time changes
+        route    SQL that SQLGuard has already rewritten (column allowlist, region filter as a bind parameter)
+                 and whose outermost SELECT aggregates is transpiled to DuckDB; anything else returns None
+                 and runs on Postgres as before
+        verify   verify_against() runs VERIFY_QUERIES for each role on both and compares the results
+
+    The mirror is outside Postgres RLS and the cost guard's EXPLAIN: the region filter and column checks come
+    only from SQLGuard, exactly as in the SQL sent to Postgres, so it must only be given SQL returned by
+    SQLGuard.rewrite(). A role's queries are only routed here if its ROLES_PERMISSIONS entry has
+    "analytics_mirror": True (see serves()).
+    """
+
+    def __init__(self, path: str, max_entries: int = 1024, roles_permissions: Optional[Dict[str, Any]] = None):
+        if duckdb is None:
+            raise RuntimeError("duckdb is not installed; pip install duckdb to use the analytics mirror")
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"Analytics mirror not found at {path}; run load_db.py or build_mirror_from_db()")
+        self.path = path
+        self.max_entries = max_entries
+        self.roles_permissions = roles_permissions or ROLES_PERMISSIONS
+        self._lock = threading.Lock()
+        self._routes: "OrderedDict[str, Optional[str]]" = OrderedDict()
+        self._stats = {"served": 0, "role_not_enabled": 0, "not_aggregate": 0, "errors": 0, "query_ms_total": 0.0}
+        self._connection = None
+        self._mtime = None
+        self._open()
+
+    def _open(self) -> None:
+        mtime = os.path.getmtime(self.path)
+        # The file is attached to a new in-memory database each time: duckdb.connect(path) would hand back the
+        # cached instance of the replaced file while any cursor on it is still open.
+        connection = duckdb.connect()
+        connection.execute(f"ATTACH '{self.path.replace(chr(39), chr(39) * 2)}' AS {_MIRROR_CATALOG} (READ_ONLY)")
+        # The previous connection is dropped, not closed: closing it would also close the cursors other threads
+        # are still reading results from. The old file is released when the last of them is closed.
+        self._connection, self._mtime = connection, mtime
+        rows = connection.execute(f"SELECT COUNT(*) FROM {_MIRROR_CATALOG}.{MIRROR_TABLE}").fetchone()[0]
+        logger.info(f"Analytics mirror opened at {self.path} ({rows} rows).")
+
+    def _cursor(self) -> Any:
+        with self._lock:
+            if os.path.getmtime(self.path) != self._mtime:
+                self._open()
+            cursor = self._connection.cursor()  # own connection to the same database, safe to use from this thread
+        cursor.execute(f"USE {_MIRROR_CATALOG}")  # the default catalog is per connection
+        return cursor
+
+    def serves(self, user_role: str) -> bool:
+        """True if the role opted in to the mirror, accepting SQLGuard's filters in place of RLS and the cost guard."""
+        return bool(self.roles_permissions.get(user_role, {}).get("analytics_mirror", False))
+
+    def route(self, sql: str) -> Optional[str]:
+        """DuckDB SQL for counted_sql(sql) if sql is an aggregate over the mirrored table, else None."""
+        with self._lock:
+            if sql in self._routes:
+                self._routes.move_to_end(sql)
+                return self._routes[sql]
+        mirror_sql = None
+        try:
+            tree = sqlglot.parse_one(sql, read="postgres")
+            tables = {table.name.lower() for table in tree.find_all(exp.Table)}
+            if is_aggregate(tree) and tables == {MIRROR_TABLE}:
+                counted = sqlglot.parse_one(counted_sql(sql), read="postgres")
+                query = counted.find(exp.Subquery).this
+                for projection in query.expressions:
+                    # DuckDB names AVG(x) "avg(x)", Postgres "avg"; keep the Postgres column names the agent sees
+                    if not isinstance(projection, (exp.Alias, exp.Column, exp.Star)):
+                        projection.replace(exp.alias_(projection.copy(), _postgres_column_name(projection), quoted=True))
+                for cast in counted.find_all(exp.Cast):
+                    # Postgres NUMERIC without a precision is exact; DuckDB's bare DECIMAL is DECIMAL(18,3), which
+                    # would round ROUND(CAST(AVG(x) AS DECIMAL), 2) twice
+                    if cast.to.is_type(exp.DataType.Type.DECIMAL) and not cast.to.expressions:
+                        cast.set("to", exp.DataType.build("DECIMAL(38, 10)", dialect="duckdb"))
+                mirror_sql = counted.sql(dialect="duckdb")
+        except SqlglotError as e:
+            logger.warning(f"AnalyticsMirror could not transpile SQL, using Postgres: {e}")
+        with self._lock:
+            self._routes[sql] = mirror_sql
+            while len(self._routes) > self.max_entries:
+                self._routes.popitem(last=False)
+        return mirror_sql
+
+    def execute(self, mirror_sql: str, params: Dict[str, Any], timeout_ms: int = 0) -> _MirrorResult:
+        """Runs route()'s SQL; timeout_ms interrupts it like statement_timeout would."""
+        cursor = self._cursor()
+        timer = None
+        if timeout_ms > 0:
+            timer = threading.Timer(timeout_ms / 1000, cursor.interrupt)
+            timer.daemon = True
+            timer.start()
+        try:
+            cursor.execute(mirror_sql, {key: value for key, value in params.items() if key == REGION_PARAM})
+        except Exception:
+            if timer is not None:
+                timer.cancel()
+            cursor.close()
+            raise
+        return _MirrorResult(cursor, timer)
+
+    def record(self, outcome: str, elapsed_ms: float = 0.0) -> None:
+        with self._lock:
+            self._stats[outcome] += 1
+            self._stats["query_ms_total"] += elapsed_ms
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["query_ms_avg"] = round(stats.pop("query_ms_total") / stats["served"], 2) if stats["served"] else 0.0
+        return {"path": self.path, "routes": len(self._routes), **stats}
+
+    # --- Verification against Postgres ---
+    def verify_against(self, engine: Any, sql_guard: Optional[SQLGuard] = None,
+                       queries: Sequence[str] = VERIFY_QUERIES, roles: Sequence[Tuple[str, Optional[str]]] = VERIFY_ROLES) -> List[Dict[str, Any]]:
+        """
+        Runs each query through SQLGuard for each (role, region) on Postgres and on the mirror; returns one
+        report per pair with both timings and whether the results are equal (same column names, floats
+        within 1e-9 relative).
+        """
+        sql_guard = sql_guard or SQLGuard()
+        reports = []
+        for user_role, user_region in roles:
+            for query in queries:
+                report = {"role": user_role, "region": user_region, "sql": query}
+                try:
+                    sql, params = sql_guard.rewrite(query, user_role, user_region)
+                except ValueError as e:  # e.g. a column this role may not read
+                    reports.append({**report, "skipped": str(e)})
+                    continue
+                mirror_sql = self.route(sql)
+                start = time.perf_counter()
+                with engine.connect() as connection:
+                    postgres_result = connection.execute(text(counted_sql(sql)), params)
+                    postgres_columns = list(postgres_result.keys())
+                    postgres_rows = [tuple(row) for row in postgres_result]
+                postgres_ms = (time.perf_counter() - start) * 1000
+                start = time.perf_counter()
+                result = self.execute(mirror_sql, params)
+                try:
+                    mirror_columns = result.keys()
+                    mirror_rows = result.fetchmany(len(postgres_rows) + 1)
+                finally:
+                    result.close()
+                mirror_ms = (time.perf_counter() - start) * 1000
+                ordered = sqlglot.parse_one(sql, read="postgres").args.get("order") is not None
+                reports.append({**report, "rows": len(postgres_rows), "equal": postgres_columns == mirror_columns and _same_rows(postgres_rows, mirror_rows, ordered),
+                                "postgres_ms": round(postgres_ms, 2), "mirror_ms": round(mirror_ms, 2)})
+        return reports
+
+
+def fixture_frame(rows: int = 240) -> pd.DataFrame:
+    """A small deterministic supply_chain sample with every column VERIFY_QUERIES reads, and some NULLs."""
+    return pd.DataFrame({
+        "order_id": [i // 2 for i in range(rows)],
+        "order_country": [_FIXTURE_COUNTRIES[i % len(_FIXTURE_COUNTRIES)] for i in range(rows)],
+        "market": [["Europe", "LATAM", "Pacific Asia", "USCA"][i % 4] for i in range(rows)],
+        "shipping_mode": [["Standard Class", "First Class", "Second Class", "Same Day"][i % 7 % 4] for i in range(rows)],
+        "order_status": [["COMPLETE", "PENDING", "CLOSED"][i % 3] for i in range(rows)],
+        "category_name": [["Cleats", "Fishing", "Cameras"][i % 11 % 3] for i in range(rows)],
+        "late_delivery_risk": [i % 5 % 2 for i in range(rows)],
+        "order_item_quantity": pd.array([None if i % 17 == 0 else i % 5 + 1 for i in range(rows)], dtype="Int64"),
+        "sales": pd.array([None if i % 23 == 0 else round(19.99 * (i % 13 + 1) + i / 7, 2) for i in range(rows)], dtype="Float64"),
+        "order_date": pd.to_datetime("2017-01-01") + pd.to_timedelta([i * 37 % 700 for i in range(rows)], unit="D"),
+    })
+
+
+def check(sql_guard: Optional[SQLGuard] = None, queries: Sequence[str] = VERIFY_QUERIES,
+          roles: Sequence[Tuple[str, Optional[str]]] = VERIFY_ROLES) -> List[Dict[str, Any]]:
+    """
+    Checks the mirror path without a database: each query goes through SQLGuard.rewrite(), route() and
+    execute() on a mirror built from fixture_frame(), and is compared with the unguarded query run directly
+    on a DuckDB table holding only the region's rows. Catches region filter, bind parameter and transpile
+    regressions. Differences from Postgres (numeric types, DATE_TRUNC / EXTRACT results, column names) are
+    out of its scope: verify_against() compares those, repeatably in backend/benchmarks/bench_analytics_mirror.py.
+    """
+    sql_guard = sql_guard or SQLGuard()
+    df = fixture_frame()
+    reports = []
+    with tempfile.TemporaryDirectory() as directory:
+        build_mirror(df, os.path.join(directory, "fixture.duckdb"))
+        mirror = AnalyticsMirror(os.path.join(directory, "fixture.duckdb"))
+        for user_role, user_region in roles:
+            region_df = df if user_region is None else df[df["order_country"].str.lower() == user_region.lower()]
+            reference = duckdb.connect()
+            reference.register(MIRROR_TABLE, region_df)
+            for query in queries:
+                report = {"role": user_role, "region": user_region, "sql": query}
+                try:
+                    sql, params = sql_guard.rewrite(query, user_role, user_region)
+                except ValueError as e:  # e.g. a column this role may not read
+                    reports.append({**report, "skipped": str(e)})
+                    continue
+                expected = reference.execute(sqlglot.transpile(counted_sql(query), read="postgres", write="duckdb")[0]).fetchall()
+                mirror_sql = mirror.route(sql)
+                if mirror_sql is None:
+                    reports.append({**report, "rows": len(expected), "equal": False})
+                    continue
+                result = mirror.execute(mirror_sql, params)
+                try:
+                    actual = result.fetchmany(len(expected) + 1)
+                finally:
+                    result.close()
+                ordered = sqlglot.parse_one(sql, read="postgres").args.get("order") is not None
+                reports.append({**report, "rows": len(expected), "equal": _same_rows(expected, actual, ordered)})
+            reference.close()
+    return reports
+
+
+def print_reports(reports: Sequence[Dict[str, Any]]) -> int:
+    """Prints one line per report; returns the number of mismatches."""
+    mismatches = 0
+    for report in reports:
+        if "skipped" in report:
+            print(f"SKIP  {report['role']:<26} {report['sql'][:70]}  ({report['skipped']})")
+            continue
+        mismatches += not report["equal"]
+        timings = f"postgres {report['postgres_ms']:7.2f} ms  mirror {report['mirror_ms']:7.2f} ms  " if "mirror_ms" in report else ""
+        print(f"{'OK  ' if report['equal'] else 'DIFF'}  {report['role']:<26} {report['rows']:>4} rows  {timings}{report['sql'][:70]}")
+    return mismatches
+
+
+def _postgres_column_name(projection: exp.Expression) -> str:
+    """The name Postgres gives an unaliased output column: the column or function name, else ?column?."""
+    node = projection
+    while isinstance(node, exp.Cast):
+        node = node.this
+    if isinstance(node, exp.Column):
+        return node.name
+    if isinstance(node, exp.Func):
+        return node.sql(dialect="postgres").split("(", 1)[0].strip().lower()
+    return "?column?"
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, (decimal.Decimal, float)) or (isinstance(value, int) and not isinstance(value, bool)):
+        return float(value)
+    if isinstance(value, datetime.datetime):
+        return value.replace(tzinfo=None)
+    return value
+
+
+def _sort_key(row: Tuple[Any, ...]) -> Tuple[Any, ...]:
+    return tuple((value is None, str(value)) for value in row)
+
+
+def _same_rows(expected: Sequence[Tuple[Any, ...]], actual: Sequence[Tuple[Any, ...]], ordered: bool) -> bool:
+    if len(expected) != len(actual):
+        return False
+    expected = [tuple(_normalize(value) for value in row) for row in expected]
+    actual = [tuple(_normalize(value) for value in row) for row in actual]
+    if not ordered:  # without ORDER BY the engines may return groups in any order
+        expected, actual = sorted(expected, key=_sort_key), sorted(actual, key=_sort_key)
+    for expected_row, actual_row in zip(expected, actual):
+        for a, b in zip(expected_row, actual_row):
+            if isinstance(a, float) and isinstance(b, float):
+                if not (math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9) or (math.isnan(a) and math.isnan(b))):
+                    return False
+            elif a != b:
+                return False
+    return True
+
+
+if __name__ == "__main__":
+    import argparse
+    from sqlalchemy import create_engine
+    from backend.config import DATABASE_URL, ANALYTICS_MIRROR_PATH
+
+    parser = argparse.ArgumentParser(description="Build the DuckDB analytics mirror from Postgres, verify it against "
+                                                 "Postgres, or check the mirror path on a built-in fixture (no database).")
+    parser.add_argument("command", choices=["build", "verify", "check"])
+    parser.add_argument("--path", default=ANALYTICS_MIRROR_PATH)
+    args = parser.parse_args()
+
+    if args.command == "check":
+        sys.exit(1 if print_reports(check()) else 0)
+    db_engine = create_engine(DATABASE_URL)
+    if args.command == "build":
+        build_mirror_from_db(db_engine, args.path)
+    else:
+        sys.exit(1 if print_reports(AnalyticsMirror(args.path).verify_against(db_engine)) else 0)
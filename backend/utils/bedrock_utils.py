@@ -1,18 +1,33 @@
+import asyncio
 import requests
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pydantic import BaseModel, Field, ConfigDict, field_validator
-from typing import List, Any, Dict, Optional
+from typing import List, Any, AsyncIterator, Dict, Iterator, Optional, Tuple
 
 from langchain.llms.base import BaseLLM
 from langchain.embeddings.base import Embeddings
-from langchain_core.outputs import Generation, LLMResult
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.outputs import Generation, GenerationChunk, LLMResult
 
 
 import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))) 
 from backend.logger_config import logger
-from backend.config import BEDROCK_LLM_LAMBDA_URL, BEDROCK_EMBEDDING_LAMBDA_URL, BEDROCK_EMBEDDING_MODEL_ID
+from backend.config import (
+    BEDROCK_LLM_LAMBDA_URL, BEDROCK_EMBEDDING_LAMBDA_URL, BEDROCK_EMBEDDING_MODEL_ID,
+    LAMBDA_CONNECT_TIMEOUT, LLM_READ_TIMEOUT, EMBEDDING_READ_TIMEOUT,
+    EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_MAX_CHARS, EMBEDDING_MAX_CONCURRENCY, EMBEDDING_REQUESTS_PER_SECOND,
+    EMBEDDING_MAX_RETRIES, EMBEDDING_BACKOFF_BASE, EMBEDDING_BACKOFF_MAX, LLM_STREAMING
+)
+from backend.utils.lambda_transport import (
+    get_lambda_session, post_with_retries, TokenBucket, apost, apost_stream, apost_with_retries, LambdaHTTPError,
+    ASYNC_TRANSPORT_ERRORS
+)
+from backend.utils.embedding_cache import EmbeddingCache
+from backend.utils.llm_cache import LLMResponseCache, is_deterministic
 
 
 class BedrockLLMConfig(BaseModel):
@@ -21,51 +36,184 @@ class BedrockLLMConfig(BaseModel):
     api_key: str = Field(..., description="The API key for Bedrock authentication")
     llm_lambda_url: str = Field(..., description="Lambda URL for LLM inference")
     model_kwargs: Dict[str, Any] = Field(default_factory=lambda: {"max_tokens": 1024, "temperature": 0.7})
+    connect_timeout: float = Field(LAMBDA_CONNECT_TIMEOUT, description="Seconds allowed to establish a connection to the Lambda")
+    read_timeout: float = Field(LLM_READ_TIMEOUT, description="Seconds allowed to wait for the Lambda response")
+    streaming: bool = Field(LLM_STREAMING, description="Request newline-delimited JSON chunks when callbacks listen for tokens")
+
+
+# Content types of a streamed Lambda response; anything else is the regular single JSON body.
+STREAM_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl", "text/event-stream")
 
 
 class BedrockLLM(BaseLLM):
-    model_config = ConfigDict(protected_namespaces=())
+    model_config = ConfigDict(protected_namespaces=(), arbitrary_types_allowed=True)
     config: BedrockLLMConfig
+    response_cache: Optional[LLMResponseCache] = None
 
-    def __init__(self, *, config: BedrockLLMConfig):
-        super().__init__(config=config)
+    def __init__(self, *, config: BedrockLLMConfig, response_cache: Optional[LLMResponseCache] = None):
+        super().__init__(config=config, response_cache=response_cache)
 
-    def _generate(self, prompts: List[str], stop: Optional[List[str]] = None, **kwargs: Any) -> LLMResult:
+    def _generate(self, prompts: List[str], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> LLMResult:
+        # LangChain only forwards runtime kwargs (temperature, cache_site, ...) when run_manager is accepted.
+        # cache_site labels the caller in the response cache counters; it is not a model parameter.
+        cache_site = kwargs.pop("cache_site", "default")
         generations = []
         for prompt in prompts:
-            # Merge kwargs from config and runtime
-            current_model_kwargs = {**self.config.model_kwargs, **kwargs}
-            if stop: # Langchain stop sequences
-                current_model_kwargs['stop_sequences'] = stop
-
-            response_text = self._call(prompt, model_kwargs=current_model_kwargs)
+            response_text = "".join(chunk.text for chunk in self._completion_chunks(prompt, stop, cache_site, kwargs, run_manager))
             generations.append([Generation(text=response_text)])
         return LLMResult(generations=generations)
 
-    def _call(self, prompt: str, model_kwargs: Optional[Dict[str, Any]] = None) -> str:
-        payload = {
+    async def _agenerate(self, prompts: List[str], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> LLMResult:
+        """Async version of _generate: prompts are sent concurrently over the event loop's aiohttp session."""
+        cache_site = kwargs.pop("cache_site", "default")
+
+        async def generate_one(prompt: str) -> str:
+            return "".join([chunk.text async for chunk in self._acompletion_chunks(prompt, stop, cache_site, kwargs, run_manager)])
+
+        texts = await asyncio.gather(*(generate_one(prompt) for prompt in prompts))
+        return LLMResult(generations=[[Generation(text=text)] for text in texts])
+
+    # LangChain's stream()/astream() call these, and AgentExecutor streams every ReAct step, so they are the
+    # agent's regular path too: without config.streaming they return the cached or plain response as one chunk.
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        cache_site = kwargs.pop("cache_site", "default")
+        yield from self._completion_chunks(prompt, stop, cache_site, kwargs, run_manager)
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> AsyncIterator[GenerationChunk]:
+        cache_site = kwargs.pop("cache_site", "default")
+        async for chunk in self._acompletion_chunks(prompt, stop, cache_site, kwargs, run_manager):
+            yield chunk
+
+    def _completion_chunks(self, prompt: str, stop: Optional[List[str]], cache_site: str, kwargs: Dict[str, Any],
+                           run_manager: Optional[CallbackManagerForLLMRun]) -> Iterator[GenerationChunk]:
+        """
+        One prompt's completion: a cached response, the Lambda's streamed chunks (config.streaming with a
+        callback listener), or the regular single response. Listeners get every chunk via on_llm_new_token
+        when streaming is on.
+        """
+        streaming = self.config.streaming and run_manager is not None
+        current_model_kwargs, cache_key, cached_text = self._prepare_call(prompt, stop, cache_site, kwargs)
+        if cached_text is not None:
+            if streaming:
+                run_manager.on_llm_new_token(cached_text)
+            yield GenerationChunk(text=cached_text)
+            return
+
+        if streaming:
+            parts = []
+            for chunk in self._stream_call(prompt, current_model_kwargs, run_manager):
+                parts.append(chunk.text)
+                yield chunk
+            response_text = "".join(parts)
+        else:
+            response_text = self._call(prompt, model_kwargs=current_model_kwargs)
+            yield GenerationChunk(text=response_text)
+        if cache_key is not None:
+            self.response_cache.put(cache_key, response_text)
+
+    async def _acompletion_chunks(self, prompt: str, stop: Optional[List[str]], cache_site: str, kwargs: Dict[str, Any],
+                                  run_manager: Optional[AsyncCallbackManagerForLLMRun]) -> AsyncIterator[GenerationChunk]:
+        """Async _completion_chunks; the response cache's SQLite tier is used from a worker thread."""
+        streaming = self.config.streaming and run_manager is not None
+        current_model_kwargs, cache_key, cached_text = await asyncio.to_thread(self._prepare_call, prompt, stop, cache_site, kwargs)
+        if cached_text is not None:
+            if streaming:
+                await run_manager.on_llm_new_token(cached_text)
+            yield GenerationChunk(text=cached_text)
+            return
+
+        if streaming:
+            parts = []
+            async for chunk in self._astream_call(prompt, current_model_kwargs, run_manager):
+                parts.append(chunk.text)
+                yield chunk
+            response_text = "".join(parts)
+        else:
+            response_text = await self._acall(prompt, model_kwargs=current_model_kwargs)
+            yield GenerationChunk(text=response_text)
+        if cache_key is not None:
+            await asyncio.to_thread(self.response_cache.put, cache_key, response_text)
+
+    def _prepare_call(self, prompt: str, stop: Optional[List[str]], cache_site: str,
+                      kwargs: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[str], Optional[str]]:
+        """Returns (model kwargs, cache key or None, cached response or None) for one prompt."""
+        current_model_kwargs = self._model_kwargs(stop, kwargs)
+        cache_key = None
+        if self.response_cache is not None:
+            if is_deterministic(current_model_kwargs):
+                cache_key = LLMResponseCache.make_key(self.config.model_id, prompt, current_model_kwargs, stop)
+                cached_text = self.response_cache.get(cache_key, site=cache_site)
+                if cached_text is not None:
+                    logger.debug(f"BedrockLLM response cache hit for site '{cache_site}'.")
+                    return current_model_kwargs, cache_key, cached_text
+            else:
+                self.response_cache.record_bypass(site=cache_site)
+        return current_model_kwargs, cache_key, None
+
+    def _model_kwargs(self, stop: Optional[List[str]], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        # Merge kwargs from config and runtime
+        current_model_kwargs = {**self.config.model_kwargs, **kwargs}
+        if stop: # Langchain stop sequences
+            current_model_kwargs['stop_sequences'] = stop
+        return current_model_kwargs
+
+    def _build_payload(self, prompt: str, model_kwargs: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
             "api_key": self.config.api_key,
             "prompt": prompt,
             "model_id": self.config.model_id,
             "model_params": model_kwargs or self.config.model_kwargs,
         }
+
+    @staticmethod
+    def _extract_text(response_data: Dict[str, Any]) -> str:
+        if "response" in response_data:
+            if isinstance(response_data["response"], dict) and "content" in response_data["response"] and \
+               isinstance(response_data["response"]["content"], list) and len(response_data["response"]["content"]) > 0 and \
+               "text" in response_data["response"]["content"][0]:
+                return response_data["response"]["content"][0]["text"]
+            elif isinstance(response_data["response"], str): # Simpler Lambda response
+                 return response_data["response"]
+
+        logger.error(f"Unexpected BedrockLLM Lambda response format: {response_data}")
+        raise ValueError("Unexpected BedrockLLM Lambda response format")
+
+    @staticmethod
+    def _extract_delta(line: str) -> str:
+        """
+        Returns the text of one streamed line: {"text": "..."} from the proxy, or a Bedrock/Anthropic
+        content_block_delta event passed through as-is. SSE "data:" prefixes are accepted; other events
+        (message_start, message_stop, "[DONE]") carry no text.
+        """
+        line = line.strip()
+        if line.startswith("data:"):
+            line = line[len("data:"):].strip()
+        if not line or line == "[DONE]" or line.startswith(("event:", ":")):
+            return ""
+        event = json.loads(line)
+        if isinstance(event.get("text"), str):
+            return event["text"]
+        delta = event.get("delta")
+        if isinstance(delta, dict) and isinstance(delta.get("text"), str):
+            return delta["text"]
+        return ""
+
+    def _call(self, prompt: str, model_kwargs: Optional[Dict[str, Any]] = None) -> str:
+        payload = self._build_payload(prompt, model_kwargs)
         logger.debug(f"BedrockLLM sending payload to {self.config.llm_lambda_url}: {payload['model_id']}, prompt length: {len(prompt)}")
         
         try:
-            resp = requests.post(self.config.llm_lambda_url, json=payload, headers={"Content-Type": "application/json"}, timeout=300) # Increased timeout
+            resp = get_lambda_session().post(
+                self.config.llm_lambda_url,
+                json=payload,
+                timeout=(self.config.connect_timeout, self.config.read_timeout)
+            )
             resp.raise_for_status()  # Raises HTTPError for bad responses (4XX or 5XX)
-            
-            response_data = resp.json()
-            if "response" in response_data:
-                if isinstance(response_data["response"], dict) and "content" in response_data["response"] and \
-                   isinstance(response_data["response"]["content"], list) and len(response_data["response"]["content"]) > 0 and \
-                   "text" in response_data["response"]["content"][0]:
-                    return response_data["response"]["content"][0]["text"]
-                elif isinstance(response_data["response"], str): # Simpler Lambda response
-                     return response_data["response"]
-            
-            logger.error(f"Unexpected BedrockLLM Lambda response format: {response_data}")
-            raise ValueError("Unexpected BedrockLLM Lambda response format")
+            return self._extract_text(resp.json())
 
         except requests.exceptions.HTTPError as e:
             logger.error(f"{e.response.status_code} error from BedrockLLM Lambda: {e.response.text}")
@@ -77,51 +225,205 @@ class BedrockLLM(BaseLLM):
             logger.error(f"Error processing BedrockLLM Lambda response: {e}. Response text: {resp.text if 'resp' in locals() else 'N/A'}")
             raise RuntimeError(f"Error processing BedrockLLM Lambda response: {e}") from e
 
+    def _stream_call(self, prompt: str, model_kwargs: Dict[str, Any],
+                     run_manager: Optional[CallbackManagerForLLMRun] = None) -> Iterator[GenerationChunk]:
+        """
+        Sends the prompt with "stream": true and yields the text as it arrives. A proxy that does not
+        stream answers with its regular JSON body, which is yielded as a single chunk.
+        """
+        payload = {**self._build_payload(prompt, model_kwargs), "stream": True}
+        logger.debug(f"BedrockLLM streaming payload to {self.config.llm_lambda_url}: {payload['model_id']}, prompt length: {len(prompt)}")
+
+        try:
+            with get_lambda_session().post(
+                self.config.llm_lambda_url,
+                json=payload,
+                timeout=(self.config.connect_timeout, self.config.read_timeout),
+                stream=True
+            ) as resp:
+                resp.raise_for_status()
+                if resp.headers.get("Content-Type", "").split(";")[0].strip() in STREAM_CONTENT_TYPES:
+                    texts = (self._extract_delta(line.decode("utf-8")) for line in resp.iter_lines() if line)
+                else:
+                    texts = iter([self._extract_text(resp.json())])
+                for text in texts:
+                    if text:
+                        chunk = GenerationChunk(text=text)
+                        if run_manager is not None:
+                            run_manager.on_llm_new_token(text, chunk=chunk)
+                        yield chunk
+
+        except requests.exceptions.HTTPError as e:
+            logger.error(f"{e.response.status_code} error from BedrockLLM Lambda: {e.response.text}")
+            raise ValueError(f"{e.response.status_code} error from BedrockLLM Lambda: {e.response.text}") from e
+        except requests.exceptions.RequestException as e:
+            logger.error(f"RequestException streaming from BedrockLLM Lambda: {e}")
+            raise RuntimeError(f"RequestException streaming from BedrockLLM Lambda: {e}") from e
+        except (json.JSONDecodeError, KeyError, IndexError, ValueError) as e:
+            logger.error(f"Error processing streamed BedrockLLM Lambda response: {e}")
+            raise RuntimeError(f"Error processing BedrockLLM Lambda response: {e}") from e
+
+    async def _astream_call(self, prompt: str, model_kwargs: Dict[str, Any],
+                            run_manager: Optional[AsyncCallbackManagerForLLMRun] = None) -> AsyncIterator[GenerationChunk]:
+        """Async _stream_call over the event loop's aiohttp session."""
+        payload = {**self._build_payload(prompt, model_kwargs), "stream": True}
+        logger.debug(f"BedrockLLM (async) streaming payload to {self.config.llm_lambda_url}: {payload['model_id']}, prompt length: {len(prompt)}")
+
+        try:
+            async with apost_stream(
+                self.config.llm_lambda_url,
+                json=payload,
+                timeout=(self.config.connect_timeout, self.config.read_timeout)
+            ) as resp:
+                if resp.content_type in STREAM_CONTENT_TYPES:
+                    async for line in resp.content:
+                        text = self._extract_delta(line.decode("utf-8"))
+                        if text:
+                            chunk = GenerationChunk(text=text)
+                            if run_manager is not None:
+                                await run_manager.on_llm_new_token(text, chunk=chunk)
+                            yield chunk
+                else:
+                    text = self._extract_text(json.loads(await resp.text()))
+                    chunk = GenerationChunk(text=text)
+                    if run_manager is not None:
+                        await run_manager.on_llm_new_token(text, chunk=chunk)
+                    yield chunk
+
+        except LambdaHTTPError as e:
+            logger.error(f"{e.response.status_code} error from BedrockLLM Lambda: {e.response.text}")
+            raise ValueError(f"{e.response.status_code} error from BedrockLLM Lambda: {e.response.text}") from e
+        except ASYNC_TRANSPORT_ERRORS as e:
+            logger.error(f"Request error streaming from BedrockLLM Lambda: {e!r}")
+            raise RuntimeError(f"Request error streaming from BedrockLLM Lambda: {e!r}") from e
+        except (json.JSONDecodeError, KeyError, IndexError, ValueError) as e:
+            logger.error(f"Error processing streamed BedrockLLM Lambda response: {e}")
+            raise RuntimeError(f"Error processing BedrockLLM Lambda response: {e}") from e
+
+    async def _acall(self, prompt: str, model_kwargs: Optional[Dict[str, Any]] = None) -> str:
+        payload = self._build_payload(prompt, model_kwargs)
+        logger.debug(f"BedrockLLM (async) sending payload to {self.config.llm_lambda_url}: {payload['model_id']}, prompt length: {len(prompt)}")
+
+        try:
+            resp = await apost(
+                self.config.llm_lambda_url,
+                json=payload,
+                timeout=(self.config.connect_timeout, self.config.read_timeout)
+            )
+            resp.raise_for_status()
+            return self._extract_text(resp.json())
+
+        except LambdaHTTPError as e:
+            logger.error(f"{e.response.status_code} error from BedrockLLM Lambda: {e.response.text}")
+            raise ValueError(f"{e.response.status_code} error from BedrockLLM Lambda: {e.response.text}") from e
+        except ASYNC_TRANSPORT_ERRORS as e:
+            logger.error(f"Request error calling BedrockLLM Lambda: {e!r}")
+            raise RuntimeError(f"Request error calling BedrockLLM Lambda: {e!r}") from e
+        except (json.JSONDecodeError, KeyError, IndexError, ValueError) as e:
+            logger.error(f"Error processing BedrockLLM Lambda response: {e}. Response text: {resp.text if 'resp' in locals() else 'N/A'}")
+            raise RuntimeError(f"Error processing BedrockLLM Lambda response: {e}") from e
+
 
     @property
     def _llm_type(self) -> str:
         return "bedrock_lambda_llm"
 
 
+class EmbeddingBatchRejectedError(ValueError):
+    """Raised when the embedding Lambda refuses a batched request (HTTP 400/413/422)."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class EmbeddingBatchUnsupportedError(EmbeddingBatchRejectedError):
+    """Raised when the embedding Lambda does not understand the batch payload at all."""
+
+
+class EmbeddingBatchServerError(ValueError):
+    """Raised when the embedding Lambda fails a batched request with a 5xx after its retries."""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
 class AmazonEmbeddings(Embeddings):
     api_key: str
     model_id: str
     embedding_lambda_url: str
+    connect_timeout: float
+    read_timeout: float
+    batch_size: int
+    max_batch_chars: int
+    max_concurrency: int
+    max_retries: int
 
-    def __init__(self, api_key: str, model_id: str = BEDROCK_EMBEDDING_MODEL_ID, embedding_lambda_url: str = BEDROCK_EMBEDDING_LAMBDA_URL):
+    def __init__(self, api_key: str, model_id: str = BEDROCK_EMBEDDING_MODEL_ID, embedding_lambda_url: str = BEDROCK_EMBEDDING_LAMBDA_URL,
+                 connect_timeout: float = LAMBDA_CONNECT_TIMEOUT, read_timeout: float = EMBEDDING_READ_TIMEOUT,
+                 batch_size: int = EMBEDDING_BATCH_SIZE, max_batch_chars: int = EMBEDDING_BATCH_MAX_CHARS,
+                 max_concurrency: int = EMBEDDING_MAX_CONCURRENCY, requests_per_second: float = EMBEDDING_REQUESTS_PER_SECOND,
+                 max_retries: int = EMBEDDING_MAX_RETRIES, cache: Optional[EmbeddingCache] = None):
         super().__init__()
         if not all([api_key, model_id, embedding_lambda_url]):
             raise ValueError("API key, model ID, and Lambda URL for embeddings must be provided.")
         self.api_key = api_key
         self.model_id = model_id
         self.embedding_lambda_url = embedding_lambda_url
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.batch_size = max(1, batch_size)
+        self.max_batch_chars = max_batch_chars
+        self._batch_supported: Optional[bool] = None  # None until a batch succeeds or the proxy refuses them
+        self._batch_probe_lock = threading.Lock()
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self._rate_limiter = TokenBucket(requests_per_second)
+        self.cache = cache
 
-    def _get_embedding(self, text: str) -> List[float]:
-        payload = {
+    def _post(self, payload: Dict[str, Any], max_retries: Optional[int] = None) -> requests.Response:
+        """Sends one embedding request, rate limited and retried on 429/5xx with jittered backoff."""
+        return post_with_retries(
+            self.embedding_lambda_url,
+            data=json.dumps(payload),
+            timeout=(self.connect_timeout, self.read_timeout),
+            max_retries=self.max_retries if max_retries is None else max_retries,
+            backoff_base=EMBEDDING_BACKOFF_BASE,
+            backoff_max=EMBEDDING_BACKOFF_MAX,
+            rate_limiter=self._rate_limiter
+        )
+
+    def _embedding_payload(self, text: str) -> Dict[str, Any]:
+        return {
             "api_key": self.api_key,
             "prompt": text, # Or "inputText" depending on Bedrock model
             "model_id": self.model_id
         }
-        headers = {"Content-Type": "application/json"}
+
+    @staticmethod
+    def _extract_embedding(response_data: Dict[str, Any], text: str) -> List[float]:
+        if "response" in response_data and "embedding" in response_data["response"]:
+            embedding = response_data["response"]["embedding"]
+        elif "embedding" in response_data: # Simpler Lambda response
+            embedding = response_data["embedding"]
+        else:
+            logger.error(f"Unexpected AmazonEmbeddings Lambda response format: {response_data}")
+            raise ValueError("Unexpected AmazonEmbeddings Lambda response format")
+
+        if not embedding: 
+            logger.warning(f"Received empty or null embedding for text: '{text[:50]}...'")
+            raise ValueError("Received empty embedding from Lambda.")
+        return embedding
+
+    def _get_embedding(self, text: str) -> List[float]:
+        payload = self._embedding_payload(text)
         logger.debug(f"AmazonEmbeddings requesting embedding for text length: {len(text)} using {self.model_id}")
 
         try:
-            response = requests.post(self.embedding_lambda_url, headers=headers, data=json.dumps(payload), timeout=60)
+            response = self._post(payload)
             response.raise_for_status()
-            
-            response_data = response.json()
-            if "response" in response_data and "embedding" in response_data["response"]:
-                embedding = response_data["response"]["embedding"]
-            elif "embedding" in response_data: # Simpler Lambda response
-                embedding = response_data["embedding"]
-            else:
-                logger.error(f"Unexpected AmazonEmbeddings Lambda response format: {response_data}")
-                raise ValueError("Unexpected AmazonEmbeddings Lambda response format")
-
-            if not embedding: 
-                logger.warning(f"Received empty or null embedding for text: '{text[:50]}...'")
-                raise ValueError("Received empty embedding from Lambda.")
-            return embedding
+            return self._extract_embedding(response.json(), text)
 
         except requests.exceptions.HTTPError as e:
             logger.error(f"{e.response.status_code} error from AmazonEmbeddings Lambda: {e.response.text}")
@@ -133,10 +435,234 @@ class AmazonEmbeddings(Embeddings):
             logger.error(f"Error processing AmazonEmbeddings Lambda response: {e}. Response text: {response.text if 'response' in locals() else 'N/A'}")
             raise RuntimeError(f"Error processing Embedding Lambda response: {e}") from e
 
+    async def _aget_embedding(self, text: str) -> List[float]:
+        payload = self._embedding_payload(text)
+        logger.debug(f"AmazonEmbeddings (async) requesting embedding for text length: {len(text)} using {self.model_id}")
+
+        try:
+            response = await apost_with_retries(
+                self.embedding_lambda_url,
+                data=json.dumps(payload),
+                timeout=(self.connect_timeout, self.read_timeout),
+                max_retries=self.max_retries,
+                backoff_base=EMBEDDING_BACKOFF_BASE,
+                backoff_max=EMBEDDING_BACKOFF_MAX,
+                rate_limiter=self._rate_limiter
+            )
+            response.raise_for_status()
+            return self._extract_embedding(response.json(), text)
+
+        except LambdaHTTPError as e:
+            logger.error(f"{e.response.status_code} error from AmazonEmbeddings Lambda: {e.response.text}")
+            raise ValueError(f"Embedding Lambda HTTP error: {e.response.status_code} {e.response.text}") from e
+        except ASYNC_TRANSPORT_ERRORS as e:
+            logger.error(f"Request error calling AmazonEmbeddings Lambda: {e!r}")
+            raise RuntimeError(f"Embedding Lambda request error: {e!r}") from e
+        except (json.JSONDecodeError, KeyError, ValueError) as e:
+            logger.error(f"Error processing AmazonEmbeddings Lambda response: {e}. Response text: {response.text if 'response' in locals() else 'N/A'}")
+            raise RuntimeError(f"Error processing Embedding Lambda response: {e}") from e
+
+
+    def _get_embeddings_batch(self, texts: List[str], max_retries: Optional[int] = None) -> List[List[float]]:
+        """
+        Embeds several texts in one Lambda round trip.
+
+        The proxy receives {"prompts": [...]} and must answer with {"embeddings": [...]} (optionally
+        nested under "response"), one vector per prompt in the same order.
+        """
+        payload = {
+            "api_key": self.api_key,
+            "prompts": texts,
+            "model_id": self.model_id
+        }
+        logger.debug(f"AmazonEmbeddings requesting batch of {len(texts)} embeddings ({sum(len(t) for t in texts)} chars) using {self.model_id}")
+
+        try:
+            response = self._post(payload, max_retries)
+            if response.status_code in (400, 413, 422):
+                raise EmbeddingBatchRejectedError(f"Embedding Lambda rejected batch of {len(texts)}: {response.status_code} {response.text[:200]}",
+                                                  response.status_code)
+            response.raise_for_status()
+
+            response_data = response.json()
+            if isinstance(response_data.get("response"), dict) and "embeddings" in response_data["response"]:
+                embeddings = response_data["response"]["embeddings"]
+            elif "embeddings" in response_data:
+                embeddings = response_data["embeddings"]
+            else:
+                raise EmbeddingBatchUnsupportedError("Embedding Lambda response has no 'embeddings' list; batching not supported.")
+
+            if not isinstance(embeddings, list) or len(embeddings) != len(texts) or not all(embeddings):
+                raise EmbeddingBatchRejectedError(f"Embedding Lambda returned {len(embeddings) if isinstance(embeddings, list) else 'invalid'} vectors for {len(texts)} texts.")
+            self._batch_supported = True
+            return embeddings
+
+        except requests.exceptions.HTTPError as e:
+            logger.error(f"{e.response.status_code} error from AmazonEmbeddings Lambda (batch): {e.response.text}")
+            if e.response.status_code >= 500:
+                raise EmbeddingBatchServerError(f"Embedding Lambda HTTP error: {e.response.status_code} {e.response.text}",
+                                                e.response.status_code) from e
+            raise ValueError(f"Embedding Lambda HTTP error: {e.response.status_code} {e.response.text}") from e
+        except requests.exceptions.RequestException as e:
+            logger.error(f"RequestException calling AmazonEmbeddings Lambda (batch): {e}")
+            raise RuntimeError(f"Embedding Lambda request error: {e}") from e
+        except json.JSONDecodeError as e:
+            logger.error(f"Error processing AmazonEmbeddings Lambda batch response: {e}. Response text: {response.text if 'response' in locals() else 'N/A'}")
+            raise RuntimeError(f"Error processing Embedding Lambda response: {e}") from e
+
+    def _disable_batching(self, reason: Any) -> None:
+        if self._batch_supported is not False:
+            logger.warning(f"Embedding Lambda does not support batch requests ({reason}). Falling back to one request per text.")
+            self._batch_supported = False
+
+    def _batch_payload_unsupported(self, texts: List[str]) -> bool:
+        """
+        After a 400/422 for a batch, sends the shortest text alone as a batch: if that is refused too, the
+        proxy does not accept the batch payload (two requests to find out, instead of splitting down to
+        every single text). A success only means the batch itself was the problem.
+        """
+        try:
+            self._get_embeddings_batch([min(texts, key=len)], max_retries=0)
+        except EmbeddingBatchUnsupportedError:
+            return True
+        except EmbeddingBatchRejectedError as e:
+            return e.status_code in (400, 422)
+        return False
+
+    def _batch_payload_crashes(self, texts: List[str], reason: Exception) -> bool:
+        """
+        After a 5xx for a batch before any batch has succeeded, sends the shortest text alone as a batch,
+        without retries: a proxy that predates the batch payload (e.g. a Lambda reading event["prompt"])
+        fails it too, and batching is turned off. Concurrent callers wait for the one probe.
+        """
+        with self._batch_probe_lock:
+            if self._batch_supported is None:
+                try:
+                    self._get_embeddings_batch([min(texts, key=len)], max_retries=0)
+                except (ValueError, RuntimeError) as probe_error:
+                    self._disable_batching(f"{reason}; single-text probe: {probe_error}")
+            return self._batch_supported is False
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds a batch, halving it and retrying whenever the proxy rejects the request. Batching is turned
+        off for the process only when the proxy does not accept the batch payload; a rejected single text
+        (e.g. a 413 for an oversized chunk) is sent on its own and fails for that text only. A 5xx is only
+        taken as "unsupported" while no batch has succeeded yet and a single-text probe fails as well.
+        """
+        if self._batch_supported is False:
+            return [self._get_embedding(text) for text in texts]
+        try:
+            return self._get_embeddings_batch(texts)
+        except EmbeddingBatchServerError as e:
+            if self._batch_supported:  # the proxy has answered batches before: a real server error
+                raise
+            if self._batch_payload_crashes(texts, e):
+                return [self._get_embedding(text) for text in texts]
+            return self._embed_batch(texts)  # the probe succeeded, so the failure was transient
+        except EmbeddingBatchUnsupportedError as e:
+            self._disable_batching(e)
+            return [self._get_embedding(text) for text in texts]
+        except EmbeddingBatchRejectedError as e:
+            if len(texts) == 1:
+                logger.warning(f"Embedding Lambda rejected a single-text batch ({e}); sending that text as a single request.")
+                return [self._get_embedding(texts[0])]
+            if e.status_code in (400, 422) and self._batch_payload_unsupported(texts):
+                self._disable_batching(e)
+                return [self._get_embedding(text) for text in texts]
+            middle = len(texts) // 2
+            logger.info(f"Splitting rejected embedding batch of {len(texts)} into {middle} + {len(texts) - middle}: {e}")
+            return self._embed_batch(texts[:middle]) + self._embed_batch(texts[middle:])
+
+    def _make_batches(self, indexed_texts: List[Tuple[int, str]]) -> List[List[Tuple[int, str]]]:
+        """Packs (index, text) pairs into batches bounded by batch_size and max_batch_chars."""
+        batches, current, current_chars = [], [], 0
+        for index, text in indexed_texts:
+            if current and (len(current) >= self.batch_size or current_chars + len(text) > self.max_batch_chars):
+                batches.append(current)
+                current, current_chars = [], 0
+            current.append((index, text))
+            current_chars += len(text)
+        if current:
+            batches.append(current)
+        return batches
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        return [self._get_embedding(text) for text in texts if text and text.strip()]
+        """
+        Embeds texts, returning exactly one vector per input text in input order.
+
+        Blank texts are not sent to the Lambda; they get a zero vector so the result still lines up
+        index-for-index with the input documents.
+        """
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        non_blank = [(i, text) for i, text in enumerate(texts) if text and text.strip()]
+        indexed_texts = non_blank
+
+        if self.cache is not None and non_blank:
+            cached = self.cache.get_many(self.model_id, [text for _, text in non_blank])
+            indexed_texts = []
+            for (i, text), vector in zip(non_blank, cached):
+                if vector is None:
+                    indexed_texts.append((i, text))
+                else:
+                    embeddings[i] = vector
+            logger.info(f"AmazonEmbeddings cache: {len(non_blank) - len(indexed_texts)} of {len(non_blank)} texts served from cache.")
+
+        if self.batch_size <= 1:
+            batches = [[item] for item in indexed_texts]
+            embed_fn = lambda batch: [self._get_embedding(batch[0][1])]
+        else:
+            batches = self._make_batches(indexed_texts)
+            embed_fn = lambda batch: self._embed_batch([text for _, text in batch])
+        logger.info(f"AmazonEmbeddings embedding {len(indexed_texts)} texts in {len(batches)} request(s), up to {self.max_concurrency} in flight.")
+
+        results = []
+        if self.batch_size > 1 and self._batch_supported is None and batches:
+            # Until the proxy has answered a batch, send one alone, so a proxy without batch support fails once
+            results.append(embed_fn(batches[0]))
+        remaining = batches[len(results):]
+        if self.max_concurrency > 1 and len(remaining) > 1:
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(remaining)), thread_name_prefix="embed") as pool:
+                results.extend(pool.map(embed_fn, remaining))  # map() yields results in submission order
+        else:
+            results.extend(embed_fn(batch) for batch in remaining)
+
+        for batch, vectors in zip(batches, results):
+            for (i, _), vector in zip(batch, vectors):
+                embeddings[i] = vector
+        if self.cache is not None and indexed_texts:
+            self.cache.put_many(self.model_id, [text for _, text in indexed_texts], [embeddings[i] for i, _ in indexed_texts])
+
+        blank_count = len(texts) - len(non_blank)
+        if blank_count:
+            if not non_blank:
+                raise ValueError("Cannot embed documents: all texts are empty.")
+            dimension = len(next(vector for vector in embeddings if vector is not None))
+            logger.warning(f"AmazonEmbeddings received {blank_count} blank text(s); using zero vectors to keep results aligned.")
+            embeddings = [vector if vector is not None else [0.0] * dimension for vector in embeddings]
+        return embeddings
+
     def embed_query(self, text: str) -> List[float]:
         if not text or not text.strip():
             raise ValueError("Cannot embed empty query text.")
-        return self._get_embedding(text)
\ No newline at end of file
+        if self.cache is not None:
+            cached = self.cache.get(self.model_id, text)
+            if cached is not None:
+                return cached
+            embedding = self._get_embedding(text)
+            self.cache.put_many(self.model_id, [text], [embedding])
+            return embedding
+        return self._get_embedding(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Async embed_query used by FAISS async retrieval; the file-backed cache is read and appended in a worker thread."""
+        if not text or not text.strip():
+            raise ValueError("Cannot embed empty query text.")
+        if self.cache is not None:
+            cached = await asyncio.to_thread(self.cache.get, self.model_id, text)
+            if cached is not None:
+                return cached
+            embedding = await self._aget_embedding(text)
+            await asyncio.to_thread(self.cache.put_many, self.model_id, [text], [embedding])
+            return embedding
+        return await self._aget_embedding(text)
@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from sqlalchemy import Column, Float, Index, Integer, MetaData, String, Table, Text, create_engine, delete, func, select, tuple_
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.logger_config import logger
+
+DEFAULT_SESSION_ID = "default"
+MAX_SESSION_ID_LENGTH = 128
+
+SessionKey = Tuple[str, str]
+
+_metadata = MetaData()
+conversation_turns = Table(
+    "conversation_turns", _metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("user_sub", String(128), nullable=False),
+    Column("session_id", String(MAX_SESSION_ID_LENGTH), nullable=False),
+    Column("question", Text, nullable=False),
+    Column("answer", Text, nullable=False),
+    Column("created_at", Float, nullable=False),
+    Index("ix_conversation_turns_session", "user_sub", "session_id", "id"),
+)
+
+
+def session_id_from(value: Any) -> str:
+    """Normalizes a client-supplied session ID; a missing one maps to the user's default conversation."""
+    session_id = str(value or "").strip()[:MAX_SESSION_ID_LENGTH]
+    return session_id or DEFAULT_SESSION_ID
+
+
+class ConversationMemoryStore:
+    """
+    Chat history per conversation, keyed by (JWT sub, session ID), replacing one memory shared by every caller.
+
+    Tiers:
+        memory    in-process LRU of up to max_sessions conversations, each holding its last max_turns turns
+        database  optional table `conversation_turns` at database_url (any SQLAlchemy URL, e.g. SQLite or the
+                  Postgres DATABASE_URL), so history survives restarts and is shared by workers; a session
+                  missing from the LRU is reloaded from it
+
+    A conversation idle for longer than idle_seconds is dropped from both tiers. Turns are appended only
+    after an answer, so concurrent requests never see each other's history.
+    """
+
+    def __init__(self, max_turns: int = 5, max_sessions: int = 10000, idle_seconds: float = 3600,
+                 database_url: Optional[str] = None):
+        self.max_turns = max_turns
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[SessionKey, Dict[str, Any]]" = OrderedDict()
+        self._stats = {"hits": 0, "loads": 0, "misses": 0, "evicted_lru": 0, "evicted_idle": 0}
+        self._last_sweep = time.time()
+        self._engine = None
+        if database_url:
+            if database_url.startswith("sqlite:///"):
+                os.makedirs(os.path.dirname(os.path.abspath(database_url[len("sqlite:///"):])), exist_ok=True)
+            self._engine = create_engine(database_url, pool_pre_ping=True)
+            _metadata.create_all(self._engine)
+            logger.info(f"ConversationMemoryStore persisting turns to the conversation_turns table ({self._engine.dialect.name}).")
+
+    def _expired(self, last_used: float, now: float) -> bool:
+        return self.idle_seconds > 0 and now - last_used > self.idle_seconds
+
+    def _get_entry(self, key: SessionKey, now: float) -> Optional[Dict[str, Any]]:
+        entry = self._sessions.get(key)
+        if entry is not None and self._expired(entry["last_used"], now):
+            del self._sessions[key]
+            self._stats["evicted_idle"] += 1
+            entry = None
+        if entry is not None:
+            self._sessions.move_to_end(key)
+            entry["last_used"] = now
+        return entry
+
+    def _put_entry(self, key: SessionKey, turns: Deque[Tuple[str, str]], now: float) -> Dict[str, Any]:
+        entry = {"turns": turns, "last_used": now}
+        self._sessions[key] = entry
+        self._sessions.move_to_end(key)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self._stats["evicted_lru"] += 1
+        return entry
+
+    def _load_turns(self, key: SessionKey, now: float) -> List[Tuple[str, str]]:
+        user_sub, session_id = key
+        query = (select(conversation_turns.c.question, conversation_turns.c.answer, conversation_turns.c.created_at)
+                 .where(conversation_turns.c.user_sub == user_sub, conversation_turns.c.session_id == session_id)
+                 .order_by(conversation_turns.c.id.desc()).limit(self.max_turns))
+        with self._engine.connect() as connection:
+            rows = connection.execute(query).fetchall()
+        if not rows or self._expired(rows[0].created_at, now):
+            return []
+        return [(row.question, row.answer) for row in reversed(rows)]
+
+    def messages(self, user_sub: str, session_id: str) -> List[BaseMessage]:
+        """The conversation's last max_turns turns as alternating Human/AI messages."""
+        key = (str(user_sub), session_id)
+        now = time.time()
+        with self._lock:
+            entry = self._get_entry(key, now)
+            if entry is not None:
+                self._stats["hits"] += 1
+                turns = list(entry["turns"])
+        if entry is None:
+            turns = []
+            if self._engine is not None:
+                try:
+                    turns = self._load_turns(key, now)
+                except Exception as e:
+                    logger.error(f"ConversationMemoryStore could not load session {key}: {e}")
+            with self._lock:
+                self._stats["loads" if turns else "misses"] += 1
+                if turns and key not in self._sessions:
+                    self._put_entry(key, deque(turns, maxlen=self.max_turns), now)
+        messages: List[BaseMessage] = []
+        for question, answer in turns:
+            messages.extend([HumanMessage(content=question), AIMessage(content=answer)])
+        return messages
+
+    def append(self, user_sub: str, session_id: str, question: str, answer: str) -> None:
+        """Records one answered turn, keeping only the last max_turns per conversation."""
+        key = (str(user_sub), session_id)
+        now = time.time()
+        with self._lock:
+            entry = self._get_entry(key, now)
+            if entry is None and self._engine is None:
+                entry = self._put_entry(key, deque(maxlen=self.max_turns), now)
+            if entry is not None:  # else the next messages() reloads the session, this turn included, from the table
+                entry["turns"].append((question, answer))
+            sweep = self.idle_seconds > 0 and now - self._last_sweep > min(self.idle_seconds, 60)
+            if sweep:
+                self._last_sweep = now
+        if self._engine is not None:
+            try:
+                self._store_turn(key, question, answer, now)
+            except Exception as e:
+                logger.error(f"ConversationMemoryStore could not persist a turn for session {key}: {e}")
+        if sweep:
+            self.evict_idle()
+
+    def _store_turn(self, key: SessionKey, question: str, answer: str, now: float) -> None:
+        user_sub, session_id = key
+        same_session = (conversation_turns.c.user_sub == user_sub, conversation_turns.c.session_id == session_id)
+        oldest_kept = (select(conversation_turns.c.id).where(*same_session)
+                       .order_by(conversation_turns.c.id.desc()).offset(self.max_turns - 1).limit(1).scalar_subquery())
+        with self._engine.begin() as connection:
+            connection.execute(conversation_turns.insert().values(user_sub=user_sub, session_id=session_id,
+                                                                  question=question, answer=answer, created_at=now))
+            connection.execute(delete(conversation_turns).where(*same_session, conversation_turns.c.id < oldest_kept))
+
+    def evict_idle(self) -> int:
+        """Drops conversations idle for longer than idle_seconds from both tiers; returns the in-memory count."""
+        if self.idle_seconds <= 0:
+            return 0
+        now = time.time()
+        with self._lock:
+            expired = [key for key, entry in self._sessions.items() if self._expired(entry["last_used"], now)]
+            for key in expired:
+                del self._sessions[key]
+            self._stats["evicted_idle"] += len(expired)
+        if self._engine is not None:
+            idle_sessions = (select(conversation_turns.c.user_sub, conversation_turns.c.session_id)
+                             .group_by(conversation_turns.c.user_sub, conversation_turns.c.session_id)
+                             .having(func.max(conversation_turns.c.created_at) < now - self.idle_seconds))
+            try:
+                with self._engine.begin() as connection:
+                    connection.execute(delete(conversation_turns).where(
+                        tuple_(conversation_turns.c.user_sub, conversation_turns.c.session_id).in_(idle_sessions)))
+            except Exception as e:
+                logger.error(f"ConversationMemoryStore could not purge idle sessions: {e}")
+        return len(expired)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"sessions": len(self._sessions), "max_sessions": self.max_sessions, "max_turns": self.max_turns,
+                    "persistent": self._engine is not None, **self._stats}
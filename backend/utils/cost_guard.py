@@ -0,0 +1,143 @@
+import json
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Any, Dict, Optional
+
+from sqlalchemy import text
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.logger_config import logger
+from backend.config import ROLES_PERMISSIONS
+from backend.utils.sql_guard import counted_sql, limit_sql
+
+# Plan nodes counted_sql() puts above the query: the COUNT(*) OVER () window, the outer ORDER BY and the subquery.
+_WRAPPER_NODES = {"WindowAgg", "Sort", "Incremental Sort", "Subquery Scan"}
+
+
+@dataclass(frozen=True)
+class QueryBudget:
+    max_plan_cost: float = 50000.0  # planner cost units (EXPLAIN "Total Cost")
+    max_plan_rows: int = 10000  # estimated result rows (EXPLAIN "Plan Rows")
+    row_limit: int = 100  # LIMIT for queries without aggregation, and for plans over max_plan_rows
+    statement_timeout_ms: int = 5000  # 0 = no timeout
+
+
+@dataclass
+class CostDecision:
+    action: str  # "admit", "limit" or "reject"
+    sql: str  # SQL to execute (with the LIMIT, if one was added)
+    total_cost: float
+    plan_rows: int
+    limited: bool  # the plan's top node is a Limit, so the result may stop at row_limit
+    row_limit: int
+    unlimited_rows: Optional[int] = None  # for "limit": the estimate before the LIMIT was added
+
+
+class QueryBudgetError(ValueError):
+    """Generated SQL whose estimated cost is over the role's budget."""
+
+
+class QueryCostGuard:
+    """
+    Admission control for generated SQL, run on the query's own connection after the RLS context is set.
+
+        timeout     statement_timeout set transaction-locally to the role's statement_timeout_ms, in the same
+                    statement as the RLS context (see CustomSQLTool._session_setup)
+        estimate    `EXPLAIN (FORMAT JSON)` of counted_sql(SQL), the statement that runs, with its bind parameters
+                    (no ANALYZE, nothing is executed)
+        rows        a plan estimating more than max_plan_rows rows gets `LIMIT row_limit` and is explained again
+        cost        a plan whose total cost is over max_plan_cost is rejected with QueryBudgetError
+
+    The static half, a LIMIT on every query without aggregation, is done by SQLGuard.rewrite(row_limit=...)
+    so it is cached with the rest of the rewrite. Budgets default to the constructor's QueryBudget; a role's
+    "query_budget" entry in ROLES_PERMISSIONS overrides single fields. Every decision is logged with the
+    plan's estimates.
+    """
+
+    def __init__(self, default_budget: Optional[QueryBudget] = None, roles_permissions: Optional[Dict[str, Any]] = None):
+        self.default_budget = default_budget or QueryBudget()
+        self.roles_permissions = roles_permissions or ROLES_PERMISSIONS
+        self._lock = threading.Lock()
+        self._stats = {"admitted": 0, "limited": 0, "rejected": 0, "explain_ms_total": 0.0}
+
+    def budget(self, user_role: str) -> QueryBudget:
+        overrides = self.roles_permissions.get(user_role, {}).get("query_budget", {})
+        return replace(self.default_budget, **overrides)
+
+    def statement_timeout_ms(self, user_role: str) -> int:
+        """The role's statement_timeout, set transaction-locally with the RLS context; 0 = none."""
+        return int(self.budget(user_role).statement_timeout_ms)
+
+    @staticmethod
+    def _explain_statement(sql: str):
+        return text(f"EXPLAIN (FORMAT JSON) {counted_sql(sql)}")
+
+    @staticmethod
+    def _top_plan(raw: Any) -> Dict[str, Any]:
+        plans = json.loads(raw) if isinstance(raw, (str, bytes)) else raw
+        return plans[0]["Plan"]
+
+    @staticmethod
+    def _query_plan(plan: Dict[str, Any]) -> Dict[str, Any]:
+        """The query's own plan node below counted_sql()'s window, sort and subquery scan."""
+        while plan.get("Node Type") in _WRAPPER_NODES and len(plan.get("Plans", [])) == 1:
+            plan = plan["Plans"][0]
+        return plan
+
+    def _decide(self, sql: str, plan: Dict[str, Any], budget: QueryBudget, action: str) -> CostDecision:
+        total_cost, plan_rows = float(plan["Total Cost"]), int(plan["Plan Rows"])
+        if total_cost > budget.max_plan_cost:
+            action = "reject"
+        elif action != "limit" and plan_rows > budget.max_plan_rows:
+            action = "limit"
+            sql = limit_sql(sql, budget.row_limit)
+        return CostDecision(action, sql, total_cost, plan_rows, self._query_plan(plan).get("Node Type") == "Limit", budget.row_limit)
+
+    def _record(self, decision: CostDecision, user_role: str, budget: QueryBudget, explain_ms: float) -> CostDecision:
+        with self._lock:
+            self._stats[{"admit": "admitted", "limit": "limited", "reject": "rejected"}[decision.action]] += 1
+            self._stats["explain_ms_total"] += explain_ms
+        message = (f"QueryCostGuard {decision.action} for role '{user_role}': est. cost {decision.total_cost:.0f} "
+                   f"(budget {budget.max_plan_cost:.0f}), est. rows "
+                   f"{f'{decision.unlimited_rows} -> ' if decision.unlimited_rows is not None else ''}{decision.plan_rows} (budget {budget.max_plan_rows})"
+                   f"{f', LIMIT {budget.row_limit} added' if decision.action == 'limit' else ''}; "
+                   f"EXPLAIN {explain_ms:.1f} ms. SQL: {decision.sql}")
+        if decision.action == "reject":
+            logger.warning(message)
+            raise QueryBudgetError(
+                f"The query is too expensive to run (estimated cost {decision.total_cost:.0f}, budget "
+                f"{budget.max_plan_cost:.0f} for role '{user_role}'). Aggregate with COUNT/SUM/GROUP BY, "
+                f"filter more narrowly, or avoid joining the table to itself")
+        logger.info(message)
+        return decision
+
+    def admit(self, connection: Any, sql: str, params: Dict[str, Any], user_role: str) -> CostDecision:
+        """Explains the SQL on connection; returns the decision to execute, or raises QueryBudgetError."""
+        budget = self.budget(user_role)
+        start = time.perf_counter()
+        decision = self._decide(sql, self._top_plan(connection.execute(self._explain_statement(sql), params).scalar()), budget, "admit")
+        if decision.action == "limit":
+            raw = connection.execute(self._explain_statement(decision.sql), params).scalar()
+            decision = replace(self._decide(decision.sql, self._top_plan(raw), budget, "limit"), unlimited_rows=decision.plan_rows)
+        return self._record(decision, user_role, budget, (time.perf_counter() - start) * 1000)
+
+    async def aadmit(self, connection: Any, sql: str, params: Dict[str, Any], user_role: str) -> CostDecision:
+        """Async version of admit() for an AsyncConnection."""
+        budget = self.budget(user_role)
+        start = time.perf_counter()
+        result = await connection.execute(self._explain_statement(sql), params)
+        decision = self._decide(sql, self._top_plan(result.scalar()), budget, "admit")
+        if decision.action == "limit":
+            result = await connection.execute(self._explain_statement(decision.sql), params)
+            decision = replace(self._decide(decision.sql, self._top_plan(result.scalar()), budget, "limit"), unlimited_rows=decision.plan_rows)
+        return self._record(decision, user_role, budget, (time.perf_counter() - start) * 1000)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        explained = stats["admitted"] + stats["limited"] + stats["rejected"]
+        stats["explain_ms_avg"] = round(stats.pop("explain_ms_total") / explained, 2) if explained else 0.0
+        return {"default_budget": vars(self.default_budget), **stats}
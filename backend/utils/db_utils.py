@@ -1,5 +1,11 @@
 from sqlalchemy import create_engine, inspect as sqlalchemy_inspect
-from sqlalchemy.engine import Engine
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+import hashlib
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
 
 import sys
 import os
@@ -7,7 +13,31 @@ if __name__ == '__main__':
     sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))) 
 
 from backend.logger_config import logger
-from backend.config import DATABASE_URL # Using the full URL from config
+from backend.config import DATABASE_URL, ROLES_PERMISSIONS # Using the full URL from config
+
+def create_async_db_engine(database_url: str, pool_size: int = 10, max_overflow: int = 20) -> AsyncEngine:
+    """
+    Creates an asyncpg-backed SQLAlchemy AsyncEngine for the same database as database_url.
+
+    For the Supabase transaction pooler (pgbouncer), where clients share server backends: the prepared
+    statement caches are off, and asyncpg still prepares every statement under a name, so each name is a
+    fresh UUID rather than asyncpg's per-connection __asyncpg_stmt_N__, which collides across clients
+    (DuplicatePreparedStatementError). Statements are still prepared per query, which the pooler only
+    supports within one transaction; every CustomSQLTool query runs inside one.
+    """
+    url = make_url(database_url).set(drivername="postgresql+asyncpg")
+    return create_async_engine(
+        url,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_pre_ping=True,
+        connect_args={
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        },
+    )
+
 
 def get_db_schema_string(engine: Engine, table_name: str) -> str:
     """
@@ -57,6 +87,100 @@ def get_limited_db_schema_string(engine: Engine, relevant_tables: list = None) -
     return "\n\n".join(full_schema_string)
 
 
+def format_table_schema(table_name: str, columns: List[Tuple[str, str]], allowed_columns: Optional[List[str]] = None) -> str:
+    """
+    Formats (column name, type) pairs the same way as get_db_schema_string, optionally keeping only allowed_columns.
+    """
+    allowed = set(allowed_columns) if allowed_columns else None
+    schema_parts = [f"Table: {table_name}", "Columns:"]
+    schema_parts.extend(f'  "{col_name}": {col_type}' for col_name, col_type in columns if allowed is None or col_name in allowed)
+    return "\n".join(schema_parts)
+
+
+class SchemaRegistry:
+    """
+    Introspects the tables named in ROLES_PERMISSIONS once and serves each role's schema string from memory,
+    already reduced to the role's allowed_columns.
+
+    refresh() re-introspects synchronously; start() also refreshes every refresh_seconds on a daemon thread,
+    and request_refresh() wakes that thread early (e.g. after the tables are reloaded).
+    """
+
+    def __init__(self, engine: Engine, refresh_seconds: float = 600, roles_permissions: Optional[Dict] = None):
+        self.engine = engine
+        self.refresh_seconds = refresh_seconds
+        self.roles_permissions = roles_permissions or ROLES_PERMISSIONS
+        self._lock = threading.Lock()
+        self._role_schemas: Dict[str, str] = {}
+        self._fingerprint: Optional[str] = None
+        self.last_refresh: Optional[float] = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh(self) -> bool:
+        """Re-introspects the database. Returns True if any role's schema string changed."""
+        start = time.perf_counter()
+        tables = sorted({t for config in self.roles_permissions.values() for t in config.get("allowed_tables", ["supply_chain"])})
+        inspector = sqlalchemy_inspect(self.engine)
+        existing = set(inspector.get_table_names())
+        table_columns = {}
+        for table_name in tables:
+            if table_name in existing:
+                table_columns[table_name] = [(column['name'], str(column['type'])) for column in inspector.get_columns(table_name)]
+            else:
+                logger.warning(f"SchemaRegistry: table '{table_name}' from ROLES_PERMISSIONS not found in the database.")
+
+        role_schemas = {}
+        for role, config in self.roles_permissions.items():
+            role_schemas[role] = "\n\n".join(
+                format_table_schema(table_name, table_columns[table_name], config.get("allowed_columns"))
+                for table_name in config.get("allowed_tables", ["supply_chain"]) if table_name in table_columns
+            )
+        fingerprint = hashlib.sha256(repr(sorted(role_schemas.items())).encode("utf-8")).hexdigest()
+
+        with self._lock:
+            changed = fingerprint != self._fingerprint
+            self._role_schemas = role_schemas
+            self._fingerprint = fingerprint
+            self.last_refresh = time.time()
+        logger.info(f"SchemaRegistry refreshed {len(table_columns)} table(s) for {len(role_schemas)} role(s) in "
+                    f"{time.perf_counter() - start:.3f}s{' (schema changed)' if changed else ''}.")
+        return changed
+
+    def get_schema_string(self, role: str) -> str:
+        """Returns the cached schema string for a role, introspecting first if nothing has been loaded yet."""
+        if self.last_refresh is None:
+            self.refresh()
+        with self._lock:
+            return self._role_schemas.get(role, "")
+
+    def _refresh_loop(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.refresh_seconds)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"SchemaRegistry background refresh failed; keeping the previous schema: {e}")
+
+    def start(self) -> None:
+        """Starts the background refresh thread (no-op when refresh_seconds is 0 or it is already running)."""
+        if self.refresh_seconds <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._refresh_loop, name="schema-registry", daemon=True)
+        self._thread.start()
+
+    def request_refresh(self) -> None:
+        self._wake.set()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+
 if __name__ == '__main__':
 
     try:
@@ -1,39 +1,60 @@
+import argparse
 import os
 import sys
-import pdfplumber
+from typing import Any, Dict, List, Optional
+
 from langchain.docstore.document import Document
-from langchain_community.vectorstores import FAISS
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from utils.bedrock_utils import AmazonEmbeddings
-from backend.config import BEDROCK_API_KEY, BEDROCK_EMBEDDING_MODEL_ID, BEDROCK_EMBEDDING_LAMBDA_URL
+from utils.embedding_cache import EmbeddingCache
+from utils.indexing_pipeline import IndexingPipeline
+from utils.vector_index import (
+    file_sha256, new_manifest, load_manifest, create_id_mapped_store, load_id_mapped_store,
+    add_documents_with_ids, remove_ids, save_store_atomically, load_index_meta, current_index_dir, INDEX_TYPES
+)
+from backend.config import (
+    BEDROCK_API_KEY, BEDROCK_EMBEDDING_MODEL_ID, BEDROCK_EMBEDDING_LAMBDA_URL,
+    EMBEDDING_CACHE_ENABLED, EMBEDDING_CACHE_DIR, INDEX_PIPELINE_QUEUE_SIZE, INDEX_CHECKPOINT_CHUNKS
+)
 from backend.logger_config import logger
 
-def extract_text_from_pdf(pdf_path: str) -> str:
-    """Extract text from a PDF file using pdfplumber."""
-    logger.info(f"Extracting text from: {pdf_path}")
-    text_content = ""
-
-    try:
-        with pdfplumber.open(pdf_path) as pdf:
-            for page_num, page in enumerate(pdf.pages):
-                page_text = page.extract_text()
-                if page_text:
-                    text_content += page_text + "\n"
-            if text_content.strip():
-                logger.info(f"Successfully extracted text from {pdf_path} using pdfplumber.")
-                return text_content.strip()
-    except Exception as e:
-        logger.warning(f"pdfplumber failed for {pdf_path}: {e}.")
-
-    if not text_content.strip():
-        logger.warning(f"No text extracted from {pdf_path} after all attempts.")
-    return ""
-
-def create_document_embeddings():
-    """Generate and save embeddings for PDF documents with metadata, splitting text into chunks."""
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+
+def _chunk_pages(filename: str, pages: List[str], text_splitter: RecursiveCharacterTextSplitter) -> List[Document]:
+    """Splits each page's text as it comes, tagging chunks with their source file and page number."""
+    documents = []
+    for page_number, page_text in enumerate(pages, start=1):
+        if not page_text.strip():
+            continue
+        for chunk in text_splitter.split_text(page_text):
+            documents.append(Document(
+                page_content=chunk,
+                metadata={"source": filename, "chunk_id": len(documents), "page": page_number}
+            ))
+    if not documents:
+        logger.warning(f"Skipping {filename}: No text extracted.")
+    return documents
+
+
+def create_document_embeddings(rebuild: bool = False, index_type: Optional[str] = None, ann_options: Optional[Dict[str, Any]] = None):
+    """
+    Generate and save embeddings for PDF documents with metadata, splitting text into chunks.
+
+    By default the index is updated incrementally: a manifest of source PDFs and their content
+    hashes is kept next to the index, and only new or changed files are embedded; vectors of
+    deleted or changed files are removed by their FAISS IDs. Pass rebuild=True to start from scratch.
+
+    index_type selects the index served to setup_qa_chain: "flat" (exact search) or an approximate
+    "ivf", "hnsw" or "ivfpq" index built from the flat vectors with ann_options
+    (nlist, nprobe, hnsw_m, ef_construction, ef_search, pq_m, pq_bits). None keeps the type and
+    options recorded in the served index_meta.json (flat for a new index); nlist is sized again
+    from the new vector count.
+    """
     script_dir = os.path.dirname(__file__)  # .../backend/utils
     base_dir = os.path.abspath(os.path.join(script_dir, '..'))  # .../backend
 
@@ -45,10 +66,12 @@ def create_document_embeddings():
     logger.info(f"Embeddings will be saved to: {embeddings_dir}")
 
     try:
+        embedding_cache = EmbeddingCache(EMBEDDING_CACHE_DIR) if EMBEDDING_CACHE_ENABLED else None
         embeddings_util = AmazonEmbeddings(
             api_key=BEDROCK_API_KEY,
             model_id=BEDROCK_EMBEDDING_MODEL_ID,
-            embedding_lambda_url=BEDROCK_EMBEDDING_LAMBDA_URL
+            embedding_lambda_url=BEDROCK_EMBEDDING_LAMBDA_URL,
+            cache=embedding_cache
         )
         logger.info(f"AmazonEmbeddings initialized for embedding creation with model {BEDROCK_EMBEDDING_MODEL_ID}.")
     except Exception as e:
@@ -57,48 +80,128 @@ def create_document_embeddings():
 
     # Initialize text splitter for chunking
     text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,  # Roughly a few paragraphs; adjust based on your needs
-        chunk_overlap=200  # Overlap to maintain context between chunks
+        chunk_size=CHUNK_SIZE,  # Roughly a few paragraphs; adjust based on your needs
+        chunk_overlap=CHUNK_OVERLAP  # Overlap to maintain context between chunks
     )
 
-    langchain_documents = []
     if not os.path.isdir(document_dir):
         logger.error(f"Document directory not found: {document_dir}")
         return
 
-    for filename in os.listdir(document_dir):
-        if filename.lower().endswith(".pdf"):
-            file_path = os.path.join(document_dir, filename)
-            text = extract_text_from_pdf(file_path)
-            if text:
-                # Split the text into chunks
-                chunks = text_splitter.split_text(text)
-                for i, chunk in enumerate(chunks):
-                    langchain_documents.append(Document(
-                        page_content=chunk,
-                        metadata={"source": filename, "chunk_id": i}
-                    ))
-            else:
-                logger.warning(f"Skipping {filename}: No text extracted.")
-
-    if not langchain_documents:
-        logger.warning("No valid documents found or text extracted. No embeddings to create.")
-        return
-
-    logger.info(f"Found {len(langchain_documents)} document chunks to process for embeddings.")
+    current_hashes = {
+        filename: file_sha256(os.path.join(document_dir, filename))
+        for filename in sorted(os.listdir(document_dir)) if filename.lower().endswith(".pdf")
+    }
+
+    manifest = None if rebuild else load_manifest(embeddings_dir)
+    if manifest and (manifest["model_id"], manifest["chunk_size"], manifest["chunk_overlap"]) != (BEDROCK_EMBEDDING_MODEL_ID, CHUNK_SIZE, CHUNK_OVERLAP):
+        logger.info("Embedding model or chunking settings changed since the last build; rebuilding the full index.")
+        manifest = None
+
+    vectorstore = None
+    if manifest:
+        try:
+            vectorstore = load_id_mapped_store(embeddings_dir, embeddings_util)
+        except Exception as e:
+            logger.warning(f"Could not load existing index for incremental update ({e}); rebuilding the full index.")
+            manifest = None
+    if not manifest:
+        manifest = new_manifest(BEDROCK_EMBEDDING_MODEL_ID, CHUNK_SIZE, CHUNK_OVERLAP)
+        logger.info("Building the FAISS index from scratch.")
+
+    indexed_files = manifest["files"]
+    changed = [f for f, digest in current_hashes.items() if f in indexed_files and indexed_files[f]["sha256"] != digest]
+    added = [f for f in current_hashes if f not in indexed_files]
+    deleted = [f for f in indexed_files if f not in current_hashes]
+    logger.info(f"Index diff: {len(added)} new, {len(changed)} changed, {len(deleted)} deleted, "
+                f"{len(current_hashes) - len(added) - len(changed)} unchanged file(s).")
+
+    current_meta = load_index_meta(current_index_dir(embeddings_dir))
+    requested_type, requested_options = index_type, ann_options
+    if index_type is None:
+        # A checkpoint records the type its run was building; otherwise keep the served type, re-sizing nlist
+        recorded = current_meta.get("pending") or {
+            "index_type": current_meta["index_type"],
+            "options": {k: v for k, v in current_meta.get("params", {}).items() if k != "nlist"},
+        }
+        index_type = recorded["index_type"]
+        if not ann_options and index_type != "flat":
+            ann_options = recorded["options"]
+        logger.info(f"Keeping the served index type '{index_type}'" + (f" with {ann_options}." if ann_options else "."))
+
+    if vectorstore is not None and not (added or changed or deleted):
+        if current_meta["index_type"] == index_type and not requested_options:
+            logger.info("FAISS index is up to date; nothing to embed.")
+            return
+        logger.info(f"Documents unchanged; rebuilding the served index as '{requested_type or index_type}'.")
 
     try:
-        vectorstore = FAISS.from_documents(langchain_documents, embeddings_util)
-        vectorstore.save_local(folder_path=embeddings_dir, index_name="index")  # Default index_name="index"
-        logger.info(f"FAISS vector store with embeddings saved to: {embeddings_dir}")
+        if vectorstore is not None:
+            stale_ids = [vector_id for f in changed + deleted for vector_id in indexed_files[f]["ids"]]
+            removed = remove_ids(vectorstore, stale_ids)
+            for filename in changed + deleted:
+                indexed_files.pop(filename)
+            logger.info(f"Removed {removed} vectors belonging to changed or deleted files.")
+
+        to_embed = [os.path.join(document_dir, filename) for filename in changed + added]
+        chunks_since_checkpoint = 0
+        with IndexingPipeline(to_embed, lambda f, pages: _chunk_pages(f, pages, text_splitter), embeddings_util,
+                              queue_size=INDEX_PIPELINE_QUEUE_SIZE) as pipeline:
+            for filename, documents, vectors in pipeline:
+                ids = list(range(manifest["next_id"], manifest["next_id"] + len(documents)))
+                if documents:
+                    if vectorstore is None:
+                        vectorstore = create_id_mapped_store(embeddings_util, len(vectors[0]))
+                    add_documents_with_ids(vectorstore, documents, vectors, ids)
+                    manifest["next_id"] += len(documents)
+                    logger.info(f"Indexed {len(documents)} chunks from {filename}.")
+                # Files without extractable text are still recorded so they are not retried until they change.
+                indexed_files[filename] = {"sha256": current_hashes[filename], "ids": ids}
+
+                chunks_since_checkpoint += len(documents)
+                if vectorstore is not None and chunks_since_checkpoint >= INDEX_CHECKPOINT_CHUNKS:
+                    # Only fully indexed files are in the manifest, so a rerun after a failure resumes from here.
+                    # Checkpoints skip ANN training; the final save builds the requested index type.
+                    save_store_atomically(vectorstore, manifest, embeddings_dir, pending=(
+                        {"index_type": index_type, "options": ann_options or {}} if index_type != "flat" else None))
+                    logger.info(f"Checkpoint saved: {len(indexed_files)} file(s), {vectorstore.index.ntotal} vectors.")
+                    chunks_since_checkpoint = 0
+
+        if vectorstore is None:
+            logger.warning("No valid documents found or text extracted. No embeddings to create.")
+            return
+
+        save_store_atomically(vectorstore, manifest, embeddings_dir, index_type=index_type, ann_options=ann_options)
+        logger.info(f"FAISS vector store ({index_type}) with {vectorstore.index.ntotal} vectors saved to: {embeddings_dir}")
     except ValueError as ve:  # Catch specific errors from _get_embedding like empty embedding
-        logger.error(f"ValueError during embedding or FAISS creation: {ve}. This might be due to an issue with a specific document or the embedding model.")
+        logger.error(f"ValueError during embedding or FAISS creation: {ve}. This might be due to an issue with a specific document or the embedding model. Re-run to resume from the last checkpoint.")
     except RuntimeError as re:  # Catch issues from Bedrock/Lambda calls
-        logger.error(f"RuntimeError during embedding or FAISS creation: {re}")
+        logger.error(f"RuntimeError during embedding or FAISS creation: {re}. Re-run to resume from the last checkpoint.")
     except Exception as e:
         logger.error(f"An unexpected error occurred creating or saving FAISS vector store: {e}", exc_info=True)
+    finally:
+        if embedding_cache is not None:
+            embedding_cache.log_stats()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed PDFs in backend/documents into the FAISS index.")
+    parser.add_argument("--rebuild", action="store_true", help="Ignore the manifest and rebuild the whole index.")
+    parser.add_argument("--index-type", choices=INDEX_TYPES,
+                        help="Index served to the QA chain (default: the type of the current index; flat, exact search, for a new one).")
+    parser.add_argument("--nlist", type=int, help="IVF/IVFPQ: number of inverted lists (default ~4*sqrt(n)).")
+    parser.add_argument("--nprobe", type=int, help="IVF/IVFPQ: lists probed per query (default nlist/8).")
+    parser.add_argument("--hnsw-m", type=int, help="HNSW: neighbours per node (default 32).")
+    parser.add_argument("--ef-construction", type=int, help="HNSW: build-time candidate list size (default 200).")
+    parser.add_argument("--ef-search", type=int, help="HNSW: query-time candidate list size (default 64).")
+    parser.add_argument("--pq-m", type=int, help="IVFPQ: sub-quantizers; must divide the embedding dimension.")
+    parser.add_argument("--pq-bits", type=int, help="IVFPQ: bits per sub-quantizer code (max 8).")
+    args = parser.parse_args()
+
+    ann_options = {
+        "nlist": args.nlist, "nprobe": args.nprobe, "hnsw_m": args.hnsw_m, "ef_construction": args.ef_construction,
+        "ef_search": args.ef_search, "pq_m": args.pq_m, "pq_bits": args.pq_bits,
+    }
     logger.info("Starting document embedding process...")
-    create_document_embeddings()
+    create_document_embeddings(rebuild=args.rebuild, index_type=args.index_type,
+                               ann_options={k: v for k, v in ann_options.items() if v is not None})
     logger.info("Document embedding process finished.")
\ No newline at end of file
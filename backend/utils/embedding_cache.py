@@ -0,0 +1,197 @@
+import hashlib
+import json
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; there the cache is safe for one writing process only
+    fcntl = None
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.logger_config import logger
+
+KEY_SIZE = 32  # sha256 digest length
+
+
+class EmbeddingCache:
+    """
+    Content-addressed, append-only embedding cache stored on disk.
+
+    Layout inside cache_dir:
+        vectors.f32  raw float32 rows, memory-mapped for reads
+        keys.bin     32-byte sha256(model_id, text) digests; row i of keys matches row i of vectors
+        meta.json    {"dimension": <int>}
+        .lock        flock()ed while reading new rows (shared) and while appending (exclusive)
+
+    Several processes (gunicorn/uvicorn workers, embed_documents.py next to the app) can share one cache_dir:
+    an append takes the exclusive lock, first reads the rows other processes appended since, and numbers its
+    own rows from the files' sizes, never from what this process has seen.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self._vectors_path = os.path.join(cache_dir, "vectors.f32")
+        self._keys_path = os.path.join(cache_dir, "keys.bin")
+        self._meta_path = os.path.join(cache_dir, "meta.json")
+        self._lock_path = os.path.join(cache_dir, ".lock")
+        self._lock = threading.Lock()
+        self._rows: Dict[bytes, int] = {}
+        self._row_count = 0  # rows of both files read into _rows
+        self._keys_size = 0  # size of keys.bin when it was last read
+        self._vectors: Optional[np.memmap] = None
+        self.dimension: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    @staticmethod
+    def make_key(model_id: str, text: str) -> bytes:
+        return hashlib.sha256(f"{model_id}\x00{text}".encode("utf-8")).digest()
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool) -> Iterator[None]:
+        """Cross-process lock on cache_dir; callers hold self._lock for the threads of this process."""
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_meta(self) -> bool:
+        if self.dimension is None and os.path.isfile(self._meta_path):
+            with open(self._meta_path) as f:
+                self.dimension = int(json.load(f)["dimension"])
+        return self.dimension is not None
+
+    def _complete_rows(self) -> int:
+        """Rows present in both files; an interrupted write can leave one file longer than the other."""
+        key_rows = os.path.getsize(self._keys_path) // KEY_SIZE if os.path.isfile(self._keys_path) else 0
+        vector_rows = os.path.getsize(self._vectors_path) // (4 * self.dimension) if os.path.isfile(self._vectors_path) else 0
+        return min(key_rows, vector_rows)
+
+    def _sync(self) -> None:
+        """Reads the keys of rows appended since the last read, by this or another process. Needs the file lock."""
+        if not self._read_meta():
+            return
+        row_count = self._complete_rows()
+        if row_count > self._row_count:
+            with open(self._keys_path, "rb") as f:
+                f.seek(self._row_count * KEY_SIZE)
+                keys = f.read((row_count - self._row_count) * KEY_SIZE)
+            for offset in range(row_count - self._row_count):
+                self._rows[keys[offset * KEY_SIZE:(offset + 1) * KEY_SIZE]] = self._row_count + offset
+            self._row_count = row_count
+        self._keys_size = os.path.getsize(self._keys_path) if os.path.isfile(self._keys_path) else 0
+
+    def _truncate(self, row_count: int) -> None:
+        """Cuts both files back to row_count rows. Needs the exclusive file lock."""
+        for path, row_size in ((self._keys_path, KEY_SIZE), (self._vectors_path, 4 * self.dimension)):
+            if os.path.isfile(path) and os.path.getsize(path) > row_count * row_size:
+                with open(path, "r+b") as f:
+                    f.truncate(row_count * row_size)
+
+    def _load(self) -> None:
+        with self._file_lock(exclusive=True):
+            if not self._read_meta():
+                return
+            self._sync()
+            vectors_size = os.path.getsize(self._vectors_path) if os.path.isfile(self._vectors_path) else 0
+            if vectors_size > self._row_count * 4 * self.dimension or self._keys_size > self._row_count * KEY_SIZE:
+                logger.warning(f"EmbeddingCache at {self.cache_dir} had a partial trailing write; truncating to {self._row_count} rows.")
+                self._truncate(self._row_count)
+                self._keys_size = self._row_count * KEY_SIZE
+        logger.info(f"EmbeddingCache loaded {self._row_count} cached embeddings (dimension {self.dimension}) from {self.cache_dir}.")
+
+    def _refresh(self) -> None:
+        """Picks up rows other processes appended, if keys.bin grew since it was last read."""
+        size = os.path.getsize(self._keys_path) if os.path.isfile(self._keys_path) else 0
+        if size != self._keys_size:
+            with self._file_lock(exclusive=False):
+                self._sync()
+
+    def _vector_at(self, row: int) -> List[float]:
+        if self._vectors is None or row >= self._vectors.shape[0]:
+            rows = os.path.getsize(self._vectors_path) // (4 * self.dimension)
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dimension))
+        return self._vectors[row].tolist()
+
+    def get_many(self, model_id: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Returns the cached vector for each text, or None where the text is not cached."""
+        results = []
+        with self._lock:
+            self._refresh()
+            for text in texts:
+                row = self._rows.get(self.make_key(model_id, text))
+                if row is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    results.append(self._vector_at(row))
+        return results
+
+    def get(self, model_id: str, text: str) -> Optional[List[float]]:
+        return self.get_many(model_id, [text])[0]
+
+    def put_many(self, model_id: str, texts: List[str], vectors: List[List[float]]) -> None:
+        """Appends new (text, vector) pairs; texts already in the cache (also from other processes) are skipped."""
+        with self._lock, self._file_lock(exclusive=True):
+            self._sync()
+            new_keys, new_vectors = [], []
+            for text, vector in zip(texts, vectors):
+                key = self.make_key(model_id, text)
+                if key in self._rows or key in new_keys:
+                    continue
+                new_keys.append(key)
+                new_vectors.append(vector)
+            if not new_keys:
+                return
+
+            array = np.asarray(new_vectors, dtype=np.float32)
+            if self.dimension is None:
+                self.dimension = int(array.shape[1])
+                with open(self._meta_path, "w") as f:
+                    json.dump({"dimension": self.dimension}, f)
+            elif array.shape[1] != self.dimension:
+                raise ValueError(f"EmbeddingCache dimension is {self.dimension}, got vectors of dimension {array.shape[1]}.")
+
+            # Rows are numbered from the files, which may hold another process's rows or a failed write's leftovers.
+            start = self._row_count
+            self._truncate(start)
+            # Vectors first, then keys: a crash in between leaves an orphan vector row, never a key without a vector.
+            try:
+                with open(self._vectors_path, "ab") as f:
+                    f.write(array.tobytes())
+                with open(self._keys_path, "ab") as f:
+                    f.write(b"".join(new_keys))
+            except OSError:
+                self._truncate(start)  # the next append would otherwise number its rows after the leftovers
+                raise
+            for offset, key in enumerate(new_keys):
+                self._rows[key] = start + offset
+            self._row_count = start + len(new_keys)
+            self._keys_size = self._row_count * KEY_SIZE
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._rows),
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def log_stats(self) -> None:
+        stats = self.stats()
+        logger.info(f"EmbeddingCache stats: {stats['hits']} hit(s), {stats['misses']} miss(es), hit rate {stats['hit_rate']:.1%}, {stats['entries']} entries stored.")
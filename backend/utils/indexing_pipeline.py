@@ -0,0 +1,101 @@
+import queue
+import threading
+from typing import Any, Callable, Iterable, Iterator, List, Tuple
+
+from langchain.docstore.document import Document
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.logger_config import logger
+from backend.utils.pdf_extraction import extract_pdfs_parallel
+
+_DONE = object()
+
+
+class _StageFailure:
+    def __init__(self, stage: str, error: BaseException):
+        self.stage = stage
+        self.error = error
+
+
+class IndexingPipeline:
+    """
+    Streams PDFs through extract -> split -> embed stages, each running on its own thread and
+    joined by bounded queues, so at most `queue_size` files are buffered between any two stages.
+
+    Iterating yields (filename, documents, vectors) in completion order for the caller to insert.
+    Use as a context manager; leaving the block (normally or on error) stops every stage.
+    A failure in any stage is re-raised from the iterator.
+    """
+
+    def __init__(self, file_paths: List[str], chunk_fn: Callable[[str, List[str]], List[Document]],
+                 embeddings: Any, queue_size: int = 4):
+        self.file_paths = file_paths
+        self.chunk_fn = chunk_fn
+        self.embeddings = embeddings
+        self.queue_size = max(1, queue_size)
+        self._stop = threading.Event()
+
+    def __enter__(self) -> "IndexingPipeline":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._stop.set()
+
+    def _put(self, q: queue.Queue, item: Any) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _stage(self, name: str, source_factory: Callable[[], Iterable]) -> Iterator:
+        """Runs source_factory() on a thread, handing its items over through a bounded queue."""
+        q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+
+        def worker():
+            source = iter(source_factory())
+            try:
+                for item in source:
+                    if not self._put(q, item):
+                        return
+                self._put(q, _DONE)
+            except BaseException as e:
+                logger.error(f"Indexing pipeline stage '{name}' failed: {e}")
+                self._put(q, _StageFailure(name, e))
+            finally:
+                close = getattr(source, "close", None)
+                if close:
+                    close()
+
+        threading.Thread(target=worker, name=f"index-{name}", daemon=True).start()
+
+        while True:
+            try:
+                item = q.get(timeout=0.5)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            if item is _DONE:
+                return
+            if isinstance(item, _StageFailure):
+                raise item.error
+            yield item
+
+    def _split(self, pages: Iterable[Tuple[str, List[str]]]) -> Iterator[Tuple[str, List[Document]]]:
+        for filename, file_pages in pages:
+            yield filename, self.chunk_fn(filename, file_pages)
+
+    def _embed(self, chunks: Iterable[Tuple[str, List[Document]]]) -> Iterator[Tuple[str, List[Document], List[List[float]]]]:
+        for filename, documents in chunks:
+            vectors = self.embeddings.embed_documents([doc.page_content for doc in documents]) if documents else []
+            yield filename, documents, vectors
+
+    def __iter__(self) -> Iterator[Tuple[str, List[Document], List[List[float]]]]:
+        pages = self._stage("extract", lambda: extract_pdfs_parallel(self.file_paths))
+        chunks = self._stage("split", lambda: self._split(pages))
+        return self._stage("embed", lambda: self._embed(chunks))
@@ -0,0 +1,256 @@
+import asyncio
+import json
+import random
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.logger_config import logger
+from backend.config import (
+    LAMBDA_HTTP_POOL_CONNECTIONS, LAMBDA_HTTP_POOL_MAXSIZE, LAMBDA_HTTP_POOL_BLOCK, LAMBDA_ASYNC_MAX_CONNECTIONS
+)
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def create_lambda_session(pool_connections: int = LAMBDA_HTTP_POOL_CONNECTIONS,
+                          pool_maxsize: int = LAMBDA_HTTP_POOL_MAXSIZE,
+                          pool_block: bool = LAMBDA_HTTP_POOL_BLOCK) -> requests.Session:
+    """
+    Creates a requests Session with a keep-alive connection pool for the Bedrock Lambda proxy.
+
+    Args:
+        pool_connections: Number of per-host connection pools to cache.
+        pool_maxsize: Maximum number of connections kept alive per host.
+        pool_block: Whether to block when the pool is exhausted instead of opening extra connections.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=pool_block,
+        max_retries=0  # Retries are decided by the callers, not silently by urllib3
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Content-Type": "application/json", "Connection": "keep-alive"})
+    logger.info(f"Created Lambda HTTP session (pool_connections={pool_connections}, pool_maxsize={pool_maxsize}, pool_block={pool_block}).")
+    return session
+
+
+def get_lambda_session() -> requests.Session:
+    """Returns the process-wide Lambda session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_lambda_session()
+    return _session
+
+
+def close_lambda_session() -> None:
+    """Closes the process-wide Lambda session and drops its pooled connections."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+class LambdaHTTPError(Exception):
+    """Raised by LambdaResponse.raise_for_status() for a 4xx/5xx response."""
+
+    def __init__(self, response: "LambdaResponse"):
+        super().__init__(f"{response.status_code} error from Lambda")
+        self.response = response
+
+
+class LambdaResponse:
+    """Fully read response of an async Lambda call (status, headers, body), usable after the connection is released."""
+
+    def __init__(self, status_code: int, headers: Any, text: str):
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+
+    def json(self) -> Any:
+        return json.loads(self.text)
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise LambdaHTTPError(self)
+
+
+# Transport failures of the async client: refused/reset connections and timeouts.
+ASYNC_TRANSPORT_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+
+# aiohttp connections belong to the event loop that opened them, so there is one session per loop.
+_async_sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = weakref.WeakKeyDictionary()
+
+
+def get_async_lambda_session(max_connections: int = LAMBDA_ASYNC_MAX_CONNECTIONS) -> aiohttp.ClientSession:
+    """Returns the keep-alive aiohttp session for the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    session = _async_sessions.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=max_connections, limit_per_host=max_connections),
+            headers={"Content-Type": "application/json"},
+        )
+        _async_sessions[loop] = session
+        logger.info(f"Created async Lambda HTTP session (max_connections={max_connections}).")
+    return session
+
+
+async def close_async_lambda_session() -> None:
+    """Closes the running event loop's async Lambda session, e.g. on ASGI shutdown."""
+    session = _async_sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+
+def to_client_timeout(timeout: Any) -> aiohttp.ClientTimeout:
+    """Converts a requests-style (connect, read) tuple or a single number into an aiohttp.ClientTimeout."""
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return aiohttp.ClientTimeout(total=None, connect=connect, sock_read=read)
+    return aiohttp.ClientTimeout(total=None, connect=timeout, sock_read=timeout)
+
+
+async def apost(url: str, *, timeout: Any, **kwargs) -> LambdaResponse:
+    """POSTs through the event loop's Lambda session and reads the whole response."""
+    async with get_async_lambda_session().post(url, timeout=to_client_timeout(timeout), **kwargs) as response:
+        return LambdaResponse(response.status, response.headers, await response.text())
+
+
+@asynccontextmanager
+async def apost_stream(url: str, *, timeout: Any, **kwargs) -> AsyncIterator[aiohttp.ClientResponse]:
+    """
+    POSTs through the event loop's Lambda session and yields the open response so the caller can read
+    the body as it arrives. The read timeout applies between chunks. A 4xx/5xx raises LambdaHTTPError.
+    """
+    async with get_async_lambda_session().post(url, timeout=to_client_timeout(timeout), **kwargs) as response:
+        if response.status >= 400:
+            raise LambdaHTTPError(LambdaResponse(response.status, response.headers, await response.text()))
+        yield response
+
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Thread-safe token-bucket rate limiter.
+
+    Args:
+        rate: Tokens added per second. A rate <= 0 disables limiting.
+        capacity: Maximum burst size; defaults to one second worth of tokens.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        """Blocks until the requested number of tokens is available."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+                self._last_refill = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: float = 1.0) -> None:
+        """Like acquire(), but waits with asyncio.sleep so the event loop keeps running."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+                self._last_refill = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            await asyncio.sleep(wait)
+
+
+def _backoff_delay(attempt: int, backoff_base: float, backoff_max: float, response: Any = None) -> float:
+    """Full-jitter exponential backoff, honouring a numeric Retry-After header when present."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.replace(".", "", 1).isdigit():
+            return min(float(retry_after), backoff_max)
+    return random.uniform(0, min(backoff_max, backoff_base * (2 ** attempt)))
+
+
+def post_with_retries(url: str, *, timeout: Any, max_retries: int, backoff_base: float, backoff_max: float,
+                      rate_limiter: Optional[TokenBucket] = None, **kwargs) -> requests.Response:
+    """
+    POSTs through the shared Lambda session, retrying 429/5xx responses and connection failures
+    with jittered exponential backoff. The last response (or exception) is returned (or raised) as-is.
+    """
+    session = get_lambda_session()
+    for attempt in range(max_retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            response = session.post(url, timeout=timeout, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt >= max_retries:
+                raise
+            delay = _backoff_delay(attempt, backoff_base, backoff_max)
+            logger.warning(f"Lambda request failed ({e}); retry {attempt + 1}/{max_retries} in {delay:.2f}s.")
+            time.sleep(delay)
+            continue
+
+        if response.status_code in RETRYABLE_STATUS_CODES and attempt < max_retries:
+            delay = _backoff_delay(attempt, backoff_base, backoff_max, response)
+            logger.warning(f"Lambda returned {response.status_code}; retry {attempt + 1}/{max_retries} in {delay:.2f}s.")
+            time.sleep(delay)
+            continue
+        return response
+
+
+async def apost_with_retries(url: str, *, timeout: Any, max_retries: int, backoff_base: float, backoff_max: float,
+                             rate_limiter: Optional[TokenBucket] = None, **kwargs) -> LambdaResponse:
+    """Async counterpart of post_with_retries, sending through the event loop's aiohttp session."""
+    for attempt in range(max_retries + 1):
+        if rate_limiter is not None:
+            await rate_limiter.acquire_async()
+        try:
+            response = await apost(url, timeout=timeout, **kwargs)
+        except ASYNC_TRANSPORT_ERRORS as e:
+            if attempt >= max_retries:
+                raise
+            delay = _backoff_delay(attempt, backoff_base, backoff_max)
+            logger.warning(f"Lambda request failed ({e!r}); retry {attempt + 1}/{max_retries} in {delay:.2f}s.")
+            await asyncio.sleep(delay)
+            continue
+
+        if response.status_code in RETRYABLE_STATUS_CODES and attempt < max_retries:
+            delay = _backoff_delay(attempt, backoff_base, backoff_max, response)
+            logger.warning(f"Lambda returned {response.status_code}; retry {attempt + 1}/{max_retries} in {delay:.2f}s.")
+            await asyncio.sleep(delay)
+            continue
+        return response
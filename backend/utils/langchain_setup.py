@@ -1,5 +1,6 @@
 
 import os
+import time
 from langchain.chains import RetrievalQA
 from langchain_community.vectorstores import FAISS
 import sys
@@ -7,9 +8,13 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from config import (
     BEDROCK_API_KEY, BEDROCK_LLM_MODEL_ID, BEDROCK_EMBEDDING_MODEL_ID,
-    BEDROCK_LLM_LAMBDA_URL, BEDROCK_EMBEDDING_LAMBDA_URL
+    BEDROCK_LLM_LAMBDA_URL, BEDROCK_EMBEDDING_LAMBDA_URL, FAISS_NPROBE, FAISS_EF_SEARCH, VECTORSTORE_MMAP,
+    LLM_TEMPERATURE, LLM_CACHE_ENABLED, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_SQLITE_PATH
 )
 from utils.bedrock_utils import BedrockLLM, BedrockLLMConfig, AmazonEmbeddings
+from utils.vector_index import load_index_meta, load_serving_index, current_index_dir
+from utils.mmap_store import has_mmap_files, load_mmap_vectorstore
+from backend.utils.llm_cache import LLMResponseCache  # same module object bedrock_utils validates against
 from backend.logger_config import logger
 
 
@@ -29,10 +34,11 @@ def setup_qa_chain():
         model_id=BEDROCK_LLM_MODEL_ID,
         api_key=BEDROCK_API_KEY,
         llm_lambda_url=BEDROCK_LLM_LAMBDA_URL,
-        model_kwargs={"temperature": 0.5, "max_tokens": 2000} 
+        model_kwargs={"temperature": LLM_TEMPERATURE, "max_tokens": 2000} 
     )
-    llm = BedrockLLM(config=bedrock_config)
-    logger.info(f"BedrockLLM initialized with model: {BEDROCK_LLM_MODEL_ID}")
+    response_cache = LLMResponseCache(max_entries=LLM_CACHE_MAX_ENTRIES, sqlite_path=LLM_CACHE_SQLITE_PATH or None) if LLM_CACHE_ENABLED else None
+    llm = BedrockLLM(config=bedrock_config, response_cache=response_cache)
+    logger.info(f"BedrockLLM initialized with model: {BEDROCK_LLM_MODEL_ID} (response cache {'enabled' if response_cache else 'disabled'})")
 
     # --- 2. Initialize embeddings and vector store ---
     if not BEDROCK_EMBEDDING_MODEL_ID or not BEDROCK_EMBEDDING_LAMBDA_URL:
@@ -55,22 +61,35 @@ def setup_qa_chain():
         logger.error(error_msg)
         raise RuntimeError(error_msg)
     
-    index_file = os.path.join(embeddings_base_path, "index.faiss")
-    pkl_file = os.path.join(embeddings_base_path, "index.pkl")
+    index_dir = current_index_dir(embeddings_base_path)  # the build CURRENT names; every file below is read from it
+    index_file = os.path.join(index_dir, "index.faiss")
+    pkl_file = os.path.join(index_dir, "index.pkl")
+    use_mmap = VECTORSTORE_MMAP and has_mmap_files(index_dir)
 
-    if not os.path.isfile(index_file) or not os.path.isfile(pkl_file):
-        error_msg = f"FAISS index files (index.faiss, index.pkl) not found in: {embeddings_base_path}. Run embed_documents.py first."
+    if not os.path.isfile(index_file) or not (use_mmap or os.path.isfile(pkl_file)):
+        error_msg = f"FAISS index files (index.faiss with docstore.jsonl or index.pkl) not found in: {index_dir}. Run embed_documents.py first."
         logger.error(error_msg)
         raise RuntimeError(error_msg)
 
     try:
-        vectorstore = FAISS.load_local(
-            embeddings_base_path,
-            embeddings,
-            allow_dangerous_deserialization=True, 
-            index_name="index" 
-        )
-        logger.info(f"FAISS vector store loaded successfully from {embeddings_base_path}")
+        start = time.perf_counter()
+        index_meta = load_index_meta(index_dir)
+        search_overrides = {"nprobe": FAISS_NPROBE, "ef_search": FAISS_EF_SEARCH}
+        if use_mmap:
+            vectorstore = load_mmap_vectorstore(index_dir, embeddings, index_meta, search_overrides)
+        else:
+            logger.warning("Loading the pickled FAISS docstore into memory; re-run embed_documents.py --rebuild to switch to the memory-mapped format.")
+            vectorstore = FAISS.load_local(
+                index_dir,
+                embeddings,
+                allow_dangerous_deserialization=True, 
+                index_name="index" 
+            )
+            if index_meta["index_type"] != "flat":
+                vectorstore.index = load_serving_index(index_dir, index_meta, search_overrides=search_overrides)
+        vectorstore.index_meta = index_meta  # the build this process serves; the semantic answer cache follows its build_id
+        logger.info(f"FAISS vector store ({index_meta['index_type']}, params {index_meta.get('params', {})}, "
+                    f"{'memory-mapped' if use_mmap else 'in-memory'}) loaded in {time.perf_counter() - start:.3f}s from {index_dir}")
     except Exception as e:
         logger.error(f"Failed to load FAISS vector store: {e}")
         raise RuntimeError(f"Failed to load FAISS vector store: {e}") from e
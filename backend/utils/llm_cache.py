@@ -0,0 +1,99 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, List, Optional
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.logger_config import logger
+
+
+def is_deterministic(model_kwargs: Dict[str, Any]) -> bool:
+    """Only greedy decoding (temperature 0) returns the same text for the same prompt."""
+    temperature = model_kwargs.get("temperature")
+    return temperature is not None and float(temperature) == 0.0
+
+
+class LLMResponseCache:
+    """
+    Exact-match cache of LLM completions keyed by sha256(model_id, prompt, model_kwargs, stop).
+
+    Tiers:
+        memory  in-process LRU of up to max_entries responses
+        sqlite  optional on-disk table at sqlite_path, shared across restarts and worker processes;
+                disk hits are promoted into the memory tier
+
+    Hits and misses are counted per call site (the `cache_site` passed to BedrockLLM.invoke).
+    """
+
+    def __init__(self, max_entries: int = 512, sqlite_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.sqlite_path = sqlite_path
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._site_stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {"hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0})
+        if sqlite_path:
+            os.makedirs(os.path.dirname(os.path.abspath(sqlite_path)), exist_ok=True)
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS llm_responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)")
+            logger.info(f"LLMResponseCache using SQLite tier at {sqlite_path}.")
+
+    @staticmethod
+    def make_key(model_id: str, prompt: str, model_kwargs: Dict[str, Any], stop: Optional[List[str]]) -> str:
+        material = json.dumps({"model_id": model_id, "prompt": prompt, "model_kwargs": model_kwargs, "stop": stop or []},
+                              sort_keys=True, default=str)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, site: str = "default") -> Optional[str]:
+        with self._lock:
+            stats = self._site_stats[site]
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                stats["hits"] += 1
+                return self._memory[key]
+            if self._db is not None:
+                row = self._db.execute("SELECT response FROM llm_responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._remember(key, row[0])
+                    stats["disk_hits"] += 1
+                    return row[0]
+            stats["misses"] += 1
+            return None
+
+    def put(self, key: str, response: str) -> None:
+        with self._lock:
+            self._remember(key, response)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO llm_responses (key, response, created_at) VALUES (?, ?, ?)",
+                                 (key, response, time.time()))
+
+    def record_bypass(self, site: str = "default") -> None:
+        """Counts a call that skipped the cache because its settings are not deterministic."""
+        with self._lock:
+            self._site_stats[site]["bypassed"] += 1
+
+    def _remember(self, key: str, response: str) -> None:
+        self._memory[key] = response
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM llm_responses")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sites = {}
+            for site, counts in self._site_stats.items():
+                lookups = counts["hits"] + counts["disk_hits"] + counts["misses"]
+                sites[site] = {**counts, "hit_rate": round((counts["hits"] + counts["disk_hits"]) / lookups, 4) if lookups else 0.0}
+            return {"memory_entries": len(self._memory), "sqlite": bool(self._db), "sites": sites}
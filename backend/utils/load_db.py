@@ -7,8 +7,10 @@ from time import sleep
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from backend.config import DATABASE_URL, CSV_PATH_FOR_DB_LOAD
+from backend.config import DATABASE_URL, CSV_PATH_FOR_DB_LOAD, TEXT_TO_SQL_CACHE_PATH, ANALYTICS_MIRROR_ENABLED, ANALYTICS_MIRROR_PATH
 from backend.logger_config import logger
+from backend.utils.sql_cache import TextToSQLCache
+from backend.utils.analytics_mirror import build_mirror
 
 def load_data_to_db():
     """Load data from CSV into the Supabase PostgreSQL database and set up the users table."""
@@ -175,6 +177,17 @@ def load_data_to_db():
                 trans.commit()
                 logger.info("Successfully loaded all data into supply_chain table.")
 
+                # SQL generated against the previous table must not be reused.
+                if os.path.isfile(TEXT_TO_SQL_CACHE_PATH):
+                    TextToSQLCache(TEXT_TO_SQL_CACHE_PATH).invalidate()
+
+                # Local DuckDB copy of the same cleaned rows for aggregate queries (see utils/analytics_mirror.py)
+                if ANALYTICS_MIRROR_ENABLED:
+                    try:
+                        build_mirror(df, ANALYTICS_MIRROR_PATH)
+                    except Exception as e:
+                        logger.error(f"Failed to build the analytics mirror; aggregates will run on Postgres: {e}")
+
                 # Reset statement timeout to default
                 connection.execute(text("SET statement_timeout = '120s';"))
                 logger.info("Reset statement_timeout to default (120 seconds).")
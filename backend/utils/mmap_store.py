@@ -0,0 +1,144 @@
+import json
+import mmap
+import os
+import sys
+from typing import Any, Dict, Iterator, Optional, Tuple, Union
+
+import faiss
+import numpy as np
+from langchain.docstore.document import Document
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.logger_config import logger
+
+DOCSTORE_FILE = "docstore.jsonl"
+DOCSTORE_OFFSETS_FILE = "docstore.offsets.npy"
+IDS_FILE = "ids.npy"
+VECTORS_FILE = "vectors.npy"
+MMAP_FILES = (DOCSTORE_FILE, DOCSTORE_OFFSETS_FILE, IDS_FILE, VECTORS_FILE)
+
+
+def write_mmap_files(folder: str, store: FAISS, vectors: np.ndarray, ids: np.ndarray) -> None:
+    """
+    Writes the serving files for a store into folder, all ordered by ascending FAISS ID:
+        ids.npy               int64 FAISS IDs
+        vectors.npy           float32 vectors (searched exactly for flat indexes)
+        docstore.jsonl        one {"id", "page_content", "metadata"} record per line
+        docstore.offsets.npy  byte offset of every line, plus the file size
+    """
+    order = np.argsort(ids)
+    ids, vectors = ids[order], np.ascontiguousarray(vectors[order], dtype=np.float32)
+    np.save(os.path.join(folder, IDS_FILE), ids)
+    np.save(os.path.join(folder, VECTORS_FILE), vectors)
+
+    offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+    with open(os.path.join(folder, DOCSTORE_FILE), "wb") as f:
+        for position, vector_id in enumerate(ids):
+            doc = store.docstore.search(store.index_to_docstore_id[int(vector_id)])
+            line = json.dumps({"id": int(vector_id), "page_content": doc.page_content, "metadata": doc.metadata}, ensure_ascii=False)
+            f.write(line.encode("utf-8") + b"\n")
+            offsets[position + 1] = f.tell()
+    np.save(os.path.join(folder, DOCSTORE_OFFSETS_FILE), offsets)
+
+
+def iter_docstore_records(folder: str) -> Iterator[Tuple[int, Document]]:
+    """Reads every (FAISS ID, Document) pair from docstore.jsonl (used for incremental updates)."""
+    with open(os.path.join(folder, DOCSTORE_FILE), encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            yield record["id"], Document(page_content=record["page_content"], metadata=record["metadata"])
+
+
+class JsonlDocstore(Docstore):
+    """
+    Read-only docstore over docstore.jsonl. Records are located by binary search over the
+    memory-mapped ID array and parsed only when a search result needs them.
+    """
+
+    def __init__(self, folder: str):
+        self._ids = np.load(os.path.join(folder, IDS_FILE), mmap_mode="r")
+        self._offsets = np.load(os.path.join(folder, DOCSTORE_OFFSETS_FILE), mmap_mode="r")
+        self._file = open(os.path.join(folder, DOCSTORE_FILE), "rb")
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if len(self._ids) else b""
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def search(self, search: Union[str, int]) -> Union[str, Document]:
+        vector_id = int(search)
+        position = int(np.searchsorted(self._ids, vector_id))
+        if position >= len(self._ids) or int(self._ids[position]) != vector_id:
+            return f"ID {search} not found."
+        record = json.loads(self._data[self._offsets[position]:self._offsets[position + 1]])
+        return Document(page_content=record["page_content"], metadata=record["metadata"])
+
+
+class MmapFlatIndex:
+    """
+    Exact L2 search over memory-mapped vectors.npy, exposing the subset of the FAISS index API
+    used by the LangChain FAISS wrapper (search, ntotal, d). Worker processes share the
+    vectors through the OS page cache instead of each holding a private copy.
+    """
+
+    def __init__(self, folder: str):
+        self._vectors = np.load(os.path.join(folder, VECTORS_FILE), mmap_mode="r")
+        self._ids = np.load(os.path.join(folder, IDS_FILE), mmap_mode="r")
+        self.ntotal, self.d = self._vectors.shape
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        labels = np.full((len(queries), k), -1, dtype=np.int64)
+        k_found = min(k, self.ntotal)
+        if k_found:
+            # faiss.knn runs FAISS's exhaustive L2 search directly on the mapped array (no copy).
+            found_distances, positions = faiss.knn(queries, self._vectors, k_found)
+            distances[:, :k_found] = found_distances
+            labels[:, :k_found] = np.where(positions >= 0, self._ids[positions.clip(0)], -1)
+        return distances, labels
+
+
+class _IdentityMapping(dict):
+    """index_to_docstore_id for JsonlDocstore: the FAISS label already is the docstore key."""
+
+    def __init__(self, size: int):
+        super().__init__()
+        self._size = size
+
+    def __getitem__(self, key: int) -> int:
+        return int(key)
+
+    def __len__(self) -> int:
+        return self._size
+
+
+def has_mmap_files(folder: str) -> bool:
+    return all(os.path.isfile(os.path.join(folder, name)) for name in MMAP_FILES)
+
+
+def load_mmap_vectorstore(folder: str, embeddings: Any, meta: Dict[str, Any],
+                          search_params: Optional[Dict[str, Any]] = None) -> FAISS:
+    """
+    Loads the vector store without unpickling and without copying vectors into process memory.
+
+    Flat indexes are searched straight from memory-mapped vectors.npy. IVF/IVF-PQ indexes are read
+    with IO_FLAG_MMAP so their inverted lists stay on disk pages shared between workers. HNSW graphs
+    cannot be memory-mapped by FAISS and are read into memory.
+    """
+    from backend.utils.vector_index import apply_search_params  # local import: vector_index imports this module
+
+    if meta["index_type"] == "flat":
+        index = MmapFlatIndex(folder)
+    else:
+        path = os.path.join(folder, meta["file"])
+        if meta["index_type"] in ("ivf", "ivfpq"):
+            index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        else:
+            logger.info(f"{meta['index_type']} indexes cannot be memory-mapped; reading {path} into memory.")
+            index = faiss.read_index(path)
+        apply_search_params(index, {**meta.get("params", {}), **{k: v for k, v in (search_params or {}).items() if v}})
+
+    docstore = JsonlDocstore(folder)
+    return FAISS(embeddings, index, docstore, _IdentityMapping(len(docstore)))
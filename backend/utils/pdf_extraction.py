@@ -0,0 +1,95 @@
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from typing import Iterator, List, Tuple
+
+import pdfplumber
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.config import PDF_EXTRACTION_WORKERS
+from backend.logger_config import logger
+
+
+def _extract_pages_pymupdf(pdf_path: str) -> List[str]:
+    with fitz.open(pdf_path) as pdf:
+        return [page.get_text() or "" for page in pdf]
+
+
+def _extract_pages_pdfplumber(pdf_path: str) -> List[str]:
+    with pdfplumber.open(pdf_path) as pdf:
+        return [page.extract_text() or "" for page in pdf.pages]
+
+
+def extract_pages_from_pdf(pdf_path: str) -> Tuple[List[str], str]:
+    """
+    Extract per-page text from a PDF file.
+
+    Uses PyMuPDF when it is installed (much faster), falling back to pdfplumber if PyMuPDF is
+    unavailable, fails, or finds no text. Returns (pages, backend_name).
+    """
+    if fitz is not None:
+        try:
+            pages = _extract_pages_pymupdf(pdf_path)
+            if any(page.strip() for page in pages):
+                return pages, "pymupdf"
+            logger.info(f"PyMuPDF found no text in {pdf_path}; trying pdfplumber.")
+        except Exception as e:
+            logger.warning(f"PyMuPDF failed for {pdf_path}: {e}. Trying pdfplumber.")
+
+    try:
+        pages = _extract_pages_pdfplumber(pdf_path)
+        if any(page.strip() for page in pages):
+            return pages, "pdfplumber"
+    except Exception as e:
+        logger.warning(f"pdfplumber failed for {pdf_path}: {e}.")
+
+    logger.warning(f"No text extracted from {pdf_path} after all attempts.")
+    return [], "none"
+
+
+def extract_text_from_pdf(pdf_path: str) -> str:
+    """Extract text from a PDF file (PyMuPDF, with pdfplumber as fallback)."""
+    logger.info(f"Extracting text from: {pdf_path}")
+    pages, _ = extract_pages_from_pdf(pdf_path)
+    return "\n".join(page for page in pages if page).strip()
+
+
+def _extract_file(file_path: str) -> Tuple[str, List[str], str, float]:
+    """Process-pool task: returns (filename, pages, backend, seconds)."""
+    start = time.perf_counter()
+    pages, backend = extract_pages_from_pdf(file_path)
+    return os.path.basename(file_path), pages, backend, time.perf_counter() - start
+
+
+def extract_pdfs_parallel(file_paths: List[str], max_workers: int = PDF_EXTRACTION_WORKERS) -> Iterator[Tuple[str, List[str]]]:
+    """
+    Extracts PDFs on a process pool (one task per document), yielding (filename, pages) as each
+    document finishes. At most two tasks per worker are in flight, so finished-but-unconsumed
+    results never pile up in memory. Per-file timings are logged, with the slowest files summarised at the end.
+    """
+    if not file_paths:
+        return
+    timings = []
+    workers = max(1, min(max_workers, len(file_paths)))
+    pending_paths = iter(file_paths)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = {pool.submit(_extract_file, path) for path in islice(pending_paths, workers * 2)}
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                filename, pages, backend, seconds = future.result()
+                timings.append((seconds, filename))
+                logger.info(f"Extracted {len(pages)} page(s) from {filename} with {backend} in {seconds:.2f}s.")
+                next_path = next(pending_paths, None)
+                if next_path is not None:
+                    in_flight.add(pool.submit(_extract_file, next_path))
+                yield filename, pages
+
+    slowest = ", ".join(f"{name} ({seconds:.2f}s)" for seconds, name in sorted(timings, reverse=True)[:3])
+    logger.info(f"Extracted {len(timings)} PDF(s) on {workers} worker process(es). Slowest: {slowest}")
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.logger_config import logger
+from backend.utils.streaming import FINAL_ANSWER_TAG
+
+PLAN_PROMPT = """You split a user's question into independent lookups that can run at the same time.
+
+Available tools:
+- DocumentPolicySearch: company policies, guidelines, procedures and codes of conduct in internal PDF documents.
+- SupplyChainDatabaseQuery: numbers, lists and calculations over the supply chain database (orders, sales, shipping, inventory).
+- ExternalWebSearch: current events, news and public information not held internally.
+
+Rules:
+- Output ONLY a JSON array, no other text. Each element is {{"tool": "<tool name>", "input": "<standalone question>"}}.
+- Each input must be answerable on its own: resolve references to the chat history into explicit wording.
+- Use one element per distinct lookup, at most {max_calls}. Do not add lookups the question does not need.
+- Do not split a question that a single lookup answers (e.g. one SQL query with several columns).
+- If the question cannot be answered with these tools, output [].
+
+Chat history:
+{chat_history}
+
+Question: {question}
+JSON:"""
+
+SYNTHESIS_PROMPT = """Answer the user's question using only the tool results below.
+Combine the results into one clear answer. If a result is an error or empty, say which part could not be answered.
+Briefly state which tool each part of the answer came from.
+
+Question: {question}
+
+Tool results:
+{results}
+
+Final Answer:"""
+
+# Wording that joins several asks; a question without any is not worth the planner's LLM call.
+MULTI_PART_MARKERS = re.compile(r"\b(and|also|as well as|plus|along with|compared?|versus|vs)\b|;|\?.*\S.*\?", re.IGNORECASE)
+
+
+@dataclass
+class PlannedCall:
+    tool: str
+    input: str
+
+
+class PlanAndExecute:
+    """
+    Plan-then-execute mode for questions that need several tools.
+
+    One LLM call plans independent tool calls, the calls run concurrently on a thread pool, and one more
+    LLM call combines their outputs. The tool stage takes as long as the slowest call rather than the sum
+    of all calls as in the sequential ReAct loop. Only questions with MULTI_PART_MARKERS are planned, and
+    only plans of at least min_calls independent calls are run: a single lookup gains nothing from running
+    in parallel and is better served by the agent. invoke() returns None in those cases, when the plan is
+    unusable, or when every call failed, so the caller can fall back to the agent.
+    """
+
+    def __init__(self, llm: Any, tools: List[Any], max_workers: int = 4, max_calls: int = 4, min_calls: int = 2):
+        self.llm = llm
+        self.tools = {tool.name: tool for tool in tools}
+        self.max_calls = max_calls
+        self.min_calls = min_calls
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool-call")
+
+    def plan(self, question: str, chat_history: str = "", callbacks: Optional[List[Any]] = None) -> List[PlannedCall]:
+        raw = self.llm.invoke(self._plan_prompt(question, chat_history), {"callbacks": callbacks}, temperature=0, cache_site="plan")
+        return self._parse_plan(raw)
+
+    async def aplan(self, question: str, chat_history: str = "", callbacks: Optional[List[Any]] = None) -> List[PlannedCall]:
+        raw = await self.llm.ainvoke(self._plan_prompt(question, chat_history), {"callbacks": callbacks}, temperature=0, cache_site="plan")
+        return self._parse_plan(raw)
+
+    @staticmethod
+    def looks_multi_part(question: str) -> bool:
+        return MULTI_PART_MARKERS.search(question) is not None
+
+    def _worth_running(self, question: str, calls: List[PlannedCall]) -> bool:
+        if len(calls) < self.min_calls:
+            logger.info(f"PlanAndExecute: plan for '{question}' has {len(calls)} call(s); deferring to the agent.")
+            return False
+        logger.info(f"PlanAndExecute plan for '{question}': {[(c.tool, c.input) for c in calls]}")
+        return True
+
+    def _plan_prompt(self, question: str, chat_history: str) -> str:
+        return PLAN_PROMPT.format(question=question, chat_history=chat_history or "(none)", max_calls=self.max_calls)
+
+    def _parse_plan(self, raw: str) -> List[PlannedCall]:
+        match = re.search(r"\[.*\]", raw, re.DOTALL)
+        if not match:
+            logger.warning(f"PlanAndExecute: planner returned no JSON array: {raw[:200]}")
+            return []
+        try:
+            items = json.loads(match.group(0))
+        except json.JSONDecodeError as e:
+            logger.warning(f"PlanAndExecute: could not parse plan ({e}): {raw[:200]}")
+            return []
+        calls = []
+        for item in items if isinstance(items, list) else []:
+            if isinstance(item, dict) and item.get("tool") in self.tools and str(item.get("input", "")).strip():
+                calls.append(PlannedCall(item["tool"], str(item["input"]).strip()))
+        return calls[:self.max_calls]
+
+    @staticmethod
+    def _tool_input(call: PlannedCall, inputs: Dict[str, Any]) -> Any:
+        """The planned call as tool input, with the caller's role, region and JWT claims."""
+        if call.tool == "DocumentPolicySearch":
+            return {"query": call.input, "user_role": inputs["user_role"], "user_region": inputs["user_region"]}
+        if call.tool == "SupplyChainDatabaseQuery":
+            return {"natural_language_query": call.input, "user_role": inputs["user_role"],
+                    "user_region": inputs["user_region"], "jwt_claims_for_db": inputs["jwt_claims_for_db"]}
+        return call.input
+
+    def _run_call(self, call: PlannedCall, inputs: Dict[str, Any], callbacks: Optional[List[Any]] = None) -> str:
+        try:
+            return self.tools[call.tool].run(self._tool_input(call, inputs), callbacks=callbacks)
+        except Exception as e:
+            logger.error(f"PlanAndExecute: {call.tool} failed for '{call.input}': {e}", exc_info=True)
+            return f"Error: {call.tool} failed: {e}"
+
+    async def _arun_call(self, call: PlannedCall, inputs: Dict[str, Any], callbacks: Optional[List[Any]] = None) -> str:
+        try:
+            return await self.tools[call.tool].arun(self._tool_input(call, inputs), callbacks=callbacks)
+        except Exception as e:
+            logger.error(f"PlanAndExecute: {call.tool} failed for '{call.input}': {e}", exc_info=True)
+            return f"Error: {call.tool} failed: {e}"
+
+    def _timed_call(self, call: PlannedCall, inputs: Dict[str, Any], callbacks: Optional[List[Any]] = None):
+        start = time.perf_counter()
+        output = self._run_call(call, inputs, callbacks)
+        return output, time.perf_counter() - start
+
+    async def _atimed_call(self, call: PlannedCall, inputs: Dict[str, Any], callbacks: Optional[List[Any]] = None):
+        start = time.perf_counter()
+        output = await self._arun_call(call, inputs, callbacks)
+        return output, time.perf_counter() - start
+
+    def invoke(self, inputs: Dict[str, Any], chat_history: str = "", callbacks: Optional[List[Any]] = None) -> Optional[Dict[str, Any]]:
+        """callbacks (LangChain handlers) see the plan call, each tool call, and the synthesis call tagged FINAL_ANSWER_TAG."""
+        question = inputs["input"]
+        if not self.looks_multi_part(question):
+            return None
+        calls = self.plan(question, chat_history, callbacks)
+        if not self._worth_running(question, calls):
+            return None
+
+        start = time.perf_counter()
+        results = list(self._pool.map(lambda call: self._timed_call(call, inputs, callbacks), calls))
+        synthesis_prompt = self._synthesis_prompt(question, calls, results, time.perf_counter() - start)
+        if synthesis_prompt is None:
+            return None
+        answer = self.llm.invoke(synthesis_prompt, self._synthesis_config(callbacks), cache_site="synthesis")
+        return self._result(answer, calls)
+
+    async def ainvoke(self, inputs: Dict[str, Any], chat_history: str = "", callbacks: Optional[List[Any]] = None) -> Optional[Dict[str, Any]]:
+        """Async invoke(): the planned calls run concurrently on the event loop instead of the thread pool."""
+        question = inputs["input"]
+        if not self.looks_multi_part(question):
+            return None
+        calls = await self.aplan(question, chat_history, callbacks)
+        if not self._worth_running(question, calls):
+            return None
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(self._atimed_call(call, inputs, callbacks) for call in calls))
+        synthesis_prompt = self._synthesis_prompt(question, calls, results, time.perf_counter() - start)
+        if synthesis_prompt is None:
+            return None
+        answer = await self.llm.ainvoke(synthesis_prompt, self._synthesis_config(callbacks), cache_site="synthesis")
+        return self._result(answer, calls)
+
+    @staticmethod
+    def _synthesis_config(callbacks: Optional[List[Any]]) -> Dict[str, Any]:
+        # The synthesis completion is the answer itself, so streaming handlers forward all of its tokens.
+        return {"callbacks": callbacks, "tags": [FINAL_ANSWER_TAG]}
+
+    def _synthesis_prompt(self, question: str, calls: List[PlannedCall], results: List[Tuple[str, float]], wall: float) -> Optional[str]:
+        """Logs the tool stage and builds the synthesis prompt, or returns None when every call failed."""
+        sequential = sum(seconds for _, seconds in results)
+        logger.info(f"PlanAndExecute ran {len(calls)} tool call(s) in {wall:.2f}s (sequential would be ~{sequential:.2f}s).")
+
+        if all(output.startswith("Error") for output, _ in results):
+            logger.warning("PlanAndExecute: every planned tool call failed; deferring to the agent.")
+            return None
+
+        formatted = "\n\n".join(
+            f"[{i}] {call.tool} — {call.input}\n{output}" for i, (call, (output, _)) in enumerate(zip(calls, results), 1)
+        )
+        return SYNTHESIS_PROMPT.format(question=question, results=formatted)
+
+    @staticmethod
+    def _result(answer: str, calls: List[PlannedCall]) -> Dict[str, Any]:
+        answer = answer.split("Final Answer:", 1)[-1].strip()
+        return {"output": answer, "tool_calls": [{"tool": c.tool, "input": c.input} for c in calls]}
@@ -0,0 +1,141 @@
+import json
+import math
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.agents import AgentAction
+from langchain_core.messages import BaseMessage, get_buffer_string
+from langchain_core.prompt_values import PromptValue
+from langchain_core.prompts import BasePromptTemplate
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.logger_config import logger
+
+# Prompt variables measured per agent iteration; everything else in the prompt is counted as "template".
+MEASURED_SECTIONS = ("chat_history", "jwt_claims_for_db", "input", "agent_scratchpad")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def compact_claims(jwt_payload: Dict[str, Any], keys: Sequence[str]) -> str:
+    """The JWT claims RLS reads, as compact JSON; token bookkeeping (iat, exp, jti, ...) stays out of the prompt."""
+    return json.dumps({key: jwt_payload[key] for key in keys if key in jwt_payload}, separators=(",", ":"))
+
+
+class PromptBudget:
+    """
+    Measures the ReAct prompt per section and keeps it within token budgets.
+
+    Token counts are estimated as characters / chars_per_token (no tokenizer for the Bedrock models is
+    available locally), which is close enough to track size and apply budgets.
+
+        history_tokens      chat history; older turns are summarized (question plus the answer's first
+                            sentence) and dropped oldest-first, the latest turn is kept verbatim
+        observation_tokens  each tool observation; SQL result rows are dropped from the end, other text is cut
+        total_tokens        whole prompt; when over, older observations are cut to a quarter of their budget,
+                            then the history to half of its budget
+
+    The agent built by agent_handler formats its prompt through assemble(), which logs the size of every
+    iteration so prompt growth over the ReAct loop can be followed in the logs.
+    """
+
+    def __init__(self, total_tokens: int = 4000, history_tokens: int = 600, observation_tokens: int = 600,
+                 chars_per_token: float = 3.5):
+        self.total_tokens = total_tokens
+        self.history_tokens = history_tokens
+        self.observation_tokens = observation_tokens
+        self.chars_per_token = chars_per_token
+
+    def count(self, text: str) -> int:
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def _clip(self, text: str, max_tokens: int) -> str:
+        max_chars = int(max_tokens * self.chars_per_token)
+        if len(text) <= max_chars:
+            return text
+        return f"{text[:max_chars].rstrip()} ... [{len(text) - max_chars} characters cut]"
+
+    def _clip_tail(self, text: str, max_tokens: int) -> str:
+        max_chars = int(max_tokens * self.chars_per_token)
+        return text if len(text) <= max_chars else f"[earlier history cut] ...{text[-max_chars:]}"
+
+    # --- Chat history ---
+    def _summarize_turn(self, question: BaseMessage, answer: BaseMessage) -> str:
+        first_sentence = _SENTENCE_END.split(str(answer.content).strip(), maxsplit=1)[0]
+        return f"Human: {self._clip(str(question.content), 40)}\nAI: {self._clip(first_sentence, 60)}"
+
+    def format_history(self, messages: List[BaseMessage]) -> str:
+        """Formats Human/AI message pairs for {chat_history}, summarizing older turns when over history_tokens."""
+        text = get_buffer_string(messages)
+        if self.count(text) <= self.history_tokens or len(messages) < 2:
+            return text
+        latest = get_buffer_string(messages[-2:])
+        latest = self._clip(latest, self.history_tokens // 2) if self.count(latest) > self.history_tokens // 2 else latest
+        summaries = [self._summarize_turn(messages[i], messages[i + 1]) for i in range(0, len(messages) - 2, 2)]
+        while summaries and self.count("\n".join(summaries)) + self.count(latest) > self.history_tokens:
+            summaries.pop(0)
+        compacted = "\n".join(["Earlier turns (summarized):", *summaries, latest]) if summaries else latest
+        logger.info(f"PromptBudget: chat history {self.count(text)} -> {self.count(compacted)} tokens "
+                    f"({len(messages) // 2} turns, {len(summaries)} summarized).")
+        return compacted
+
+    # --- Tool observations ---
+    def trim_observation(self, observation: str, max_tokens: Optional[int] = None) -> str:
+        """Fits one tool observation into max_tokens (default observation_tokens)."""
+        max_tokens = max_tokens or self.observation_tokens
+        if self.count(observation) <= max_tokens:
+            return observation
+        start = observation.find("[")
+        rows = None
+        if start >= 0:
+            try:
+                rows = json.loads(observation[start:])
+            except ValueError:
+                rows = None
+        if isinstance(rows, list):  # SupplyChainDatabaseQuery result: re-serialize compactly, then drop rows
+            head = observation[:start]
+            for kept in range(len(rows), 0, -1):
+                omitted = f" ({len(rows) - kept} more row(s) omitted)" if kept < len(rows) else ""
+                trimmed = f"{head}{json.dumps(rows[:kept], separators=(',', ':'), default=str)}{omitted}"
+                if self.count(trimmed) <= max_tokens:
+                    return trimmed
+        return self._clip(observation, max_tokens)
+
+    def format_scratchpad(self, intermediate_steps: List[Tuple[AgentAction, Any]], older_observation_tokens: Optional[int] = None) -> str:
+        """langchain's format_log_to_str, with every observation trimmed; older ones to older_observation_tokens if given."""
+        thoughts = ""
+        for index, (action, observation) in enumerate(intermediate_steps):
+            latest = index == len(intermediate_steps) - 1
+            limit = self.observation_tokens if latest or older_observation_tokens is None else older_observation_tokens
+            thoughts += action.log
+            thoughts += f"\nObservation: {self.trim_observation(str(observation), limit)}\nThought: "
+        return thoughts
+
+    # --- Whole prompt ---
+    def _measure(self, prompt: BasePromptTemplate, values: Dict[str, Any]) -> Tuple[PromptValue, Dict[str, int]]:
+        prompt_value = prompt.invoke(values)
+        sections = {name: self.count(str(values.get(name, ""))) for name in MEASURED_SECTIONS}
+        total = self.count(prompt_value.to_string())
+        return prompt_value, {"total": total, "template": max(total - sum(sections.values()), 0), **sections}
+
+    def assemble(self, prompt: BasePromptTemplate, inputs: Dict[str, Any]) -> PromptValue:
+        """Formats the agent prompt for one ReAct iteration within the budgets, and logs its size per section."""
+        steps = inputs.get("intermediate_steps", [])
+        values = {**inputs, "agent_scratchpad": self.format_scratchpad(steps)}
+        prompt_value, sizes = self._measure(prompt, values)
+        applied = []
+        if sizes["total"] > self.total_tokens and len(steps) > 1:
+            values["agent_scratchpad"] = self.format_scratchpad(steps, older_observation_tokens=max(self.observation_tokens // 4, 50))
+            prompt_value, sizes = self._measure(prompt, values)
+            applied.append("older observations cut")
+        if sizes["total"] > self.total_tokens and sizes["chat_history"] > self.history_tokens // 2:
+            values["chat_history"] = self._clip_tail(str(values.get("chat_history", "")), self.history_tokens // 2)
+            prompt_value, sizes = self._measure(prompt, values)
+            applied.append("history cut")
+        over = f", OVER budget {self.total_tokens}" if sizes["total"] > self.total_tokens else ""
+        logger.info(f"Agent prompt, iteration {len(steps) + 1}: ~{sizes['total']} tokens "
+                    f"(template {sizes['template']}, history {sizes['chat_history']}, claims {sizes['jwt_claims_for_db']}, "
+                    f"question {sizes['input']}, scratchpad {sizes['agent_scratchpad']}){over}"
+                    f"{'; ' + ', '.join(applied) if applied else ''}")
+        return prompt_value
@@ -0,0 +1,6 @@
+import re
+
+
+def normalize_query(query: str) -> str:
+    """Lower-cases and collapses whitespace/trailing punctuation so trivially different phrasings match exactly."""
+    return re.sub(r"\s+", " ", query.strip().lower()).rstrip(" ?.!")
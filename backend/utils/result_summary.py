@@ -0,0 +1,123 @@
+import datetime
+import decimal
+import json
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+# Window column added by counted_sql() (backend/utils/sql_guard.py); every row carries the result's total row count.
+TOTAL_ROWS_COLUMN = "_total_rows"
+# Sort column counted_sql() adds when the query's sort keys are not output columns; not shown in the observation.
+ROW_ORDER_COLUMN = "_row_order"
+_NUMERIC = (int, float, decimal.Decimal)
+_TEMPORAL = (datetime.date, datetime.time)
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def _format_value(value: Any) -> str:
+    if isinstance(value, (float, decimal.Decimal)):
+        value = float(value)
+        return f"{value:.2f}".rstrip("0").rstrip(".") if abs(value) >= 1 else f"{value:.4g}"
+    if isinstance(value, _TEMPORAL):
+        return value.isoformat()
+    return str(value)
+
+
+class ResultSummarizer:
+    """
+    Reads a counted_sql() result batch by batch and keeps only what the observation shows.
+
+        rows     the first display_limit rows, with their typed values (serialized only for the observation)
+        total    from the COUNT(*) OVER () column, so it is exact without reading every row
+        columns  min / max (and sum for numbers) per numeric or date column, over the first scan_limit rows;
+                 scan_limit 0 reads only the displayed rows; identifier columns (id, *_id) get no sum
+
+    Memory is bounded by display_limit plus one fetch batch, whatever the size of the result.
+    """
+
+    def __init__(self, column_names: Sequence[str], display_limit: int = 5, scan_limit: int = 1000, batch_size: int = 200):
+        self.column_names = list(column_names)
+        self.total_index = self.column_names.index(TOTAL_ROWS_COLUMN) if TOTAL_ROWS_COLUMN in self.column_names else None
+        self.value_columns = [i for i, name in enumerate(self.column_names) if i != self.total_index and name != ROW_ORDER_COLUMN]
+        self.display_limit = display_limit
+        self.scan_limit = max(scan_limit, display_limit)
+        self.batch_size = batch_size
+        self.rows: List[Dict[str, Any]] = []
+        self.scanned = 0
+        self.total: Optional[int] = None
+        self._exhausted = False
+        self._summaries: Dict[int, Dict[str, Any]] = {}
+        self._skipped: Set[int] = set()  # columns holding values that are neither numeric nor dates
+
+    def next_batch_size(self) -> int:
+        """Rows to fetch next; 0 when nothing more is needed."""
+        if self._exhausted:
+            return 0
+        wanted = self.scan_limit - self.scanned
+        if self.total is not None:
+            wanted = min(wanted, self.total - self.scanned)
+        return max(min(wanted, self.batch_size), 0)
+
+    def add(self, rows: Sequence[Sequence[Any]]) -> None:
+        if not rows:
+            self._exhausted = True
+            return
+        if self.total is None:
+            self.total = int(rows[0][self.total_index]) if self.total_index is not None else None
+        for row in rows:
+            if len(self.rows) < self.display_limit:
+                self.rows.append({self.column_names[i]: row[i] for i in self.value_columns})
+            for i in self.value_columns:
+                self._update(i, row[i])
+        self.scanned += len(rows)
+
+    def _update(self, index: int, value: Any) -> None:
+        if value is None or index in self._skipped:
+            return
+        numeric = isinstance(value, _NUMERIC) and not isinstance(value, bool)
+        if not numeric and not isinstance(value, _TEMPORAL):
+            self._skipped.add(index)
+            self._summaries.pop(index, None)
+            return
+        summary = self._summaries.get(index)
+        if summary is None:
+            name = self.column_names[index].lower()
+            summable = numeric and name != "id" and not name.endswith("_id")
+            self._summaries[index] = {"min": value, "max": value, "sum": value if summable else None}
+            return
+        try:
+            summary["min"] = min(summary["min"], value)
+            summary["max"] = max(summary["max"], value)
+            if summary["sum"] is not None:
+                summary["sum"] = summary["sum"] + value
+        except TypeError:  # mixed types in one column (e.g. a UNION of a number and a date)
+            self._skipped.add(index)
+            self._summaries.pop(index, None)
+
+    def _summary_text(self) -> str:
+        parts = []
+        for index, summary in self._summaries.items():
+            sum_text = f", sum {_format_value(summary['sum'])}" if summary["sum"] is not None else ""
+            parts.append(f"{self.column_names[index]} min {_format_value(summary['min'])}, max {_format_value(summary['max'])}{sum_text}")
+        if not parts or self.scanned <= 1:
+            return ""
+        total = self.total if self.total is not None else self.scanned
+        scope = f"all {self.scanned} rows" if self.scanned >= total else f"first {self.scanned} of {total} rows"
+        return f"Column summary ({scope}): {'; '.join(parts)}. "
+
+    def render(self, row_limit: Optional[int] = None) -> str:
+        """The observation text; row_limit is the LIMIT the cost guard enforced, if the result may have stopped at it."""
+        if not self.rows:
+            return "Query executed, but no data found matching your question and permissions."
+        num_rows = self.total if self.total is not None else self.scanned
+        summary = f"Query found {num_rows} record(s). "
+        if row_limit is not None and num_rows >= row_limit:
+            summary = f"Query found {num_rows} record(s) (stopped at the {row_limit}-row limit; there may be more, aggregate for totals). "
+        summary += self._summary_text()
+        summary += f"Showing first {len(self.rows)}: "
+        return f"Database query result: {summary}{json.dumps(self.rows, indent=2, default=_json_value)}"
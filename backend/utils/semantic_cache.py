@@ -0,0 +1,194 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.logger_config import logger
+from backend.utils.query_text import normalize_query
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    source_names: List[str]
+
+
+@dataclass
+class _Entry:
+    partition: Tuple[str, ...]
+    query_key: str
+    vector: np.ndarray  # unit-normalized query embedding
+    value: CachedAnswer
+    created_at: float
+
+
+class SemanticAnswerCache:
+    """
+    In-memory cache of DocumentQATool answers, looked up by embedding similarity.
+
+    Entries are partitioned (the tool uses the role and the region its query augmentation applies),
+    so an answer is only ever returned to callers that would have sent the same effective query.
+    A lookup first tries an exact match on the normalized query text (no embedding call), then the
+    nearest cached query in the partition by cosine similarity. Entries expire after ttl_seconds,
+    the least recently used entry is evicted beyond max_entries. Answers belong to build_id, the FAISS
+    index build the retriever actually loaded (not whatever index_meta.json on disk names since);
+    set_index_build() clears them when the served index is swapped.
+    """
+
+    def __init__(self, embeddings: Any, build_id: Optional[str] = None, similarity_threshold: float = 0.95,
+                 ttl_seconds: float = 3600, max_entries: int = 1000):
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._exact: Dict[Tuple[Tuple[str, ...], str], int] = {}
+        self._next_id = 0
+        self._build_id = build_id
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def set_index_build(self, build_id: Optional[str]) -> None:
+        """Call after the retriever starts serving another index build; answers from the previous one are dropped."""
+        with self._lock:
+            if build_id == self._build_id:
+                return
+            if self._entries:
+                logger.info(f"SemanticAnswerCache: FAISS index build changed ({self._build_id} -> {build_id}); dropping {len(self._entries)} cached answer(s).")
+                self.invalidations += 1
+            self._clear()
+            self._build_id = build_id
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        self._exact.clear()
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        if self._exact.get((entry.partition, entry.query_key)) == entry_id:
+            del self._exact[(entry.partition, entry.query_key)]
+
+    @staticmethod
+    def _unit(vector: Any) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def _embed(self, query: str) -> np.ndarray:
+        return self._unit(self.embeddings.embed_query(query))
+
+    async def _aembed(self, query: str) -> np.ndarray:
+        return self._unit(await self.embeddings.aembed_query(query))
+
+    def _fresh(self, entry_id: int, now: float) -> bool:
+        if now - self._entries[entry_id].created_at <= self.ttl_seconds:
+            return True
+        self._remove(entry_id)
+        self.expirations += 1
+        return False
+
+    def lookup(self, partition: Tuple[str, ...], query: str) -> Tuple[Optional[CachedAnswer], Optional[np.ndarray]]:
+        """
+        Returns (cached answer or None, query embedding or None). On a miss, pass the embedding back
+        to store() so the query is not embedded twice.
+        """
+        cached, has_partition = self._lookup_exact(partition, query)
+        if cached is not None or not has_partition:
+            return cached, None
+        vector = self._embed(query)
+        return self._lookup_nearest(partition, query, vector), vector
+
+    async def alookup(self, partition: Tuple[str, ...], query: str) -> Tuple[Optional[CachedAnswer], Optional[np.ndarray]]:
+        """Async lookup(); the query is embedded with aembed_query."""
+        cached, has_partition = self._lookup_exact(partition, query)
+        if cached is not None or not has_partition:
+            return cached, None
+        vector = await self._aembed(query)
+        return self._lookup_nearest(partition, query, vector), vector
+
+    def _lookup_exact(self, partition: Tuple[str, ...], query: str) -> Tuple[Optional[CachedAnswer], bool]:
+        """Returns (exact-match answer or None, whether the partition has other entries worth embedding for)."""
+        query_key = normalize_query(query)
+        with self._lock:
+            now = time.time()
+            entry_id = self._exact.get((partition, query_key))
+            if entry_id is not None and self._fresh(entry_id, now):
+                self._entries.move_to_end(entry_id)
+                self.exact_hits += 1
+                return self._entries[entry_id].value, True
+            if any(entry.partition == partition for entry in self._entries.values()):
+                return None, True
+            self.misses += 1
+            return None, False
+
+    def _lookup_nearest(self, partition: Tuple[str, ...], query: str, vector: np.ndarray) -> Optional[CachedAnswer]:
+        with self._lock:
+            now = time.time()
+            candidates = [entry_id for entry_id, entry in list(self._entries.items())
+                          if entry.partition == partition and self._fresh(entry_id, now)]
+            if candidates:
+                similarities = np.stack([self._entries[i].vector for i in candidates]) @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    entry_id = candidates[best]
+                    self._entries.move_to_end(entry_id)
+                    self.semantic_hits += 1
+                    logger.info(f"SemanticAnswerCache hit (similarity {similarities[best]:.3f}): '{query}' ~ '{self._entries[entry_id].query_key}'")
+                    return self._entries[entry_id].value
+            self.misses += 1
+            return None
+
+    def store(self, partition: Tuple[str, ...], query: str, value: CachedAnswer, vector: Optional[np.ndarray] = None) -> None:
+        if vector is None:
+            vector = self._embed(query)
+        self._insert(partition, query, value, vector)
+
+    async def astore(self, partition: Tuple[str, ...], query: str, value: CachedAnswer, vector: Optional[np.ndarray] = None) -> None:
+        if vector is None:
+            vector = await self._aembed(query)
+        self._insert(partition, query, value, vector)
+
+    def _insert(self, partition: Tuple[str, ...], query: str, value: CachedAnswer, vector: np.ndarray) -> None:
+        with self._lock:
+            query_key = normalize_query(query)
+            previous = self._exact.get((partition, query_key))
+            if previous is not None:
+                self._remove(previous)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _Entry(partition, query_key, vector, value, time.time())
+            self._exact[(partition, query_key)] = entry_id
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, float]:
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "index_build": self._build_id,
+        }
+
+    def log_stats(self) -> None:
+        stats = self.stats()
+        logger.info(f"SemanticAnswerCache stats: {stats['exact_hits']} exact and {stats['semantic_hits']} semantic hit(s), "
+                    f"{stats['misses']} miss(es), hit rate {stats['hit_rate']:.1%}, {stats['entries']} entries.")
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.logger_config import logger
+from backend.utils.query_text import normalize_query
+
+
+class TextToSQLCache:
+    """
+    SQLite-backed cache of LLM-generated SQL, shared by all worker processes.
+
+    The key combines the normalized question, the role's allowed tables and columns, and a fingerprint
+    of the schema string sent to the LLM, so a permission or schema change never reuses old SQL.
+    The stored SQL is the LLM output before the per-request region filter is applied. Callers store
+    SQL only after it executed successfully and discard an entry whose SQL later fails.
+    """
+
+    def __init__(self, sqlite_path: str):
+        self.sqlite_path = sqlite_path
+        os.makedirs(os.path.dirname(os.path.abspath(sqlite_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(sqlite_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS text_to_sql (key TEXT PRIMARY KEY, question TEXT NOT NULL, sql TEXT NOT NULL, "
+            "created_at REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(question: str, allowed_tables: Iterable[str], allowed_columns: Iterable[str], schema_str: str) -> str:
+        material = json.dumps({
+            "question": normalize_query(question),
+            "tables": sorted(allowed_tables or []),
+            "columns": sorted(allowed_columns or []),
+            "schema": hashlib.sha256(schema_str.encode("utf-8")).hexdigest(),
+        }, sort_keys=True)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT sql FROM text_to_sql WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE text_to_sql SET hits = hits + 1 WHERE key = ?", (key,))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, question: str, sql: str) -> None:
+        """Stores SQL that has been executed successfully."""
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO text_to_sql (key, question, sql, created_at) VALUES (?, ?, ?, ?)",
+                             (key, question, sql, time.time()))
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM text_to_sql WHERE key = ?", (key,))
+
+    def invalidate(self) -> int:
+        """Drops every cached query (e.g. after load_db.py recreates the tables). Returns the number removed."""
+        with self._lock:
+            removed = self._db.execute("DELETE FROM text_to_sql").rowcount
+        logger.info(f"TextToSQLCache: invalidated {removed} cached quer{'y' if removed == 1 else 'ies'} in {self.sqlite_path}.")
+        return removed
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM text_to_sql").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+        }
@@ -0,0 +1,310 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.dialects.postgres import Postgres
+from sqlglot.errors import SqlglotError
+from sqlglot.optimizer.scope import Scope, traverse_scope
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.logger_config import logger
+from backend.config import ROLES_PERMISSIONS
+from backend.utils.result_summary import ROW_ORDER_COLUMN, TOTAL_ROWS_COLUMN
+
+REGION_PARAM = "user_region_param"
+REGION_COLUMN = "order_country"
+
+# Statement types that write, lock or change session state; rejected anywhere in the tree (e.g. in a CTE).
+_FORBIDDEN_NODES = (exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Create, exp.Drop, exp.Alter, exp.TruncateTable,
+                    exp.Command, exp.Into, exp.Lock, exp.Set, exp.Placeholder, exp.Parameter)
+# sqlglot types the standard SQL functions; any other call must be one of these. This keeps out functions with
+# side effects or that run SQL of their own (set_config, pg_sleep, query_to_xml, dblink, lo_import, ...).
+ALLOWED_UNTYPED_FUNCTIONS = {
+    "date_part", "age", "justify_days", "justify_hours", "justify_interval", "make_date", "make_interval",
+    "to_date", "to_timestamp", "to_number", "split_part", "btrim", "ltrim", "rtrim", "lpad", "rpad", "replace",
+    "position", "strpos", "left", "right", "reverse", "regexp_replace", "regexp_matches", "char_length",
+    "mode", "percent_rank", "cume_dist", "dense_rank", "rank", "ntile", "row_number", "lag", "lead",
+    "first_value", "last_value", "nth_value", "width_bucket", "trunc", "div", "mod", "sign", "cbrt",
+}
+
+
+class SQLGuardError(ValueError):
+    """Generated SQL that is not a single read-only query over the role's tables and columns."""
+
+
+class _BindParamPostgres(Postgres):
+    """Postgres output with `:name` placeholders, the style SQLAlchemy text() binds."""
+
+    class Generator(Postgres.Generator):
+        def placeholder_sql(self, expression: exp.Placeholder) -> str:
+            return f":{expression.name}"
+
+
+def is_aggregate(query: exp.Expression) -> bool:
+    """True if the outermost SELECT groups or aggregates (window functions do not count)."""
+    if not isinstance(query, exp.Select):
+        return False
+    if query.args.get("group"):
+        return True
+    return any(function.find_ancestor(exp.Select, exp.Window) is query
+               for projection in query.expressions for function in projection.find_all(exp.AggFunc))
+
+
+def _apply_limit(query: exp.Query, row_limit: int) -> None:
+    existing = query.args.get("limit")
+    value = existing.expression if isinstance(existing, exp.Limit) else None
+    if isinstance(value, exp.Literal) and not value.is_string and int(value.this) <= row_limit:
+        return
+    query.limit(row_limit, copy=False)
+
+
+def limit_sql(sql: str, row_limit: int) -> str:
+    """Adds (or lowers) the outermost LIMIT of SQL the guard produced, e.g. when its plan estimates too many rows."""
+    query = sqlglot.parse_one(sql, read="postgres")
+    _apply_limit(query, row_limit)
+    return query.sql(dialect=_BindParamPostgres)
+
+
+def _outer_sort_keys(query: exp.Query) -> Optional[List[exp.Ordered]]:
+    """The query's ORDER BY on its output columns (by position), or None if a key is not an output column."""
+    projections = query.selects
+    star = any(projection.is_star for projection in projections)
+    keys = []
+    for ordered in query.args["order"].expressions:
+        key, position = ordered.this, None
+        if isinstance(key, exp.Literal) and key.is_int:
+            position = int(key.name)
+        else:
+            for index, projection in enumerate(projections, 1):
+                if projection == key or projection.unalias() == key or (
+                        isinstance(key, exp.Column) and not key.table and projection.alias_or_name == key.name):
+                    position = index
+                    break
+        if position is None or star:  # behind a `*`, output positions are not known without the schema
+            return None
+        outer = ordered.copy()
+        outer.set("this", exp.Literal.number(position))
+        keys.append(outer)
+    return keys
+
+
+def _window_order(query: exp.Select) -> Optional[exp.Order]:
+    """The query's ORDER BY with output aliases and positions replaced by their expressions, for OVER (...)."""
+    order = query.args["order"].copy()
+    aliases = {projection.alias: projection.this for projection in query.selects if isinstance(projection, exp.Alias)}
+    for ordered in order.expressions:
+        key = ordered.this
+        if isinstance(key, exp.Literal) and key.is_int:
+            position = int(key.name)
+            if not 0 < position <= len(query.selects) or any(p.is_star for p in query.selects[:position]):
+                return None
+            ordered.set("this", query.selects[position - 1].unalias().copy())
+        elif isinstance(key, exp.Column) and not key.table and key.name in aliases:
+            ordered.set("this", aliases[key.name].copy())
+    return order
+
+
+def counted_sql(sql: str) -> str:
+    """
+    Wraps a query so each row also carries COUNT(*) OVER (), the total number of rows the query returns.
+
+    A subquery's ORDER BY does not order the wrapper's rows (DuckDB's parallel scan reorders them), so a
+    top-level ORDER BY is repeated outside on the matching output positions. When a sort key is not an
+    output column (e.g. ORDER BY created_at LIMIT 5 without selecting it), the query gets
+    `ROW_NUMBER() OVER (ORDER BY ...) AS _row_order` and the wrapper sorts on that instead.
+    """
+    inner, order = sql, ""
+    try:
+        query = sqlglot.parse_one(sql, read="postgres")
+    except SqlglotError:
+        query = None
+    if isinstance(query, exp.Query) and query.args.get("order"):
+        keys = _outer_sort_keys(query)
+        if keys is None and isinstance(query, exp.Select) and not query.args.get("distinct"):
+            window_order = _window_order(query)
+            if window_order is not None:
+                query.select(exp.alias_(exp.Window(this=exp.RowNumber(), order=window_order), ROW_ORDER_COLUMN), copy=False)
+                inner, keys = query.sql(dialect=_BindParamPostgres), [exp.Ordered(this=exp.column(ROW_ORDER_COLUMN))]
+        if keys:
+            order = " ORDER BY " + ", ".join(key.sql(dialect=_BindParamPostgres) for key in keys)
+    return f"SELECT *, COUNT(*) OVER () AS {TOTAL_ROWS_COLUMN} FROM ({inner}) AS _result{order}"
+
+
+class SQLGuard:
+    """
+    Parses LLM-generated SQL with sqlglot and rewrites it before execution.
+
+        read-only   exactly one SELECT / UNION / INTERSECT / EXCEPT; no DML (also not in CTEs), SELECT INTO,
+                    FOR UPDATE, bind parameters, or functions outside the typed set and ALLOWED_UNTYPED_FUNCTIONS
+        tables      every base-table reference (CTE references are resolved by scope) must be in the role's
+                    allowed_tables, unqualified or in the public schema
+        columns     every column must be in the role's allowed_columns, or resolve to an output column of a
+                    CTE / derived table; `*` only as COUNT(*) or over CTEs / derived tables
+        region      for roles without global_access, every base-table reference becomes
+                    `(SELECT * FROM t WHERE LOWER(order_country) = LOWER(:user_region_param)) AS t`, so the
+                    filter holds in joins, subqueries, CTEs and set operations
+        row limit   if row_limit is given, a query without aggregation gets `LIMIT row_limit` (an existing
+                    larger or non-literal LIMIT is lowered to it)
+
+    Results, including rejections, are kept in an LRU keyed by (SQL, role, filtered, row_limit); the region
+    itself is a bind parameter, so one entry serves every region.
+    """
+
+    def __init__(self, roles_permissions: Optional[Dict[str, Any]] = None, max_entries: int = 1024):
+        self.roles_permissions = roles_permissions or ROLES_PERMISSIONS
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._plans: "OrderedDict[Tuple[str, str, bool, Optional[int]], Tuple[bool, str]]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "rejected": 0}
+
+    def rewrite(self, sql: str, user_role: str, user_region: Optional[str],
+                row_limit: Optional[int] = None) -> Tuple[str, Dict[str, Any]]:
+        """Returns (SQL to execute, bind params); raises SQLGuardError if the SQL may not run for this role."""
+        permissions = self.roles_permissions.get(user_role)
+        if permissions is None:
+            raise SQLGuardError(f"Role '{user_role}' is not configured for database access")
+        filtered = not permissions.get("global_access") and bool(user_region)
+        key = (sql, user_role, filtered, row_limit)
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                self._stats["hits"] += 1
+        if plan is None:
+            try:
+                plan = (True, self._plan(sql, permissions, filtered, row_limit))
+            except SQLGuardError as e:
+                plan = (False, str(e))
+            with self._lock:
+                self._stats["misses"] += 1
+                self._plans[key] = plan
+                while len(self._plans) > self.max_entries:
+                    self._plans.popitem(last=False)
+        ok, result = plan
+        if not ok:
+            with self._lock:
+                self._stats["rejected"] += 1
+            logger.warning(f"SQLGuard rejected SQL for role '{user_role}': {result}. SQL: {sql}")
+            raise SQLGuardError(result)
+        return result, ({REGION_PARAM: user_region} if filtered else {})
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"plans": len(self._plans), "max_entries": self.max_entries, **self._stats}
+
+    # --- Parsing and validation ---
+    def _plan(self, sql: str, permissions: Dict[str, Any], filtered: bool, row_limit: Optional[int]) -> str:
+        try:
+            statements = [statement for statement in sqlglot.parse(sql, read="postgres") if statement is not None]
+        except SqlglotError as e:
+            raise SQLGuardError(f"SQL could not be parsed: {str(e).splitlines()[0]}")
+        if len(statements) != 1:
+            raise SQLGuardError("Exactly one SQL statement is allowed")
+        tree = statements[0]
+        if not isinstance(tree, (exp.Select, exp.SetOperation)):
+            raise SQLGuardError(f"Only SELECT queries are allowed, not {tree.key.upper()}")
+        forbidden = next(tree.find_all(*_FORBIDDEN_NODES), None)
+        if forbidden is not None or tree.find(exp.Select) is None:
+            raise SQLGuardError(f"Only read-only queries are allowed ({(forbidden or tree).key.upper()} found)")
+        for function in tree.find_all(exp.Anonymous):
+            if function.name.lower() not in ALLOWED_UNTYPED_FUNCTIONS:
+                raise SQLGuardError(f"Function '{function.name}' is not allowed")
+
+        try:
+            scopes = traverse_scope(tree)
+        except SqlglotError as e:
+            raise SQLGuardError(f"SQL could not be analyzed: {e}")
+        base_tables = self._base_tables(tree, scopes)
+        allowed_tables = {table.lower() for table in permissions.get("allowed_tables", [])}
+        for table in base_tables:
+            if not isinstance(table.this, exp.Identifier) or table.catalog or table.db.lower() not in ("", "public"):
+                raise SQLGuardError(f"Unsupported table reference '{table.sql()}'")
+            if table.name.lower() not in allowed_tables:
+                raise SQLGuardError(f"Table '{table.name}' is not allowed for this role")
+        self._check_columns(tree, scopes, {column.lower() for column in permissions.get("allowed_columns", [])})
+
+        if filtered:
+            for table in base_tables:
+                self._filter_region(table)
+        if row_limit and not is_aggregate(tree):
+            _apply_limit(tree, row_limit)
+        return tree.sql(dialect=_BindParamPostgres)
+
+    @staticmethod
+    def _base_tables(tree: exp.Expression, scopes: List[Scope]) -> List[exp.Table]:
+        """Table nodes that read a database table, i.e. do not name a CTE visible in their scope."""
+        cte_references: Set[int] = set()
+        for scope in scopes:
+            for table in scope.tables:
+                if isinstance(scope.sources.get(table.alias_or_name), Scope):
+                    cte_references.add(id(table))
+        return [table for table in tree.find_all(exp.Table) if id(table) not in cte_references]
+
+    @staticmethod
+    def _derived_columns(source: Any) -> Set[str]:
+        if isinstance(source, Scope) and isinstance(source.expression, exp.Query):
+            return {name.lower() for name in source.expression.named_selects}
+        return set()
+
+    @staticmethod
+    def _select_aliases(query: exp.Expression) -> Dict[str, exp.Expression]:
+        if not isinstance(query, exp.Select):
+            return {}
+        return {projection.alias.lower(): projection.this for projection in query.expressions if isinstance(projection, exp.Alias)}
+
+    def _check_columns(self, tree: exp.Expression, scopes: List[Scope], allowed_columns: Set[str]) -> None:
+        checked: Set[int] = set()
+        allowed_stars: Set[int] = set()
+        for scope in scopes:
+            sources = {name: source for name, (_, source) in scope.selected_sources.items()}
+            aliases = self._select_aliases(scope.expression)
+            for column in scope.columns:
+                checked.add(id(column))
+                name = column.name.lower()
+                if name in allowed_columns or isinstance(column.this, exp.Star):
+                    continue
+                if isinstance(column.parent, exp.Group) and not column.table and name in aliases:
+                    # Postgres resolves GROUP BY names to input columns first; group by the aliased expression instead
+                    column.replace(aliases[name].copy())
+                    continue
+                candidates = [sources.get(column.table)] if column.table else list(sources.values())
+                if not any(name in self._derived_columns(source) for source in candidates):
+                    raise SQLGuardError(f"Column '{column.name}' is not allowed for this role")
+            if isinstance(scope.expression, exp.Select):
+                for projection in scope.expression.expressions:
+                    if isinstance(projection, exp.Star):
+                        star_sources = list(sources.values())
+                    elif isinstance(projection, exp.Column) and isinstance(projection.this, exp.Star):
+                        star_sources = [sources.get(projection.table)]
+                    else:
+                        continue
+                    if star_sources and all(isinstance(source, Scope) for source in star_sources):
+                        allowed_stars.add(id(projection))
+
+        for star in tree.find_all(exp.Star):
+            node = star.parent if isinstance(star.parent, exp.Column) else star
+            if isinstance(node.parent, exp.Count) or id(node) in allowed_stars:
+                continue
+            raise SQLGuardError("SELECT * is not allowed on tables; list the columns (COUNT(*) is fine)")
+
+        for column in tree.find_all(exp.Column):
+            if id(column) in checked or isinstance(column.this, exp.Star) or column.name.lower() in allowed_columns:
+                continue
+            # Columns outside scope.columns are ORDER BY references to the query's own output names.
+            select = column.find_ancestor(exp.Select)
+            output_key = isinstance(column.parent, exp.Ordered) and not column.table
+            if not (output_key and select is not None and column.name.lower() in {n.lower() for n in select.named_selects}):
+                raise SQLGuardError(f"Column '{column.name}' is not allowed for this role")
+
+    @staticmethod
+    def _filter_region(table: exp.Table) -> None:
+        base = table.copy()
+        base.set("alias", None)
+        region_filter = exp.EQ(this=exp.Lower(this=exp.column(REGION_COLUMN)),
+                               expression=exp.Lower(this=exp.Placeholder(this=REGION_PARAM)))
+        alias = table.args.get("alias") or exp.TableAlias(this=exp.to_identifier(table.name))
+        table.replace(exp.Subquery(this=exp.select("*").from_(base).where(region_filter), alias=alias.copy()))
@@ -0,0 +1,111 @@
+import json
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.logger_config import logger
+
+FINAL_ANSWER_MARKER = "Final Answer:"
+# Tag for LLM calls whose whole completion is the answer (plan-then-execute synthesis), not a ReAct step.
+FINAL_ANSWER_TAG = "final_answer"
+# Tool arguments that carry the question; the other arguments (role, region, JWT claims) are never sent to the client.
+_QUERY_ARGUMENTS = ("query", "natural_language_query")
+_MAX_INPUT_CHARS = 200
+
+Event = Tuple[str, Dict[str, Any]]
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Serializes one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class AgentEventStream(BaseCallbackHandler):
+    """
+    LangChain callback handler that turns agent progress into (event, data) pairs for /query/stream.
+
+    Events: "tool_start" (tool name and question), "tool_end" (tool name, seconds, error flag) and
+    "token" (answer text as the LLM produces it). For ReAct steps only the text after "Final Answer:"
+    is sent, so thoughts and tool inputs stay server-side; LLM calls tagged FINAL_ANSWER_TAG are sent
+    whole. Tokens arrive only when BedrockLLM streaming is on; otherwise the answer comes in one piece
+    with the endpoint's final event.
+
+    `send` is called with each event. The handler runs inline (on the event loop for async runs, on
+    the calling thread for sync runs), so `send` must be thread-safe where tools run on a pool.
+    """
+
+    run_inline = True
+
+    def __init__(self, send: Callable[[Event], None]):
+        self.send = send
+        self._tools: Dict[UUID, Tuple[str, float]] = {}
+        self._llm_runs: Dict[UUID, Dict[str, Any]] = {}
+
+    def emit(self, event: str, **data: Any) -> None:
+        try:
+            self.send((event, data))
+        except Exception as e:  # A closed client must not fail the agent run
+            logger.warning(f"AgentEventStream could not send '{event}': {e}")
+
+    @staticmethod
+    def _tool_question(inputs: Any, input_str: str) -> str:
+        if isinstance(inputs, str):
+            try:
+                inputs = json.loads(inputs)
+            except json.JSONDecodeError:
+                return inputs[:_MAX_INPUT_CHARS]
+        if isinstance(inputs, dict):
+            for key in _QUERY_ARGUMENTS:
+                if key in inputs:
+                    return str(inputs[key])[:_MAX_INPUT_CHARS]
+            return ""
+        return input_str[:_MAX_INPUT_CHARS]
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID,
+                      inputs: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        name = (serialized or {}).get("name", "tool")
+        self._tools[run_id] = (name, time.perf_counter())
+        self.emit("tool_start", tool=name, input=self._tool_question(inputs if inputs is not None else input_str, input_str))
+
+    def _tool_finished(self, run_id: UUID, error: bool) -> None:
+        name, start = self._tools.pop(run_id, ("tool", time.perf_counter()))
+        self.emit("tool_end", tool=name, seconds=round(time.perf_counter() - start, 3), error=error)
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._tool_finished(run_id, error=False)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._tool_finished(run_id, error=True)
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: Any, *, run_id: UUID, tags: Optional[list] = None,
+                     **kwargs: Any) -> None:
+        self._llm_runs[run_id] = {"text": "", "whole": FINAL_ANSWER_TAG in (tags or []), "answer_start": None, "sent": 0}
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        state = self._llm_runs.get(run_id)
+        if state is None:
+            return
+        state["text"] += token
+        if state["answer_start"] is None:
+            index = state["text"].find(FINAL_ANSWER_MARKER)
+            if index >= 0:
+                state["answer_start"] = index + len(FINAL_ANSWER_MARKER)
+            elif state["whole"] and not FINAL_ANSWER_MARKER.startswith(state["text"].lstrip()):
+                state["answer_start"] = 0  # A tagged completion is the answer, unless it repeats the marker first
+            else:
+                return
+        answer = state["text"][state["answer_start"]:].lstrip()
+        if len(answer) > state["sent"]:
+            self.emit("token", text=answer[state["sent"]:])
+            state["sent"] = len(answer)
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._llm_runs.pop(run_id, None)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._llm_runs.pop(run_id, None)
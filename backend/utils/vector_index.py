@@ -0,0 +1,270 @@
+import hashlib
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain.docstore.document import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.logger_config import logger
+from backend.utils.mmap_store import MMAP_FILES, DOCSTORE_FILE, write_mmap_files, iter_docstore_records
+
+INDEX_NAME = "index"
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 2  # v2: chunks are split page by page and carry a "page" number
+META_FILE = "index_meta.json"
+ANN_INDEX_FILE = "index_ann.faiss"
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+CURRENT_FILE = "CURRENT"  # names the build directory that is served
+BUILD_DIR_PREFIX = "build-"
+LEGACY_FILES = (f"{INDEX_NAME}.faiss", f"{INDEX_NAME}.pkl", *MMAP_FILES, META_FILE, MANIFEST_FILE, ANN_INDEX_FILE)
+
+
+def file_sha256(path: str) -> str:
+    """Returns the hex sha256 of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def new_manifest(model_id: str, chunk_size: int, chunk_overlap: int) -> Dict[str, Any]:
+    """
+    Manifest of what the index contains:
+        files:   {filename: {"sha256": <content hash>, "ids": [<faiss int64 ids of its chunks>]}}
+        next_id: next unused FAISS id
+    Embedding model and chunking settings are recorded so a change forces a full rebuild.
+    """
+    return {
+        "version": MANIFEST_VERSION,
+        "model_id": model_id,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "next_id": 0,
+        "files": {},
+    }
+
+
+def current_index_dir(embeddings_dir: str) -> str:
+    """
+    The directory of the served build: the build-<id> directory named in CURRENT, or embeddings_dir itself
+    for indexes saved before builds were versioned. Resolve once and read every file of a load from the
+    result, so a concurrent save cannot mix two builds.
+    """
+    try:
+        with open(os.path.join(embeddings_dir, CURRENT_FILE)) as f:
+            name = f.read().strip()
+    except OSError:
+        return embeddings_dir
+    return os.path.join(embeddings_dir, name) if name else embeddings_dir
+
+
+def load_manifest(embeddings_dir: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(current_index_dir(embeddings_dir), MANIFEST_FILE)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+        if manifest.get("version") != MANIFEST_VERSION:
+            logger.warning(f"Index manifest version {manifest.get('version')} is not supported; a full rebuild is required.")
+            return None
+        return manifest
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Could not read index manifest {path}: {e}. A full rebuild is required.")
+        return None
+
+
+def create_id_mapped_store(embeddings: Any, dimension: int) -> FAISS:
+    """Creates an empty FAISS store whose vectors are addressed by explicit int64 IDs (IndexIDMap2)."""
+    index = faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+    return FAISS(embeddings, index, InMemoryDocstore(), {})
+
+
+def load_id_mapped_store(embeddings_dir: str, embeddings: Any) -> FAISS:
+    """
+    Loads a store previously written by save_store_atomically into memory for incremental updates.
+    The docstore is rebuilt from docstore.jsonl; stores that only have a pickled docstore need a full rebuild.
+    """
+    embeddings_dir = current_index_dir(embeddings_dir)
+    if not os.path.isfile(os.path.join(embeddings_dir, DOCSTORE_FILE)):
+        raise ValueError(f"{DOCSTORE_FILE} not found (index predates the JSON-lines docstore); a full rebuild is required.")
+    index = faiss.read_index(os.path.join(embeddings_dir, f"{INDEX_NAME}.faiss"))
+    if not isinstance(index, faiss.IndexIDMap):
+        raise ValueError("Existing FAISS index is not ID-mapped; a full rebuild is required.")
+    records = {str(vector_id): doc for vector_id, doc in iter_docstore_records(embeddings_dir)}
+    if len(records) != index.ntotal:
+        raise ValueError(f"{DOCSTORE_FILE} has {len(records)} records for {index.ntotal} vectors; a full rebuild is required.")
+    return FAISS(embeddings, index, InMemoryDocstore(records), {int(key): key for key in records})
+
+
+def add_documents_with_ids(store: FAISS, documents: List[Document], vectors: List[List[float]], ids: List[int]) -> None:
+    """Adds documents under explicit FAISS IDs; the docstore ID is the string form of the FAISS ID."""
+    if not documents:
+        return
+    store.index.add_with_ids(np.asarray(vectors, dtype=np.float32), np.asarray(ids, dtype=np.int64))
+    store.docstore.add({str(vector_id): doc for vector_id, doc in zip(ids, documents)})
+    store.index_to_docstore_id.update({vector_id: str(vector_id) for vector_id in ids})
+
+
+def remove_ids(store: FAISS, ids: List[int]) -> int:
+    """Removes vectors (and their docstore records) by FAISS ID. Returns the number removed."""
+    if not ids:
+        return 0
+    removed = store.index.remove_ids(np.asarray(ids, dtype=np.int64))
+    store.docstore.delete([str(vector_id) for vector_id in ids if vector_id in store.index_to_docstore_id])
+    for vector_id in ids:
+        store.index_to_docstore_id.pop(vector_id, None)
+    return int(removed)
+
+
+def get_vectors_and_ids(store: FAISS) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns (vectors, ids) held by an ID-mapped flat store."""
+    flat = faiss.downcast_index(store.index.index)
+    vectors = flat.reconstruct_n(0, flat.ntotal) if flat.ntotal else np.zeros((0, flat.d), dtype=np.float32)
+    return vectors, faiss.vector_to_array(store.index.id_map)
+
+
+def build_ann_index(vectors: np.ndarray, ids: np.ndarray, index_type: str, options: Optional[Dict[str, Any]] = None) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Builds (and trains, where needed) an approximate-nearest-neighbour index over vectors, keyed by ids.
+
+    index_type is one of "ivf" (IVF-Flat), "hnsw" (HNSW-Flat) or "ivfpq" (IVF with product quantization).
+    Unset options get defaults sized from the number of vectors. Returns (index, params) where params
+    holds the build and search settings to record in the index metadata.
+    """
+    options = {k: v for k, v in (options or {}).items() if v is not None}
+    count, dimension = vectors.shape
+    params: Dict[str, Any] = {}
+
+    if index_type in ("ivf", "ivfpq"):
+        # FAISS wants roughly 39 training points per list; 4*sqrt(n) lists is the usual starting point.
+        nlist = options.get("nlist") or max(1, min(int(4 * math.sqrt(count)), count // 39 or 1))
+        quantizer = faiss.IndexFlatL2(dimension)
+        if index_type == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        else:
+            pq_m = options.get("pq_m") or next(m for m in (64, 48, 32, 16, 8, 4, 2, 1) if dimension % m == 0)
+            pq_bits = options.get("pq_bits") or max(1, min(8, int(math.log2(max(count, 2))) - 1))
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m, pq_bits)
+            params.update({"pq_m": pq_m, "pq_bits": pq_bits})
+        index.train(vectors)
+        index.add_with_ids(vectors, ids)
+        index.nprobe = min(nlist, options.get("nprobe") or max(1, nlist // 8))
+        params.update({"nlist": nlist, "nprobe": index.nprobe})
+    elif index_type == "hnsw":
+        hnsw_m = options.get("hnsw_m") or 32
+        base = faiss.IndexHNSWFlat(dimension, hnsw_m)
+        base.hnsw.efConstruction = options.get("ef_construction") or 200
+        base.hnsw.efSearch = options.get("ef_search") or 64
+        index = faiss.IndexIDMap2(base)
+        index.add_with_ids(vectors, ids)
+        params.update({"hnsw_m": hnsw_m, "ef_construction": base.hnsw.efConstruction, "ef_search": base.hnsw.efSearch})
+    else:
+        raise ValueError(f"Unsupported ANN index type '{index_type}'. Expected one of {INDEX_TYPES[1:]}.")
+    return index, params
+
+
+def apply_search_params(index: Any, params: Dict[str, Any]) -> None:
+    """
+    Applies nprobe (IVF) / efSearch (HNSW) search settings to a loaded index. A setting the index type has
+    no use for (FAISS_NPROBE on an HNSW index, FAISS_EF_SEARCH on an IVF one) is ignored.
+    """
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    ivf = faiss.try_extract_index_ivf(base)
+    if params.get("nprobe") and ivf is not None:
+        ivf.nprobe = int(params["nprobe"])
+    if params.get("ef_search") and hasattr(base, "hnsw"):
+        base.hnsw.efSearch = int(params["ef_search"])
+
+
+def load_serving_index(embeddings_dir: str, meta: Dict[str, Any], search_overrides: Optional[Dict[str, Any]] = None) -> Any:
+    """Reads the index file named in meta and applies its recorded search parameters (overrides win)."""
+    index = faiss.read_index(os.path.join(embeddings_dir, meta["file"]))
+    params = {**meta.get("params", {}), **{k: v for k, v in (search_overrides or {}).items() if v}}
+    apply_search_params(index, params)
+    return index
+
+
+def load_index_meta(embeddings_dir: str) -> Dict[str, Any]:
+    """Reads index_meta.json; indexes built before it existed are plain flat indexes."""
+    path = os.path.join(embeddings_dir, META_FILE)
+    if not os.path.isfile(path):
+        return {"index_type": "flat", "file": f"{INDEX_NAME}.faiss", "params": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_store_atomically(store: FAISS, manifest: Dict[str, Any], embeddings_dir: str,
+                          index_type: str = "flat", ann_options: Optional[Dict[str, Any]] = None,
+                          pending: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Writes the index, docstore, index metadata and manifest into a new build-<build_id> directory, then
+    points CURRENT at it with one os.replace. Readers that resolve current_index_dir() see either the
+    previous build or the new one, never a mix, and a crash before the swap leaves the previous build
+    served. The previous build is kept for processes that resolved it just before the swap; older builds
+    and leftovers of interrupted saves are removed. Files of the unversioned layout are left in place (the
+    repository tracks them) and only reported as superseded. One process saves at a time.
+
+    The ID-mapped flat index is always written (it is what incremental updates modify), together with
+    the memory-mappable vector/ID arrays and JSON-lines docstore served by mmap_store (nothing is pickled).
+    For an ANN index_type, an ANN index is also built from its vectors into index_ann.faiss, and
+    index_meta.json tells the loader which file to serve with which search parameters. pending
+    ({"index_type", "options"}) records the index a checkpoint was written on the way to, so a resumed
+    run builds that type instead of keeping the checkpoint's flat index.
+    """
+    os.makedirs(embeddings_dir, exist_ok=True)
+    previous_dir = current_index_dir(embeddings_dir)
+    build_id = uuid.uuid4().hex
+    build_name = f"{BUILD_DIR_PREFIX}{build_id}"
+    tmp_dir = tempfile.mkdtemp(prefix=".index-", dir=embeddings_dir)
+    try:
+        faiss.write_index(store.index, os.path.join(tmp_dir, f"{INDEX_NAME}.faiss"))
+        vectors, ids = get_vectors_and_ids(store)
+        write_mmap_files(tmp_dir, store, vectors, ids)
+
+        meta = {"index_type": "flat", "file": f"{INDEX_NAME}.faiss", "params": {}}
+        if index_type != "flat":
+            start = time.perf_counter()
+            ann_index, params = build_ann_index(vectors, ids, index_type, ann_options)
+            faiss.write_index(ann_index, os.path.join(tmp_dir, ANN_INDEX_FILE))
+            meta = {"index_type": index_type, "file": ANN_INDEX_FILE, "params": params}
+            logger.info(f"Built {index_type} index over {len(ids)} vectors in {time.perf_counter() - start:.2f}s with {params}.")
+        meta.update({"build_id": build_id, "ntotal": int(store.index.ntotal), "dimension": int(store.index.d)})
+        if pending:
+            meta["pending"] = pending
+        with open(os.path.join(tmp_dir, META_FILE), "w") as f:
+            json.dump(meta, f, indent=2, sort_keys=True)
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+
+        os.rename(tmp_dir, os.path.join(embeddings_dir, build_name))
+        pointer_tmp = os.path.join(embeddings_dir, f"{CURRENT_FILE}.tmp")
+        with open(pointer_tmp, "w") as f:
+            f.write(build_name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer_tmp, os.path.join(embeddings_dir, CURRENT_FILE))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    keep = {build_name, os.path.basename(previous_dir)}
+    for name in os.listdir(embeddings_dir):
+        if (name.startswith(BUILD_DIR_PREFIX) and name not in keep) or name.startswith(".index-"):
+            shutil.rmtree(os.path.join(embeddings_dir, name), ignore_errors=True)  # older builds and leftovers of interrupted saves
+    if previous_dir == embeddings_dir:
+        legacy = [name for name in LEGACY_FILES if os.path.exists(os.path.join(embeddings_dir, name))]
+        if legacy:
+            logger.info(f"Index build {build_name} supersedes the unversioned index files in {embeddings_dir} "
+                        f"({', '.join(legacy)}); they are no longer read and are left in place.")